@@ -4,16 +4,31 @@ import uuid
 import atexit
 import signal
 import logging
-import threading
 from datetime import timedelta
 
-from flask import Flask, jsonify, request, g
+from flask import Flask, Response, jsonify, request, g
 
 from config import (
     SECRET_KEY, PERMANENT_SESSION_LIFETIME, MAX_CONTENT_LENGTH,
-    LOG_LEVEL,
+    LOG_LEVEL, MAINTENANCE_ENABLED, SQL_TRACE, METRICS_ENABLED, METRICS_TOKEN,
+    RECURRENCE_MODE,
+)
+from database import (
+    init_db, get_db, get_db_direct, backup_db, pool_stats, shard_stats, close_pool,
+    writer_stats, stop_writer,
+)
+from db_trace import (
+    begin_request as begin_sql_trace, end_request as end_sql_trace, check_budget,
+)
+import metrics
+from profiler import start_request_profile, write_profile
+from maintenance import start_scheduler, stop_scheduler, scheduler_stats
+from regex_sandbox import regex_pool_stats, close_regex_pool
+from suggest import suggest_stats
+from intervals import conflict_cache_stats
+from stream import (
+    start_stream_server, stop_stream_server, stream_stats, stream_url, stream_origin,
 )
-from database import init_db, get_db, get_db_direct, optimize_db, backup_db
 from routes import register_blueprints
 from storage import get_storage
 
@@ -37,7 +52,9 @@ if os.environ.get("FLASK_ENV") == "production" or os.environ.get("HTTPS") == "1"
 get_storage()
 
 init_db()
-optimize_db()
+if MAINTENANCE_ENABLED:
+    start_scheduler()
+start_stream_server(app)
 
 register_blueprints(app)
 
@@ -63,13 +80,21 @@ _STATIC_VERSION = _compute_static_version()
 
 @app.context_processor
 def inject_static_version():
-    return {"static_v": _STATIC_VERSION}
+    return {
+        "static_v": _STATIC_VERSION,
+        "recurrence_mode": RECURRENCE_MODE,
+        "stream_url": stream_url(request.scheme, request.host),
+    }
 
 
 @app.before_request
 def before_request():
     g.request_id = request.headers.get("X-Request-ID", uuid.uuid4().hex[:12])
     g.request_start = time.monotonic()
+    begin_sql_trace(g.request_id)
+    metrics.gauge_add("planner_http_requests_in_flight", 1)
+    g.metrics_in_flight = True
+    g.profile = start_request_profile(request.headers)
 
     if request.method in ("POST", "PUT", "DELETE") and request.path.startswith("/api/"):
         if request.method in ("POST", "PUT") and request.content_length:
@@ -92,11 +117,21 @@ def before_request():
             return jsonify({"error": "非法请求来源"}), 403
 
 
+@app.teardown_request
+def finish_request(exc):
+    if g.pop("metrics_in_flight", False):
+        metrics.gauge_add("planner_http_requests_in_flight", -1)
+    sampler = g.pop("profile", None)
+    if sampler is not None:
+        write_profile(sampler, request.endpoint or "unmatched", g.get("request_id"))
+
+
 @app.teardown_appcontext
 def close_db(exc):
-    conn = g.pop("db", None)
-    if conn is not None:
-        conn.close()
+    for key in ("db", "user_db"):
+        conn = g.pop(key, None)
+        if conn is not None:
+            conn.close()
 
 
 @app.after_request
@@ -109,28 +144,56 @@ def add_security_headers(resp):
     if request.path.startswith("/static/"):
         resp.headers["Cache-Control"] = "public, max-age=2592000"
     if resp.content_type and "text/html" in resp.content_type:
+        connect_src = " ".join(filter(None, ("'self'", stream_origin(request.scheme, request.host))))
         resp.headers["Content-Security-Policy"] = (
             "default-src 'self'; "
             "script-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
             "style-src 'self' 'unsafe-inline' https://cdn.jsdelivr.net; "
             "font-src 'self' https://cdn.jsdelivr.net; "
             "img-src 'self' data: blob:; "
-            "connect-src 'self'; "
+            f"connect-src {connect_src}; "
             "frame-ancestors 'self'"
         )
     rid = g.get("request_id")
     if rid:
         resp.headers["X-Request-ID"] = rid
 
+    sql = end_sql_trace()
+    if sql is not None and SQL_TRACE:
+        resp.headers["Server-Timing"] = f'db;dur={sql.total_ms};desc="{sql.count} queries"'
+
+    elapsed_s = time.monotonic() - g.get("request_start", time.monotonic())
+    metrics.record_request(
+        request.blueprint or "app", request.endpoint or "unmatched", request.method,
+        resp.status_code, elapsed_s, resp.content_length, sql,
+    )
+
     if request.path.startswith("/api/"):
-        elapsed = round((time.monotonic() - g.get("request_start", 0)) * 1000, 1)
+        elapsed = round(elapsed_s * 1000, 1)
         log_level = logging.WARNING if resp.status_code >= 400 else logging.DEBUG
-        logger.log(log_level, "%s %s %s %sms uid=%s",
+        sql_count, sql_ms = (sql.count, sql.total_ms) if sql is not None else (0, 0.0)
+        logger.log(log_level, "%s %s %s %sms uid=%s sql=%d/%.1fms",
                    request.method, request.path, resp.status_code, elapsed,
-                   g.get("user_id", "-"))
+                   g.get("user_id", "-"), sql_count, sql_ms)
+        if SQL_TRACE and sql is not None and sql.count:
+            logger.info("SQL rid=%s %s %s: %d 条语句, 共 %.1fms, 最慢: %s",
+                        sql.request_id, request.method, request.path,
+                        sql.count, sql.total_ms, sql.slowest())
+
+    view = app.view_functions.get(request.endpoint)
+    check_budget(sql, request.endpoint, getattr(view, "query_budget", None))
     return resp
 
 
+@app.route("/metrics")
+def metrics_endpoint():
+    if not METRICS_ENABLED:
+        return jsonify({"error": "资源不存在"}), 404
+    if METRICS_TOKEN and request.headers.get("Authorization") != f"Bearer {METRICS_TOKEN}":
+        return jsonify({"error": "未授权"}), 401
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
 try:
     from flask_limiter import Limiter
     from flask_limiter.util import get_remote_address
@@ -150,42 +213,28 @@ try:
         view = app.view_functions.get(rule)
         if view:
             limiter.limit(limit)(view)
+    limiter.exempt(metrics_endpoint)
 except ImportError:
     logger.warning("flask-limiter 未安装，速率限制已禁用")
 
 
-_maintenance = {"requests": 0, "last_backup": 0}
-_maintenance_lock = threading.Lock()
-
-
-@app.before_request
-def periodic_maintenance():
-    with _maintenance_lock:
-        _maintenance["requests"] += 1
-        do_optimize = _maintenance["requests"] % 500 == 0
-        now = time.monotonic()
-        do_backup = now - _maintenance["last_backup"] > 86400
-        if do_backup:
-            _maintenance["last_backup"] = now
-    if do_optimize:
-        try:
-            optimize_db()
-        except Exception:
-            pass
-    if do_backup:
-        try:
-            backup_db()
-        except Exception:
-            pass
-
-
 @app.route("/health")
 def health_check():
     try:
         conn = get_db_direct()
         conn.execute("SELECT 1")
         conn.close()
-        return jsonify({"status": "ok"})
+        return jsonify({
+            "status": "ok",
+            "db_pool": pool_stats(),
+            "db_shards": shard_stats(),
+            "maintenance": scheduler_stats(),
+            "db_writer": writer_stats(),
+            "regex_pool": regex_pool_stats(),
+            "suggest": suggest_stats(),
+            "event_conflicts": conflict_cache_stats(),
+            "stream": stream_stats(),
+        })
     except Exception as e:
         logger.error("健康检查失败: %s", e)
         return jsonify({"status": "error", "message": "database unavailable"}), 503
@@ -209,15 +258,22 @@ def request_entity_too_large(e):
 
 @app.errorhandler(429)
 def rate_limit_exceeded(e):
+    metrics.inc("planner_http_rate_limited_total", endpoint=request.endpoint or "unmatched")
     return jsonify({"error": "请求过于频繁，请稍后再试"}), 429
 
 
 def _graceful_shutdown(*_args):
     logger.info("正在关闭服务...")
+    stop_scheduler()
+    stop_stream_server()
+    stop_writer()
     try:
         backup_db()
     except Exception:
         pass
+    close_pool()
+    close_regex_pool()
+    metrics.shutdown()
     logger.info("服务已关闭")
 
 atexit.register(_graceful_shutdown)
@@ -0,0 +1,214 @@
+"""
+archive — cold-storage tier for old events and timer records.
+
+Rows dated more than ARCHIVE_AFTER_DAYS ago move from events / timer_records
+into events_archive / timer_records_archive in the same database (the
+user's shard when sharding is on).  daily_summaries always holds the per-day
+totals of the archived rows, so statistics add those instead of scanning
+old rows, and archive_state records each user's boundary day.
+
+Queries over the current week only ever touch the hot tables.  Read paths
+that span history build their FROM clause with events_source() /
+timer_source(), which union in the archive only when the requested range
+reaches back past the boundary.  Editing an archived row first moves it
+back with thaw_events() / thaw_timer_records().
+"""
+
+import logging
+from datetime import datetime
+
+from config import ARCHIVE_AFTER_DAYS, DB_SHARDING
+from database import get_db_direct, for_each_shard, epoch_day
+
+logger = logging.getLogger(__name__)
+
+EVENT_COLUMNS = (
+    "id", "user_id", "title", "description", "date", "start_time", "end_time",
+    "color", "category", "priority", "completed", "col_type", "recur_rule",
+    "recur_parent_id", "created_at", "updated_at",
+)
+TIMER_COLUMNS = (
+    "id", "user_id", "task_name", "planned_minutes", "actual_seconds", "date",
+    "completed", "created_at",
+)
+_EVENT_COLS = ", ".join(EVENT_COLUMNS)
+_TIMER_COLS = ", ".join(TIMER_COLUMNS)
+
+
+def archive_boundary(conn, user_id):
+    """Return the day_num before which *user_id* may have archived rows, or None."""
+    row = conn.execute(
+        "SELECT archived_before FROM archive_state WHERE user_id=?", (user_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _reaches_archive(conn, user_id, start):
+    boundary = archive_boundary(conn, user_id)
+    if boundary is None:
+        return False
+    return start is None or epoch_day(start) < boundary
+
+
+def events_source(conn, user_id, start=None):
+    """FROM-clause for *user_id*'s events from *start* (YYYY-MM-DD, None = all history)."""
+    if not _reaches_archive(conn, user_id, start):
+        return "events"
+    cols = _EVENT_COLS + ", day_num, start_min, end_min"
+    return f"(SELECT {cols} FROM events UNION ALL SELECT {cols} FROM events_archive)"
+
+
+def timer_source(conn, user_id, start=None):
+    """FROM-clause for *user_id*'s timer records from *start* (None = all history)."""
+    if not _reaches_archive(conn, user_id, start):
+        return "timer_records"
+    cols = _TIMER_COLS + ", day_num"
+    return f"(SELECT {cols} FROM timer_records UNION ALL SELECT {cols} FROM timer_records_archive)"
+
+
+def _rebuild_summaries(conn, user_id, day_nums):
+    """Recompute daily_summaries for *day_nums* from the archive tables."""
+    day_nums = sorted(set(day_nums))
+    if not day_nums:
+        return
+    marks = ",".join("?" * len(day_nums))
+    conn.execute(
+        f"DELETE FROM daily_summaries WHERE user_id=? AND day_num IN ({marks})",
+        (user_id, *day_nums),
+    )
+    conn.execute(
+        f"""INSERT INTO daily_summaries
+               (user_id, day_num, date, events, completed_events, event_minutes,
+                timer_count, timer_completed, focus_seconds, focus_minutes)
+            SELECT ?, day_num, MIN(date), SUM(events), SUM(completed_events),
+                   SUM(event_minutes), SUM(timer_count), SUM(timer_completed),
+                   SUM(focus_seconds), SUM(focus_minutes)
+            FROM (
+                SELECT day_num, date, COUNT(*) AS events,
+                       SUM(completed = 1) AS completed_events,
+                       SUM(end_min - start_min) AS event_minutes,
+                       0 AS timer_count, 0 AS timer_completed,
+                       0 AS focus_seconds, 0 AS focus_minutes
+                FROM events_archive
+                WHERE user_id=? AND col_type='actual' AND day_num IN ({marks})
+                GROUP BY day_num
+                UNION ALL
+                SELECT day_num, date, 0, 0, 0, COUNT(*), SUM(completed = 1),
+                       SUM(actual_seconds),
+                       SUM(CAST(ROUND(actual_seconds / 60.0) AS INTEGER))
+                FROM timer_records_archive
+                WHERE user_id=? AND day_num IN ({marks})
+                GROUP BY day_num
+            )
+            GROUP BY day_num""",
+        (user_id, user_id, *day_nums, user_id, *day_nums),
+    )
+
+
+def archive_user(conn, user_id, before_day):
+    """Move *user_id*'s rows dated before *before_day* into the archive.
+
+    Recurring parents stay hot since expansion reads them.  Runs inside the
+    caller's transaction; returns (events moved, timer records moved).
+    """
+    event_filter = "user_id=? AND day_num < ? AND recur_rule IS NULL"
+    timer_filter = "user_id=? AND day_num < ?"
+    params = (user_id, before_day)
+    days = [r[0] for r in conn.execute(
+        f"""SELECT day_num FROM events WHERE {event_filter}
+            UNION SELECT day_num FROM timer_records WHERE {timer_filter}""",
+        params + params,
+    )]
+
+    moved_events = conn.execute(
+        f"INSERT INTO events_archive ({_EVENT_COLS}) "
+        f"SELECT {_EVENT_COLS} FROM events WHERE {event_filter}",
+        params,
+    ).rowcount
+    conn.execute(f"DELETE FROM events WHERE {event_filter}", params)
+    moved_timer = conn.execute(
+        f"INSERT INTO timer_records_archive ({_TIMER_COLS}) "
+        f"SELECT {_TIMER_COLS} FROM timer_records WHERE {timer_filter}",
+        params,
+    ).rowcount
+    conn.execute(f"DELETE FROM timer_records WHERE {timer_filter}", params)
+
+    _rebuild_summaries(conn, user_id, days)
+    conn.execute(
+        """INSERT INTO archive_state (user_id, archived_before) VALUES (?, ?)
+           ON CONFLICT(user_id) DO UPDATE SET
+               archived_before = MAX(archived_before, excluded.archived_before),
+               updated_at = datetime('now','localtime')""",
+        (user_id, before_day),
+    )
+    return moved_events, moved_timer
+
+
+def _thaw(conn, user_id, ids, table, cols):
+    ids = [int(i) for i in ids]
+    if not ids:
+        return 0
+    marks = ",".join("?" * len(ids))
+    where = f"user_id=? AND id IN ({marks})"
+    days = [r[0] for r in conn.execute(
+        f"SELECT day_num FROM {table}_archive WHERE {where}", (user_id, *ids)
+    )]
+    if not days:
+        return 0
+    conn.execute(
+        f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {table}_archive WHERE {where}",
+        (user_id, *ids),
+    )
+    conn.execute(f"DELETE FROM {table}_archive WHERE {where}", (user_id, *ids))
+    _rebuild_summaries(conn, user_id, days)
+    return len(days)
+
+
+def thaw_events(conn, user_id, ids):
+    """Move archived events back to the hot table so they can be edited."""
+    return _thaw(conn, user_id, ids, "events", _EVENT_COLS)
+
+
+def thaw_timer_records(conn, user_id, ids):
+    """Move archived timer records back to the hot table."""
+    return _thaw(conn, user_id, ids, "timer_records", _TIMER_COLS)
+
+
+def _users_with_old_rows(conn, before_day):
+    return [r[0] for r in conn.execute(
+        """SELECT user_id FROM events WHERE day_num < ? AND recur_rule IS NULL
+           UNION SELECT user_id FROM timer_records WHERE day_num < ?""",
+        (before_day, before_day),
+    ) if r[0] is not None]
+
+
+def run_archive(days=ARCHIVE_AFTER_DAYS):
+    """Archive everything older than *days* for every user; returns rows moved."""
+    if days <= 0:
+        return 0
+    before_day = epoch_day(datetime.now()) - days
+    moved = 0
+
+    if DB_SHARDING:
+        def _archive_shard(conn):
+            user_ids = _users_with_old_rows(conn, before_day)
+            return sum(sum(archive_user(conn, uid, before_day)) for uid in user_ids)
+
+        moved += sum(for_each_shard(_archive_shard))
+
+    conn = get_db_direct()
+    try:
+        # One short transaction per user keeps the write lock brief.
+        for user_id in _users_with_old_rows(conn, before_day):
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                moved += sum(archive_user(conn, user_id, before_day))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        conn.close()
+
+    logger.info("归档完成: 移动 %d 条记录", moved)
+    return moved
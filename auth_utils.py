@@ -3,7 +3,6 @@ import secrets
 import smtplib
 import string
 import logging
-import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from functools import wraps
@@ -21,7 +20,7 @@ from config import (
     VERIFICATION_CODE_EXPIRY,
     RESET_SESSION_EXPIRY,
 )
-from database import get_db
+from database import get_db, run_write
 
 logger = logging.getLogger(__name__)
 
@@ -40,33 +39,6 @@ def validate_date(date_str):
         return False
 
 
-def run_regex_with_timeout(pattern, items, get_text_fns, timeout=3.0):
-    """Apply a compiled regex to *items* with a timeout to prevent ReDoS.
-
-    get_text_fns: list of callables that extract a text field from one item.
-    Returns (matched_items, error_message).  On timeout, matched_items is None.
-    """
-    results = []
-    stop_event = threading.Event()
-
-    def _filter():
-        for item in items:
-            if stop_event.is_set():
-                break
-            for get_text in get_text_fns:
-                if pattern.search(get_text(item) or ""):
-                    results.append(item)
-                    break
-
-    t = threading.Thread(target=_filter, daemon=True)
-    t.start()
-    t.join(timeout)
-    if t.is_alive():
-        stop_event.set()
-        return None, "正则表达式执行超时，请简化搜索模式"
-    return results, None
-
-
 def validate_password(password):
     if not password or len(password) < 8:
         return False, "密码长度至少为 8 位"
@@ -145,26 +117,27 @@ def send_verification_email(email, code):
 
 
 def store_verification_code(email, code, code_type="reset_password"):
-    conn = get_db()
     expires_at = (
         datetime.now() + timedelta(seconds=VERIFICATION_CODE_EXPIRY)
     ).strftime("%Y-%m-%d %H:%M:%S")
-    conn.execute(
-        "UPDATE verification_codes SET used=1 WHERE email=? AND type=? AND used=0",
-        (email, code_type),
-    )
-    conn.execute(
-        "INSERT INTO verification_codes (email, code, type, expires_at) VALUES (?, ?, ?, ?)",
-        (email, code, code_type, expires_at),
-    )
-    _cleanup_expired_codes(conn)
-    conn.commit()
+
+    def _store(conn):
+        conn.execute(
+            "UPDATE verification_codes SET used=1 WHERE email=? AND type=? AND used=0",
+            (email, code_type),
+        )
+        conn.execute(
+            "INSERT INTO verification_codes (email, code, type, expires_at) VALUES (?, ?, ?, ?)",
+            (email, code, code_type, expires_at),
+        )
+        _cleanup_expired_codes(conn)
+
+    run_write(_store)
 
 
 def verify_code(email, code, code_type="reset_password"):
-    conn = get_db()
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    conn.execute(
+    affected = run_write(lambda conn: conn.execute(
         """UPDATE verification_codes SET used=1
            WHERE id = (
                SELECT id FROM verification_codes
@@ -172,9 +145,7 @@ def verify_code(email, code, code_type="reset_password"):
                ORDER BY created_at DESC LIMIT 1
            )""",
         (email, code, code_type, now),
-    )
-    affected = conn.execute("SELECT changes()").fetchone()[0]
-    conn.commit()
+    ).rowcount)
     return affected > 0
 
 
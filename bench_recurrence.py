@@ -0,0 +1,123 @@
+"""
+bench_recurrence — compare the rrule engine with the old day-by-day loop.
+
+    python bench_recurrence.py [--repeat N]
+
+For each legacy rule and a few typical views (a week next to the series
+start, a month and a year further out) both implementations expand the same
+range; the results are checked for equality and the time per expansion is
+printed.  A second table times RRULE-only rules that the old loop cannot
+express.  The old loop stopped after 366 days (daily/weekly) or 366
+months (monthly), so ranges are kept within that window.
+"""
+
+import sys
+import time
+import argparse
+import calendar
+from datetime import date, datetime, timedelta
+
+from rrule import compile_rule
+
+BASE = date(2024, 1, 31)
+
+VIEWS = (
+    ("week at start", BASE, BASE + timedelta(days=6)),
+    ("month +300d", BASE + timedelta(days=300), BASE + timedelta(days=330)),
+    ("year", BASE, BASE + timedelta(days=364)),
+)
+
+RRULES = (
+    "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE,FR",
+    "FREQ=MONTHLY;BYDAY=-1FR;COUNT=24",
+    "FREQ=MONTHLY;BYMONTHDAY=1,15,-1",
+    "FREQ=DAILY;INTERVAL=3;UNTIL=20291231",
+    "FREQ=YEARLY",
+)
+
+
+def legacy_expand(rule, base_date, start_dt, end_dt):
+    """The previous routes/events._expand_recur, kept verbatim for comparison."""
+    dates = []
+
+    if rule == "monthly":
+        d = base_date
+        for _ in range(366):
+            if d.month == 12:
+                next_year, next_mon = d.year + 1, 1
+            else:
+                next_year, next_mon = d.year, d.month + 1
+            max_day = calendar.monthrange(next_year, next_mon)[1]
+            d = d.replace(year=next_year, month=next_mon,
+                          day=min(base_date.day, max_day))
+            if d > end_dt:
+                break
+            if d >= start_dt:
+                dates.append(d)
+        return dates
+
+    d = base_date + timedelta(days=1)
+    count = 0
+    while d <= end_dt and count < 366:
+        if d >= start_dt:
+            if rule == "daily":
+                dates.append(d)
+            elif rule == "weekdays":
+                if d.weekday() < 5:
+                    dates.append(d)
+            elif rule == "weekly":
+                if d.weekday() == base_date.weekday():
+                    dates.append(d)
+        d += timedelta(days=1)
+        count += 1
+
+    return dates
+
+
+def _per_call(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def _as_datetime(d):
+    return datetime(d.year, d.month, d.day)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="周期规则展开性能对比")
+    parser.add_argument("--repeat", type=int, default=2000, help="每项测量的重复次数")
+    args = parser.parse_args(argv)
+
+    print(f"{'rule':<10} {'view':<14} {'n':>4} {'legacy µs':>10} {'rrule µs':>10} {'speedup':>8}")
+    mismatches = 0
+    for rule in ("daily", "weekdays", "weekly", "monthly"):
+        recurrence = compile_rule(rule, BASE.isoformat())
+        for label, lo, hi in VIEWS:
+            base_dt, lo_dt, hi_dt = _as_datetime(BASE), _as_datetime(lo), _as_datetime(hi)
+            old = [d.date() for d in legacy_expand(rule, base_dt, lo_dt, hi_dt)]
+            new = recurrence.between(lo, hi)
+            if old != new:
+                mismatches += 1
+                print(f"  不一致: {rule} {label}: {old[:3]}... != {new[:3]}...")
+            t_old = _per_call(lambda: legacy_expand(rule, base_dt, lo_dt, hi_dt), args.repeat)
+            t_new = _per_call(lambda: recurrence.between(lo, hi), args.repeat)
+            print(f"{rule:<10} {label:<14} {len(new):>4} {t_old:>10.1f} {t_new:>10.1f} "
+                  f"{t_old / t_new:>7.1f}x")
+
+    print()
+    print(f"{'rrule':<40} {'n':>4} {'year µs':>10} {'+5y µs':>10}")
+    far_lo, far_hi = date(2029, 1, 1), date(2029, 12, 31)
+    for text in RRULES:
+        recurrence = compile_rule(text, BASE.isoformat())
+        n = len(recurrence.between(BASE, BASE + timedelta(days=364)))
+        t_near = _per_call(lambda: recurrence.between(BASE, BASE + timedelta(days=364)), args.repeat)
+        t_far = _per_call(lambda: recurrence.between(far_lo, far_hi), args.repeat)
+        print(f"{text:<40} {n:>4} {t_near:>10.1f} {t_far:>10.1f}")
+
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,6 +7,97 @@ from dotenv import load_dotenv
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 load_dotenv(os.path.join(BASE_DIR, ".env"))
 DB_PATH = os.path.join(BASE_DIR, "planner.db")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_POOL_MAX_AGE = int(os.environ.get("DB_POOL_MAX_AGE", "3600"))
+DB_WRITE_QUEUE = os.environ.get("DB_WRITE_QUEUE", "false").lower() in ("true", "1")
+DB_WRITE_BATCH = int(os.environ.get("DB_WRITE_BATCH", "64"))
+# Statement timing: SQL_TRACE logs per-request query counts and the slowest
+# statements; statements slower than SLOW_QUERY_MS (0 = off) are always logged.
+SQL_TRACE = os.environ.get("SQL_TRACE", "false").lower() in ("true", "1")
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "500"))
+SQL_TRACE_TOP = int(os.environ.get("SQL_TRACE_TOP", "3"))
+# Query budgets: off | warn (log over-budget requests and N+1 patterns) | raise
+QUERY_BUDGET_MODE = os.environ.get("QUERY_BUDGET_MODE", "off").lower()
+QUERY_N1_THRESHOLD = int(os.environ.get("QUERY_N1_THRESHOLD", "10"))
+# Per-user shards: users/auth stay in DB_PATH, everything else in DB_SHARD_DIR/user_<id>.db
+DB_SHARDING = os.environ.get("DB_SHARDING", "false").lower() in ("true", "1")
+DB_SHARD_DIR = os.environ.get("DB_SHARD_DIR", os.path.join(BASE_DIR, "shards"))
+DB_SHARD_CACHE_SIZE = int(os.environ.get("DB_SHARD_CACHE_SIZE", "128"))
+DB_SHARD_POOL_SIZE = int(os.environ.get("DB_SHARD_POOL_SIZE", "2"))
+
+# Metrics (off by default): each process snapshots to METRICS_DIR (empty = single
+# process) and /metrics merges them.  The endpoint is not rate limited; set
+# METRICS_TOKEN to require "Authorization: Bearer <token>" when it is reachable.
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "false").lower() in ("true", "1")
+METRICS_DIR = os.environ.get("METRICS_DIR", os.path.join(BASE_DIR, ".metrics"))
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Sampling profiler: profile a random PROFILE_SAMPLE_RATE fraction of requests,
+# or any request sent with "X-Profile: <PROFILE_TOKEN>"; both empty/0 = off.
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(BASE_DIR, "profiles"))
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "200"))
+
+# Recurring events: "virtual" expands series when events are read and stores only
+# edited/deleted occurrences; "materialize" keeps copying instances into events.
+RECURRENCE_MODE = os.environ.get("RECURRENCE_MODE", "virtual").lower()
+
+# Full-text search tokenizer: "trigram" (substring matching, works for Chinese text;
+# terms shorter than 3 characters are matched without the index) or "unicode61"
+# (word matching with prefix queries, for space-separated languages).
+# Run `python manage.py fts-rebuild` after changing it.
+SEARCH_TOKENIZER = os.environ.get("SEARCH_TOKENIZER", "trigram").lower()
+
+# Regex search runs in killable worker processes: REGEX_POOL_SIZE per web process,
+# each search limited to REGEX_TIMEOUT seconds and REGEX_MAX_PER_USER at a time per user.
+REGEX_POOL_SIZE = int(os.environ.get("REGEX_POOL_SIZE", "2"))
+REGEX_TIMEOUT = float(os.environ.get("REGEX_TIMEOUT", "3"))
+REGEX_MAX_PER_USER = int(os.environ.get("REGEX_MAX_PER_USER", "1"))
+REGEX_CHUNK_ROWS = int(os.environ.get("REGEX_CHUNK_ROWS", "500"))
+REGEX_WORKER_MAX_JOBS = int(os.environ.get("REGEX_WORKER_MAX_JOBS", "500"))
+
+# Title autocomplete keeps a prefix index for the SUGGEST_CACHE_USERS most recently
+# active users per web process, rebuilt after SUGGEST_TTL seconds (writes made
+# through other worker processes show up then).
+SUGGEST_CACHE_USERS = int(os.environ.get("SUGGEST_CACHE_USERS", "256"))
+SUGGEST_TTL = int(os.environ.get("SUGGEST_TTL", "300"))
+
+# Events and timer records older than this many days move to the archive tables
+# (0, the default, = never; e.g. 730 keeps two years in the hot tables)
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "0"))
+
+# Deletions stay in the sync change log this many days; clients that have not
+# synced for longer reload everything
+SYNC_TOMBSTONE_DAYS = int(os.environ.get("SYNC_TOMBSTONE_DAYS", "90"))
+
+# Live updates (Server-Sent Events) are served on STREAM_PORT (e.g. 5556) by one
+# web process, so open streams never hold a WSGI worker thread; 0 (the default)
+# disables them.  The port speaks plain HTTP: behind a reverse proxy or HTTPS,
+# route /api/stream to it and set STREAM_URL to the address browsers should use
+# (e.g. /api/stream).
+STREAM_PORT = int(os.environ.get("STREAM_PORT", "0"))
+STREAM_HOST = os.environ.get("STREAM_HOST", os.environ.get("HOST", "127.0.0.1"))
+STREAM_URL = os.environ.get("STREAM_URL", "")
+STREAM_POLL_INTERVAL = float(os.environ.get("STREAM_POLL_INTERVAL", "1"))
+STREAM_HEARTBEAT = int(os.environ.get("STREAM_HEARTBEAT", "20"))
+STREAM_MAX_CONNECTIONS = int(os.environ.get("STREAM_MAX_CONNECTIONS", "1000"))
+STREAM_MAX_PER_USER = int(os.environ.get("STREAM_MAX_PER_USER", "10"))
+
+MAINTENANCE_ENABLED = os.environ.get("MAINTENANCE_ENABLED", "true").lower() in ("true", "1")
+MAINTENANCE_DIR = os.environ.get("MAINTENANCE_DIR", os.path.join(BASE_DIR, ".maintenance"))
+MAINTENANCE_JITTER = int(os.environ.get("MAINTENANCE_JITTER", "60"))
+# Cron expressions: minute hour day-of-month month day-of-week
+MAINTENANCE_SCHEDULE = {
+    "optimize": os.environ.get("MAINTENANCE_OPTIMIZE_CRON", "*/30 * * * *"),
+    "backup": os.environ.get("MAINTENANCE_BACKUP_CRON", "0 3 * * *"),
+    "cleanup_codes": os.environ.get("MAINTENANCE_CLEANUP_CODES_CRON", "*/15 * * * *"),
+    "purge_trash": os.environ.get("MAINTENANCE_PURGE_TRASH_CRON", "30 3 * * *"),
+    "archive": os.environ.get("MAINTENANCE_ARCHIVE_CRON", "15 4 * * *"),
+    "compact_changes": os.environ.get("MAINTENANCE_COMPACT_CHANGES_CRON", "45 4 * * *"),
+}
 
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
 
@@ -2,61 +2,473 @@ import os
 import shutil
 import sqlite3
 import logging
-from datetime import datetime
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 
 from flask import g
 
-from config import DB_PATH
+from config import (
+    DB_PATH, DB_POOL_SIZE, DB_POOL_MAX_AGE, DB_WRITE_QUEUE, DB_WRITE_BATCH,
+    DB_SHARDING, DB_SHARD_DIR, DB_SHARD_CACHE_SIZE, DB_SHARD_POOL_SIZE,
+    SEARCH_TOKENIZER,
+)
+from db_writer import GroupCommitWriter
+from db_trace import TracedConnection, untraced
 
 logger = logging.getLogger(__name__)
 
 BACKUP_DIR = os.path.join(os.path.dirname(DB_PATH), "backups")
 MAX_BACKUPS = 7
+TRASH_RETENTION_DAYS = 30
+
+# Tables holding per-user data; in sharded mode these live in the user's shard.
+USER_TABLES = (
+    "events", "timer_records", "notes", "note_images", "todos",
+    "event_templates", "user_settings", "deleted_events",
+    "events_archive", "timer_records_archive", "daily_summaries", "archive_state",
+    "event_exceptions", "recurrence_horizons",
+)
 
 
 def _configure_conn(conn):
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute("PRAGMA foreign_keys=ON")
-    conn.execute("PRAGMA busy_timeout=5000")
-    conn.execute("PRAGMA cache_size=-8000")
-    conn.execute("PRAGMA synchronous=NORMAL")
+    with untraced():
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA cache_size=-8000")
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+
+# Idle connections older than this are probed with "SELECT 1" before reuse.
+_POOL_HEALTH_CHECK_IDLE = 30
+
+
+class PooledConnection(TracedConnection):
+    """Traced sqlite3 connection whose close() hands it back to the owning pool."""
+
+    _pool = None
+    _created = 0.0
+    _last_used = 0.0
+    _checked_out = False
+
+    def close(self):
+        pool = self._pool
+        if pool is None:
+            super().close()
+        else:
+            pool.release(self)
+
+    def discard(self):
+        """Close the underlying connection for real, bypassing the pool."""
+        self._pool = None
+        try:
+            super().close()
+        except sqlite3.Error:
+            pass
+
+
+class ConnectionPool:
+    """Thread-safe pool of pre-configured SQLite connections for one database file.
+
+    Up to *size* idle connections are kept; extra connections opened under
+    load are closed on release.  Connections older than *max_age* seconds are
+    recycled, and ones that sat idle for a while are health-checked first.
+    """
+
+    def __init__(self, path, size=DB_POOL_SIZE, max_age=DB_POOL_MAX_AGE):
+        self.path = path
+        self.size = max(0, size)
+        self.max_age = max_age
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._in_use = 0
+        self._counters = {"created": 0, "reused": 0, "recycled": 0, "discarded": 0}
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path, factory=PooledConnection, check_same_thread=False
+        )
+        _configure_conn(conn)
+        conn._pool = self
+        conn._created = conn._last_used = time.monotonic()
+        return conn
+
+    def _check_fork(self):
+        # Connections inherited across fork() must not be used (or closed) by the child.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._in_use = 0
+
+    @staticmethod
+    def _healthy(conn):
+        try:
+            with untraced():
+                conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """Return a ready-to-use connection, reusing an idle one when possible."""
+        while True:
+            with self._lock:
+                self._check_fork()
+                conn = self._idle.pop() if self._idle else None
+                self._in_use += 1
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._in_use -= 1
+                    raise
+                with self._lock:
+                    self._counters["created"] += 1
+                conn._checked_out = True
+                return conn
+
+            now = time.monotonic()
+            if self.max_age and now - conn._created > self.max_age:
+                reason = "recycled"
+            elif now - conn._last_used > _POOL_HEALTH_CHECK_IDLE and not self._healthy(conn):
+                reason = "discarded"
+            else:
+                with self._lock:
+                    self._counters["reused"] += 1
+                conn._checked_out = True
+                return conn
+
+            conn.discard()
+            with self._lock:
+                self._in_use -= 1
+                self._counters[reason] += 1
+
+    def release(self, conn):
+        """Return *conn* to the pool, rolling back anything left uncommitted."""
+        if not conn._checked_out:
+            return
+        conn._checked_out = False
+        healthy = True
+        if conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                healthy = False
+        now = time.monotonic()
+        conn._last_used = now
+        expired = self.max_age and now - conn._created > self.max_age
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+            if healthy and not expired and len(self._idle) < self.size:
+                self._idle.append(conn)
+                return
+            self._counters["recycled" if expired else "discarded"] += 1
+        conn.discard()
+
+    def close_all(self):
+        """Close every idle connection; checked-out ones close on release."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.size = 0
+        for conn in idle:
+            conn.discard()
+
+    def stats(self):
+        with self._lock:
+            self._check_fork()
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                **self._counters,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool for DB_PATH."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def pool_stats():
+    return get_pool().stats()
+
+
+def close_pool():
+    if _pool is not None:
+        _pool.close_all()
+    if _shards is not None:
+        _shards.close_all()
 
 
 def get_db():
     """Get a database connection for the current request, reusing if available."""
     if "db" not in g:
-        conn = sqlite3.connect(DB_PATH)
-        _configure_conn(conn)
-        g.db = conn
+        g.db = get_pool().acquire()
     return g.db
 
 
+def connect(path):
+    """Open a configured connection to *path* outside any pool, for long-lived background readers."""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    _configure_conn(conn)
+    return conn
+
+
 def get_db_direct():
-    """Get a standalone DB connection (for use outside request context)."""
-    conn = sqlite3.connect(DB_PATH)
+    """Get a pooled DB connection for use outside request context.
+
+    Call close() when done; that returns the connection to the pool.
+    """
+    return get_pool().acquire()
+
+
+def shard_path(user_id):
+    return os.path.join(DB_SHARD_DIR, f"user_{int(user_id)}.db")
+
+
+def list_shards():
+    """Return (user_id, path) for every shard file in DB_SHARD_DIR."""
+    shards = []
+    try:
+        names = os.listdir(DB_SHARD_DIR)
+    except FileNotFoundError:
+        return shards
+    for name in names:
+        if name.startswith("user_") and name.endswith(".db") and name[5:-3].isdigit():
+            shards.append((int(name[5:-3]), os.path.join(DB_SHARD_DIR, name)))
+    return sorted(shards)
+
+
+def _ensure_schema(conn, lock_path):
+    with untraced():
+        if schema_version(conn) < SCHEMA_VERSION:
+            with file_lock(lock_path):
+                run_migrations(conn)
+
+
+class ShardManager:
+    """Bounded LRU of per-user connection pools.
+
+    A shard file is created and migrated the first time it is opened.  Once
+    more than *capacity* shards are open the least recently used pool is
+    closed; connections still checked out from it close when released.
+    """
+
+    def __init__(self, shard_dir=DB_SHARD_DIR, capacity=DB_SHARD_CACHE_SIZE,
+                 pool_size=DB_SHARD_POOL_SIZE):
+        self.shard_dir = shard_dir
+        self.capacity = max(1, capacity)
+        self.pool_size = pool_size
+        self._pools = OrderedDict()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _open(self, user_id):
+        os.makedirs(self.shard_dir, exist_ok=True)
+        pool = ConnectionPool(shard_path(user_id), size=self.pool_size)
+        conn = pool.acquire()
+        try:
+            _ensure_schema(conn, os.path.join(self.shard_dir, ".migrate.lock"))
+        finally:
+            conn.close()
+        return pool
+
+    def get_pool(self, user_id):
+        """Return the pool for *user_id*'s shard, opening it if needed."""
+        user_id = int(user_id)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._pools = OrderedDict()
+            pool = self._pools.get(user_id)
+            if pool is not None:
+                self._pools.move_to_end(user_id)
+                self._counters["hits"] += 1
+                return pool
+
+        # Opening may run migrations, so it happens outside the lock.
+        pool = self._open(user_id)
+        evicted = []
+        with self._lock:
+            existing = self._pools.get(user_id)
+            if existing is not None:
+                evicted.append(pool)
+                pool = existing
+                self._pools.move_to_end(user_id)
+            else:
+                self._counters["misses"] += 1
+                self._pools[user_id] = pool
+                while len(self._pools) > self.capacity:
+                    _, old = self._pools.popitem(last=False)
+                    evicted.append(old)
+                    self._counters["evictions"] += 1
+        for old in evicted:
+            old.close_all()
+        return pool
+
+    def drop(self, user_id):
+        """Forget *user_id*'s pool and close its idle connections."""
+        with self._lock:
+            pool = self._pools.pop(int(user_id), None)
+        if pool is not None:
+            pool.close_all()
+
+    def close_all(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), OrderedDict()
+        for pool in pools:
+            pool.close_all()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open": len(self._pools),
+                "capacity": self.capacity,
+                **self._counters,
+            }
+
+
+_shards = None
+
+
+def get_shards():
+    """Return the process-wide ShardManager (created on first use)."""
+    global _shards
+    if _shards is None:
+        with _pool_lock:
+            if _shards is None:
+                _shards = ShardManager()
+    return _shards
+
+
+def shard_stats():
+    return get_shards().stats() if DB_SHARDING else None
+
+
+def get_user_db():
+    """Get the connection holding the current user's data for this request.
+
+    That is the user's shard with DB_SHARDING enabled, otherwise the same
+    connection as get_db().
+    """
+    if not DB_SHARDING:
+        return get_db()
+    if "user_db" not in g:
+        g.user_db = get_shards().get_pool(g.user_id).acquire()
+    return g.user_db
+
+
+_writer = None
+
+
+def _writer_connect(path):
+    conn = sqlite3.connect(path, factory=TracedConnection, check_same_thread=False)
     _configure_conn(conn)
     return conn
 
 
+def get_writer():
+    """Return the process-wide group-commit writer (created on first use)."""
+    global _writer
+    if _writer is None:
+        with _pool_lock:
+            if _writer is None:
+                _writer = GroupCommitWriter(
+                    _writer_connect,
+                    max_batch=DB_WRITE_BATCH,
+                    max_conns=DB_SHARD_CACHE_SIZE + 1 if DB_SHARDING else 1,
+                )
+    return _writer
+
+
+def run_write(fn):
+    """Run ``fn(conn)`` as one write transaction and return its result.
+
+    With DB_WRITE_QUEUE enabled the call is handed to the group-commit
+    writer thread and this blocks until its batch commits; otherwise it runs
+    on the request connection followed by a commit.  Since *fn* may run on
+    another thread it must only use *conn* and its own closure, never
+    flask.g or the request.
+    """
+    if DB_WRITE_QUEUE:
+        return get_writer().submit(fn, DB_PATH).result()
+    return _commit_on(get_db(), fn)
+
+
+def run_user_write(fn):
+    """Like run_write(), but against the current user's shard when sharding is on."""
+    if not DB_SHARDING:
+        return run_write(fn)
+    if DB_WRITE_QUEUE:
+        path = get_shards().get_pool(g.user_id).path
+        return get_writer().submit(fn, path).result()
+    return _commit_on(get_user_db(), fn)
+
+
+def _commit_on(conn, fn):
+    try:
+        result = fn(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return result
+
+
+def writer_stats():
+    return _writer.stats() if _writer is not None else None
+
+
+def stop_writer():
+    if _writer is not None:
+        _writer.stop()
+
+
+def _copy_database(src_path, dest_path):
+    """Copy a live database with the SQLite online backup API."""
+    src = sqlite3.connect(src_path)
+    try:
+        dest = sqlite3.connect(dest_path)
+        try:
+            src.backup(dest)
+        finally:
+            dest.close()
+    finally:
+        src.close()
+
+
+def _rotate_backups(directory, keep=MAX_BACKUPS):
+    backups = sorted(f for f in os.listdir(directory) if f.endswith(".db"))
+    while len(backups) > keep:
+        os.remove(os.path.join(directory, backups.pop(0)))
+
+
 def backup_db():
     """Create a timestamped backup of the database, keeping the last MAX_BACKUPS."""
     try:
         os.makedirs(BACKUP_DIR, exist_ok=True)
         ts = datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_path = os.path.join(BACKUP_DIR, f"planner_{ts}.db")
-        conn = sqlite3.connect(DB_PATH)
-        backup_conn = sqlite3.connect(backup_path)
-        conn.backup(backup_conn)
-        backup_conn.close()
-        conn.close()
-
-        backups = sorted(
-            [f for f in os.listdir(BACKUP_DIR) if f.endswith(".db")],
-        )
-        while len(backups) > MAX_BACKUPS:
-            old = backups.pop(0)
-            os.remove(os.path.join(BACKUP_DIR, old))
+        _copy_database(DB_PATH, backup_path)
+        _rotate_backups(BACKUP_DIR)
 
         logger.info("数据库备份完成: %s", backup_path)
         return backup_path
@@ -65,9 +477,238 @@ def backup_db():
         return None
 
 
+def backup_shard(user_id, dest=None):
+    """Back up one user's shard and return the backup path.
+
+    Without *dest* the copy goes to BACKUP_DIR/shards/user_<id>/, keeping the
+    last MAX_BACKUPS there.
+    """
+    src = shard_path(user_id)
+    if not os.path.exists(src):
+        raise FileNotFoundError(f"用户 {user_id} 的分片不存在: {src}")
+    if dest is not None:
+        _copy_database(src, dest)
+        return dest
+    user_dir = os.path.join(BACKUP_DIR, "shards", f"user_{int(user_id)}")
+    os.makedirs(user_dir, exist_ok=True)
+    dest = os.path.join(user_dir, datetime.now().strftime("%Y%m%d_%H%M%S") + ".db")
+    _copy_database(src, dest)
+    _rotate_backups(user_dir)
+    return dest
+
+
+def backup_shards():
+    """Back up every shard; returns the number of shards copied."""
+    done = 0
+    for user_id, _ in list_shards():
+        try:
+            backup_shard(user_id)
+            done += 1
+        except Exception as e:
+            logger.error("用户 %d 分片备份失败: %s", user_id, e)
+    logger.info("分片备份完成: %d 个", done)
+    return done
+
+
+def restore_shard(user_id, src):
+    """Replace one user's shard with the backup at *src*.
+
+    The copy goes through the backup API, so connections other processes
+    hold on the shard see the restored data rather than a torn file.
+    Older backups are migrated to the current schema afterwards.
+    """
+    if not os.path.exists(src):
+        raise FileNotFoundError(src)
+    check = sqlite3.connect(src)
+    try:
+        if check.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+            raise ValueError(f"备份文件已损坏: {src}")
+    finally:
+        check.close()
+    os.makedirs(DB_SHARD_DIR, exist_ok=True)
+    get_shards().drop(user_id)
+    _copy_database(src, shard_path(user_id))
+    get_shards().get_pool(user_id)
+
+
+def drop_shard(user_id):
+    """Close and delete one user's shard file (used when an account is deleted)."""
+    get_shards().drop(user_id)
+    path = shard_path(user_id)
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def split_user_to_shard(user_id, purge=False):
+    """Copy one user's rows from the main database into their shard.
+
+    Row ids are preserved.  A shard that already holds data is left alone
+    (ValueError).  With *purge* the copied rows are then deleted from the
+    main database.  Returns {table: rows copied}.
+    """
+    os.makedirs(DB_SHARD_DIR, exist_ok=True)
+    path = shard_path(user_id)
+    shard = sqlite3.connect(path)
+    try:
+        _configure_conn(shard)
+        _ensure_schema(shard, os.path.join(DB_SHARD_DIR, ".migrate.lock"))
+        for table in USER_TABLES:
+            if shard.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                raise ValueError(f"用户 {user_id} 的分片已有数据: {path}")
+        shard_columns = {table: set(_get_columns(shard, table)) for table in USER_TABLES}
+    finally:
+        shard.close()
+
+    counts = {}
+    conn = get_db_direct()
+    try:
+        conn.execute("ATTACH DATABASE ? AS shard", (path,))
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table in USER_TABLES:
+                    cols = ", ".join(
+                        c for c in _get_columns(conn, table) if c in shard_columns[table]
+                    )
+                    cur = conn.execute(
+                        f"INSERT INTO shard.{table} ({cols}) "
+                        f"SELECT {cols} FROM main.{table} WHERE user_id=?",
+                        (user_id,),
+                    )
+                    counts[table] = cur.rowcount
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        finally:
+            conn.execute("DETACH DATABASE shard")
+
+        if purge:
+            conn.execute("BEGIN IMMEDIATE")
+            for table in USER_TABLES:
+                conn.execute(f"DELETE FROM {table} WHERE user_id=?", (user_id,))
+            conn.execute("DELETE FROM data_versions WHERE user_id=?", (user_id,))
+            conn.execute("DELETE FROM change_log WHERE user_id=?", (user_id,))
+            conn.commit()
+    finally:
+        conn.close()
+    return counts
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """Hold an exclusive advisory lock on *path* for the duration of the block.
+
+    Yields True once the lock is held.  With blocking=False it yields False
+    immediately if another process already holds the lock.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    acquired = False
+    try:
+        if os.name == "nt":
+            import msvcrt
+
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                acquired = True
+            except OSError:
+                if blocking:
+                    raise
+        else:
+            import fcntl
+
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                acquired = True
+            except BlockingIOError:
+                pass
+        yield acquired
+    finally:
+        if acquired:
+            if os.name == "nt":
+                import msvcrt
+
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
 def init_db():
+    """Bring the schema up to date.
+
+    A warm start with a current schema costs a single PRAGMA user_version
+    read.  Otherwise pending migrations run under a file lock so several
+    workers booting at once apply them exactly once.
+    """
     conn = get_db_direct()
+    try:
+        if schema_version(conn) >= SCHEMA_VERSION:
+            return 0
+        with file_lock(DB_PATH + ".migrate.lock"):
+            applied = run_migrations(conn)
+    finally:
+        conn.close()
+    if applied:
+        try:
+            optimize_db()
+        except sqlite3.Error as e:
+            logger.warning("迁移后优化数据库失败: %s", e)
+    return applied
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def run_migrations(conn):
+    """Apply every migration newer than the database's user_version, in order.
+
+    Each step runs in its own IMMEDIATE transaction together with the
+    user_version bump, so a failed step leaves the schema at the previous
+    version.  Returns the number of steps applied.
+    """
+    applied = 0
+    current = schema_version(conn)
+    for version, description, step in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have migrated while we waited for the write lock.
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            step(conn)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error("数据库迁移失败: v%d %s", version, description)
+            raise
+        applied += 1
+        logger.info("数据库迁移完成: v%d %s", version, description)
+    return applied
+
+
+def _get_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def _add_missing_columns(conn, table, columns):
+    existing = _get_columns(conn, table)
+    for col_name, definition in columns:
+        if col_name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {col_name} {definition}")
+
 
+def _create_base_tables(conn):
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS users (
@@ -221,58 +862,18 @@ def init_db():
     """
     )
 
-    for col, sql in [("language", "ALTER TABLE users ADD COLUMN language TEXT DEFAULT ''")]:
-        try:
-            conn.execute(sql)
-        except Exception:
-            pass
 
-    _migrate(conn)
-    conn.commit()
-    conn.close()
-
-
-def _migrate(conn):
-    _migrate_events(conn)
-    _migrate_timer_records(conn)
+def _upgrade_legacy_columns(conn):
+    """Add columns introduced after the first releases to pre-existing tables."""
+    _add_missing_columns(conn, "users", [("language", "TEXT DEFAULT ''")])
+    _add_missing_columns(conn, "events", [
+        ("col_type", "TEXT DEFAULT 'plan'"),
+        ("user_id", "INTEGER DEFAULT NULL"),
+        ("recur_rule", "TEXT DEFAULT NULL"),
+        ("recur_parent_id", "INTEGER DEFAULT NULL"),
+    ])
+    _add_missing_columns(conn, "timer_records", [("user_id", "INTEGER DEFAULT NULL")])
     _migrate_notes(conn)
-    _migrate_note_images(conn)
-    _migrate_notes_to_multi(conn)
-    _migrate_todos(conn)
-    _create_indexes(conn)
-
-
-def _get_columns(conn, table):
-    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
-
-
-def _migrate_events(conn):
-    cols = _get_columns(conn, "events")
-    migrations = [
-        ("col_type", "TEXT", "'plan'"),
-        ("user_id", "INTEGER", "NULL"),
-        ("recur_rule", "TEXT", "NULL"),
-        ("recur_parent_id", "INTEGER", "NULL"),
-    ]
-    for col_name, col_type, default in migrations:
-        if col_name not in cols:
-            try:
-                conn.execute(
-                    f"ALTER TABLE events ADD COLUMN {col_name} {col_type} DEFAULT {default}"
-                )
-            except Exception:
-                pass
-
-
-def _migrate_timer_records(conn):
-    cols = _get_columns(conn, "timer_records")
-    if "user_id" not in cols:
-        try:
-            conn.execute(
-                "ALTER TABLE timer_records ADD COLUMN user_id INTEGER DEFAULT NULL"
-            )
-        except Exception:
-            pass
 
 
 def _migrate_notes(conn):
@@ -304,56 +905,14 @@ def _migrate_notes(conn):
             conn.execute("DROP TABLE notes")
             conn.execute("ALTER TABLE notes_new RENAME TO notes")
         else:
-            try:
-                conn.execute(
-                    "ALTER TABLE notes ADD COLUMN user_id INTEGER DEFAULT NULL"
-                )
-            except Exception:
-                pass
+            conn.execute("ALTER TABLE notes ADD COLUMN user_id INTEGER DEFAULT NULL")
 
 
 def _migrate_notes_to_multi(conn):
     """Drop the UNIQUE constraint on (user_id, date) to allow multiple notes per day.
     Also removes empty-content notes left over from the old single-note system."""
-    try:
-        conn.execute("DROP INDEX IF EXISTS idx_notes_user_date")
-    except Exception:
-        pass
-    try:
-        conn.execute("DELETE FROM notes WHERE content IS NULL OR content = ''")
-    except Exception:
-        pass
-
-
-def _migrate_note_images(conn):
-    """Ensure note_images table exists (for older DBs that lack it)."""
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS note_images (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            token TEXT NOT NULL UNIQUE,
-            storage_path TEXT NOT NULL,
-            created_at TEXT DEFAULT (datetime('now','localtime'))
-        )
-    """
-    )
-
-
-def _migrate_todos(conn):
-    """Ensure todos table exists (for older DBs that lack it)."""
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS todos (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            text TEXT NOT NULL,
-            done INTEGER DEFAULT 0,
-            sort_order INTEGER DEFAULT 0,
-            created_at TEXT DEFAULT (datetime('now','localtime'))
-        )
-    """
-    )
+    conn.execute("DROP INDEX IF EXISTS idx_notes_user_date")
+    conn.execute("DELETE FROM notes WHERE content IS NULL OR content = ''")
 
 
 def _create_indexes(conn):
@@ -373,30 +932,492 @@ def _create_indexes(conn):
         "CREATE INDEX IF NOT EXISTS idx_todos_user ON todos(user_id, sort_order)",
     ]
     for sql in indexes:
+        conn.execute(sql)
+
+
+# Integer encodings of the TEXT date/time columns, computed by SQLite itself so
+# every write path (API, import, recurrence, restore) keeps them correct.
+# day_num counts days since 1970-01-01; *_min is minutes since midnight.
+_DAY_NUM_SQL = "CAST(julianday(date) - 2440587.5 AS INTEGER)"
+_EPOCH = date(1970, 1, 1)
+
+
+def _minute_of_day_sql(col):
+    return f"CAST(substr({col}, 1, 2) AS INTEGER) * 60 + CAST(substr({col}, 4, 2) AS INTEGER)"
+
+
+def epoch_day(value):
+    """Return the day_num for a date or a YYYY-MM-DD string."""
+    if isinstance(value, str):
+        value = datetime.strptime(value, "%Y-%m-%d").date()
+    elif isinstance(value, datetime):
+        value = value.date()
+    return (value - _EPOCH).days
+
+
+def from_epoch_day(day_num):
+    return (_EPOCH + timedelta(days=day_num)).strftime("%Y-%m-%d")
+
+
+# The generated columns are a storage detail and never part of API rows.
+GENERATED_COLUMNS = frozenset(("day_num", "start_min", "end_min"))
+
+
+def row_dict(row):
+    """An events / timer_records row as a dict, without the generated integer columns."""
+    return {k: v for k, v in dict(row).items() if k not in GENERATED_COLUMNS}
+
+
+def _add_integer_datetime_columns(conn):
+    generated = {
+        "events": [
+            ("day_num", _DAY_NUM_SQL),
+            ("start_min", _minute_of_day_sql("start_time")),
+            ("end_min", _minute_of_day_sql("end_time")),
+        ],
+        "timer_records": [("day_num", _DAY_NUM_SQL)],
+    }
+    for table, columns in generated.items():
+        # table_xinfo, unlike table_info, lists generated columns.
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_xinfo({table})")}
+        for col_name, expr in columns:
+            if col_name not in existing:
+                conn.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {col_name} INTEGER "
+                    f"GENERATED ALWAYS AS ({expr}) VIRTUAL"
+                )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_user_day ON events(user_id, col_type, day_num, start_min)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_timer_user_day ON timer_records(user_id, day_num)"
+    )
+
+
+def _create_archive_tables(conn):
+    day_num = f"day_num INTEGER GENERATED ALWAYS AS ({_DAY_NUM_SQL}) VIRTUAL"
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS events_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            title TEXT NOT NULL,
+            description TEXT DEFAULT '',
+            date TEXT NOT NULL,
+            start_time TEXT NOT NULL,
+            end_time TEXT NOT NULL,
+            color TEXT NOT NULL,
+            category TEXT DEFAULT '其他',
+            priority INTEGER DEFAULT 2,
+            completed INTEGER DEFAULT 0,
+            col_type TEXT DEFAULT 'plan',
+            recur_rule TEXT DEFAULT NULL,
+            recur_parent_id INTEGER DEFAULT NULL,
+            created_at TEXT,
+            updated_at TEXT,
+            {day_num},
+            start_min INTEGER GENERATED ALWAYS AS ({_minute_of_day_sql("start_time")}) VIRTUAL,
+            end_min INTEGER GENERATED ALWAYS AS ({_minute_of_day_sql("end_time")}) VIRTUAL
+        )
+    """
+    )
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS timer_records_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            task_name TEXT NOT NULL,
+            planned_minutes INTEGER NOT NULL,
+            actual_seconds INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            completed INTEGER DEFAULT 0,
+            created_at TEXT,
+            {day_num}
+        )
+    """
+    )
+    # Per-day totals of the archived rows, so stats never scan the archive.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_summaries (
+            user_id INTEGER NOT NULL,
+            day_num INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            events INTEGER NOT NULL DEFAULT 0,
+            completed_events INTEGER NOT NULL DEFAULT 0,
+            event_minutes INTEGER NOT NULL DEFAULT 0,
+            timer_count INTEGER NOT NULL DEFAULT 0,
+            timer_completed INTEGER NOT NULL DEFAULT 0,
+            focus_seconds INTEGER NOT NULL DEFAULT 0,
+            focus_minutes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day_num)
+        ) WITHOUT ROWID
+    """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS archive_state (
+            user_id INTEGER PRIMARY KEY,
+            archived_before INTEGER NOT NULL,
+            updated_at TEXT DEFAULT (datetime('now','localtime'))
+        )
+    """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_archive_user_date ON events_archive(user_id, date)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_archive_user_day ON events_archive(user_id, day_num)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_archive_recur ON events_archive(recur_parent_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_timer_archive_user_date ON timer_records_archive(user_id, date)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_timer_archive_user_day ON timer_records_archive(user_id, day_num)"
+    )
+
+
+def _create_recurrence_exceptions(conn):
+    # One row per occurrence of a series that no longer comes from its rule:
+    # event_id points at the concrete override, NULL means the date was deleted.
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS event_exceptions (
+            user_id INTEGER NOT NULL,
+            parent_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            event_id INTEGER,
+            created_at TEXT DEFAULT (datetime('now','localtime')),
+            PRIMARY KEY (parent_id, date)
+        ) WITHOUT ROWID
+    """
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_event_exceptions_user_date ON event_exceptions(user_id, date)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_event_exceptions_event ON event_exceptions(event_id)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_recurring ON events(user_id, date) "
+        "WHERE recur_rule IS NOT NULL"
+    )
+
+
+def _create_recurrence_uniqueness(conn):
+    # At most one stored instance per series, date and column.  Duplicates
+    # left by concurrent generate-recurring calls are kept but detached from
+    # their series so the index can be built.
+    conn.execute(
+        """UPDATE events SET recur_parent_id=NULL
+           WHERE recur_parent_id IS NOT NULL AND id NOT IN (
+               SELECT MIN(id) FROM events WHERE recur_parent_id IS NOT NULL
+               GROUP BY user_id, recur_parent_id, date, col_type)"""
+    )
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_events_recur_instance "
+        "ON events(user_id, recur_parent_id, date, col_type) WHERE recur_parent_id IS NOT NULL"
+    )
+    # Materializing mode: every occurrence of the series up to and including
+    # `through` has been stored (or deliberately skipped).
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS recurrence_horizons (
+            parent_id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            through TEXT NOT NULL
+        )
+    """
+    )
+
+
+# FTS5 indexes (fts table, content table, indexed columns).  They use the
+# content tables' rows directly (external content) and triggers keep them in
+# step, so they only store the index itself.
+SEARCH_INDEXES = (
+    ("events_fts", "events", ("title", "description")),
+    ("events_archive_fts", "events_archive", ("title", "description")),
+    ("notes_fts", "notes", ("content",)),
+)
+
+
+def search_tokenizer():
+    """The FTS5 tokenizer in effect: SEARCH_TOKENIZER, if this SQLite supports it."""
+    if SEARCH_TOKENIZER == "unicode61" or sqlite3.sqlite_version_info < (3, 34, 0):
+        return "unicode61"
+    return "trigram"
+
+
+def _create_search_index(conn):
+    if search_tokenizer() == "trigram":
+        options = "tokenize='trigram'"
+    else:
+        options = "tokenize='unicode61', prefix='2 3'"
+    for table, content, cols in SEARCH_INDEXES:
         try:
-            conn.execute(sql)
+            conn.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+                f"{', '.join(cols)}, content='{content}', content_rowid='id', {options})"
+            )
+        except sqlite3.OperationalError as e:
+            # SQLite built without FTS5: searches keep using LIKE.
+            logger.warning("无法创建全文索引 %s，搜索将使用 LIKE: %s", table, e)
+            return
+        names = ", ".join(cols)
+        new = ", ".join(f"new.{c}" for c in cols)
+        old = ", ".join(f"old.{c}" for c in cols)
+        conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {content} BEGIN
+                INSERT INTO {table}(rowid, {names}) VALUES (new.id, {new});
+            END"""
+        )
+        conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {content} BEGIN
+                INSERT INTO {table}({table}, rowid, {names}) VALUES ('delete', old.id, {old});
+            END"""
+        )
+        conn.execute(
+            f"""CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {names} ON {content} BEGIN
+                INSERT INTO {table}({table}, rowid, {names}) VALUES ('delete', old.id, {old});
+                INSERT INTO {table}(rowid, {names}) VALUES (new.id, {new});
+            END"""
+        )
+        conn.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+
+def _drop_search_index(conn):
+    for table, _, _ in SEARCH_INDEXES:
+        for suffix in ("ai", "ad", "au"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {table}_{suffix}")
+        conn.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def rebuild_search_index():
+    """Recreate the full-text indexes with the current tokenizer, in every database."""
+    def _rebuild(conn):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            _drop_search_index(conn)
+            _create_search_index(conn)
+            conn.commit()
         except Exception:
-            pass
+            conn.rollback()
+            raise
+        return 1
+
+    conn = get_db_direct()
+    try:
+        rebuilt = _rebuild(conn)
+    finally:
+        conn.close()
+    return rebuilt + sum(for_each_shard(_rebuild))
+
+
+# Per-user change counters: every write to the listed tables bumps
+# data_versions(user_id, name) through triggers, whichever code path or
+# process made it, so caches can be checked with one indexed read.
+DATA_VERSIONS = {
+    "events": ("events", "events_archive", "event_exceptions"),
+    "notes": ("notes",),
+    "timer": ("timer_records", "timer_records_archive"),
+}
+
+
+# Shipped migration steps keep their own table lists: migration 10 versioned
+# events only, 11 recreated the triggers for the whole of DATA_VERSIONS.  A
+# later change to DATA_VERSIONS needs a new step of its own.
+_DATA_VERSIONS_V10 = {
+    "events": ("events", "event_exceptions"),
+}
+
+
+def _create_data_versions(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS data_versions (
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (user_id, name)
+        ) WITHOUT ROWID"""
+    )
+    for name, tables in _DATA_VERSIONS_V10.items():
+        for table in tables:
+            for suffix, event, row in (("ai", "INSERT", "new"), ("au", "UPDATE", "new"), ("ad", "DELETE", "old")):
+                conn.execute(
+                    f"""CREATE TRIGGER IF NOT EXISTS {table}_version_{suffix} AFTER {event} ON {table} BEGIN
+                        INSERT INTO data_versions (user_id, name, version) VALUES ({row}.user_id, '{name}', 1)
+                        ON CONFLICT(user_id, name) DO UPDATE SET version = version + 1;
+                    END"""
+                )
+
+
+def _recreate_data_version_triggers(conn):
+    for table in {t for tables in DATA_VERSIONS.values() for t in tables}:
+        for suffix in ("ai", "au", "ad"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {table}_version_{suffix}")
+    for name, tables in DATA_VERSIONS.items():
+        for table in tables:
+            for suffix, event, row in (("ai", "INSERT", "new"), ("au", "UPDATE", "new"), ("ad", "DELETE", "old")):
+                # A counter starts at a random value, so one recreated after a
+                # shard move or purge does not repeat versions already handed out.
+                conn.execute(
+                    f"""CREATE TRIGGER {table}_version_{suffix} AFTER {event} ON {table} BEGIN
+                        INSERT INTO data_versions (user_id, name, version)
+                        VALUES ({row}.user_id, '{name}', abs(random() % 1000000000000) + 1)
+                        ON CONFLICT(user_id, name) DO UPDATE SET version = version + 1;
+                    END"""
+                )
+
+
+def data_version(conn, user_id, name):
+    """Current change counter of *user_id*'s *name* data (0 before the first write)."""
+    row = conn.execute(
+        "SELECT version FROM data_versions WHERE user_id=? AND name=?", (user_id, name)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def data_versions(conn, user_id, names):
+    """Change counters of several *names* with one query, in the order given."""
+    found = dict(conn.execute(
+        f"SELECT name, version FROM data_versions WHERE user_id=? AND name IN ({','.join('?' * len(names))})",
+        (user_id, *names),
+    ).fetchall())
+    return tuple(found.get(name, 0) for name in names)
+
+
+# Sync change log: (table, entity, id expression, date expression, archive
+# twin).  A delete whose row still exists in the twin table is a move to or
+# from the archive, not a deletion, and is not logged; neither are inserts
+# into the archive tables.
+CHANGE_LOG_SOURCES = (
+    ("events", "event", "{row}.id", "{row}.date", "events_archive"),
+    ("events_archive", "event", "{row}.id", "{row}.date", "events"),
+    ("event_exceptions", "event", "{row}.parent_id", "{row}.date", None),
+    ("notes", "note", "{row}.id", "{row}.date", None),
+    ("todos", "todo", "{row}.id", "NULL", None),
+    ("timer_records", "timer", "{row}.id", "{row}.date", "timer_records_archive"),
+    ("timer_records_archive", "timer", "{row}.id", "{row}.date", "timer_records"),
+)
+
+
+def _create_change_log(conn):
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            entity TEXT NOT NULL,
+            entity_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            date TEXT,
+            changed_at TEXT DEFAULT (datetime('now','localtime'))
+        )"""
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_log_user ON change_log(user_id, seq)")
+    # One row per database: cursors name the log they came from, so a cursor
+    # from another shard or from before a restore is recognised as foreign.
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS change_log_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            log_id TEXT NOT NULL,
+            pruned_seq INTEGER NOT NULL DEFAULT 0
+        )"""
+    )
+    conn.execute(
+        "INSERT OR IGNORE INTO change_log_state (id, log_id) VALUES (1, lower(hex(randomblob(8))))"
+    )
+    for table, entity, ident, day, twin in CHANGE_LOG_SOURCES:
+        archive = table.endswith("_archive")
+        for suffix, event, row, op in (("ai", "INSERT", "new", "upsert"), ("au", "UPDATE", "new", "upsert"),
+                                       ("ad", "DELETE", "old", "delete")):
+            if archive and event == "INSERT":
+                continue
+            if table == "event_exceptions":
+                op = "upsert"
+            when = f"WHEN NOT EXISTS (SELECT 1 FROM {twin} WHERE id = old.id)" if twin and event == "DELETE" else ""
+            conn.execute(
+                f"""CREATE TRIGGER IF NOT EXISTS {table}_log_{suffix} AFTER {event} ON {table} {when} BEGIN
+                    INSERT INTO change_log (user_id, entity, entity_id, op, date)
+                    VALUES ({row}.user_id, '{entity}', {ident.format(row=row)}, '{op}', {day.format(row=row)});
+                END"""
+            )
+
+
+# Ordered (version, description, step).  Steps must be idempotent: databases
+# created before versioning start at user_version 0 and replay all of them.
+MIGRATIONS = [
+    (1, "base tables", _create_base_tables),
+    (2, "legacy column upgrades", _upgrade_legacy_columns),
+    (3, "multiple notes per day", _migrate_notes_to_multi),
+    (4, "indexes", _create_indexes),
+    (5, "integer date/time columns", _add_integer_datetime_columns),
+    (6, "cold archive tables", _create_archive_tables),
+    (7, "recurrence exceptions", _create_recurrence_exceptions),
+    (8, "recurring instance uniqueness", _create_recurrence_uniqueness),
+    (9, "full-text search indexes", _create_search_index),
+    (10, "per-user data versions", _create_data_versions),
+    (11, "data versions for notes and timer records", _recreate_data_version_triggers),
+    (12, "sync change log", _create_change_log),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def for_each_shard(fn):
+    """Run *fn(conn)* on every shard with a short-lived connection; returns the results."""
+    if not DB_SHARDING:
+        return []
+    results = []
+    for user_id, path in list_shards():
+        conn = sqlite3.connect(path)
+        try:
+            _configure_conn(conn)
+            results.append(fn(conn))
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning("用户 %d 分片维护失败: %s", user_id, e)
+        finally:
+            conn.close()
+    return results
 
 
 def optimize_db():
-    """Run periodic maintenance: clean up stale data and optimize."""
+    """Let SQLite refresh query-planner statistics (PRAGMA optimize)."""
     conn = get_db_direct()
     try:
-        from datetime import datetime, timedelta
-        cutoff = (datetime.now() - timedelta(hours=24)).strftime("%Y-%m-%d %H:%M:%S")
-        conn.execute(
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+    finally:
+        conn.close()
+    for_each_shard(lambda c: c.execute("PRAGMA optimize"))
+
+
+def cleanup_verification_codes():
+    """Delete verification codes that were used or expired over 24 hours ago."""
+    cutoff = (datetime.now() - timedelta(hours=24)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_db_direct()
+    try:
+        cur = conn.execute(
             "DELETE FROM verification_codes WHERE expires_at < ? OR used = 1",
             (cutoff,),
         )
-        trash_cutoff = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
-        conn.execute(
-            "DELETE FROM deleted_events WHERE deleted_at < ?",
-            (trash_cutoff,),
-        )
-        conn.execute("PRAGMA optimize")
         conn.commit()
-    except Exception:
-        pass
+        return cur.rowcount
+    finally:
+        conn.close()
+
+
+def purge_trash(days=TRASH_RETENTION_DAYS):
+    """Permanently delete trashed events older than *days*."""
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    sql = "DELETE FROM deleted_events WHERE deleted_at < ?"
+    conn = get_db_direct()
+    try:
+        cur = conn.execute(sql, (cutoff,))
+        conn.commit()
+        purged = cur.rowcount
     finally:
         conn.close()
+    return purged + sum(for_each_shard(lambda c: c.execute(sql, (cutoff,)).rowcount))
@@ -0,0 +1,314 @@
+"""
+db_trace — statement-level timing for SQLite connections.
+
+TracedConnection times every execute()/executemany() together with the
+fetches made on the returned cursor.  A statement is complete once it
+returns no result set, after fetchone() or fetchall(), when iteration ends,
+or when its cursor is discarded.  While a request is being traced
+(begin_request() .. end_request()) each statement is added to that
+request's QueryLog; independently, any completed statement slower than
+SLOW_QUERY_MS is logged with its normalized SQL and EXPLAIN QUERY PLAN
+output.
+
+Query budgets (QUERY_BUDGET_MODE=warn|raise) build on the same log: a view
+decorated with @query_budget(n) may run at most n statements per request,
+and any statement shape repeated QUERY_N1_THRESHOLD times in one request is
+reported as a likely N+1 loop.  Tests can also wrap a block in
+expect_queries(n).
+"""
+
+import re
+import time
+import logging
+import sqlite3
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+
+from config import (
+    SQL_TRACE, SLOW_QUERY_MS, SQL_TRACE_TOP, QUERY_BUDGET_MODE, QUERY_N1_THRESHOLD,
+)
+
+logger = logging.getLogger(__name__)
+
+# Timing costs a couple of perf_counter() calls per statement; with both
+# features off connections skip it entirely.
+ENABLED = SQL_TRACE or SLOW_QUERY_MS > 0 or QUERY_BUDGET_MODE != "off"
+
+_current = contextvars.ContextVar("sql_trace", default=None)
+_scopes = contextvars.ContextVar("sql_trace_scopes", default=())
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+_EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+class QueryBudgetExceeded(Exception):
+    """A request or test block ran more statements than its budget allows."""
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Collapse whitespace and replace literals so equal statements group together."""
+    sql = _STRING_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(?+)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+class QueryLog:
+    """Statements executed while handling one request."""
+
+    def __init__(self, request_id=None):
+        self.request_id = request_id
+        self.count = 0
+        self.total_ms = 0.0
+        self.rows = 0
+        self.statements = []
+
+    def add(self, record):
+        self.count += 1
+        self.statements.append(record)
+
+    def finish(self):
+        for record in self.statements:
+            record.finish()
+        self.total_ms = round(sum(r.ms for r in self.statements), 2)
+        self.rows = sum(r.rows for r in self.statements)
+        return self
+
+    def slowest(self, n=SQL_TRACE_TOP):
+        ranked = sorted(self.statements, key=lambda r: r.ms, reverse=True)[:n]
+        return [{"sql": normalize_sql(r.sql), "ms": round(r.ms, 2), "rows": r.rows} for r in ranked]
+
+    def repeated(self, threshold=QUERY_N1_THRESHOLD):
+        """Statement shapes executed at least *threshold* times, most frequent first."""
+        shapes = Counter(normalize_sql(r.sql) for r in self.statements)
+        return [(sql, n) for sql, n in shapes.most_common() if n >= threshold]
+
+
+class _Statement:
+    __slots__ = ("conn", "sql", "params", "ms", "rows", "request_id", "done")
+
+    def __init__(self, conn, sql, params, request_id):
+        self.conn = conn
+        self.sql = sql
+        self.params = params
+        self.ms = 0.0
+        self.rows = 0
+        self.request_id = request_id
+        self.done = False
+
+    def finish(self):
+        if self.done:
+            return
+        self.done = True
+        if SLOW_QUERY_MS > 0 and self.ms >= SLOW_QUERY_MS:
+            _log_slow(self)
+        self.conn = None
+
+
+def _explain(conn, sql, params):
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return ""
+    try:
+        cur = sqlite3.Cursor(conn)
+        rows = cur.execute("EXPLAIN QUERY PLAN " + sql, params or ()).fetchall()
+    except (sqlite3.Error, ValueError):
+        return ""
+    return "; ".join(row[3] for row in rows)
+
+
+def _log_slow(record):
+    plan = _explain(record.conn, record.sql, record.params) if record.conn is not None else ""
+    logger.warning(
+        "慢查询 %.1fms rows=%d rid=%s: %s | 计划: %s",
+        record.ms, record.rows, record.request_id or "-",
+        normalize_sql(record.sql), plan or "-",
+    )
+
+
+class TracingCursor(sqlite3.Cursor):
+    """Cursor that adds its fetch time to the statement it executed."""
+
+    _record = None
+
+    def _timed(self, method, *args):
+        record = self._record
+        if record is None or record.done:
+            return method(*args)
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            record.ms += (time.perf_counter() - start) * 1000
+
+    def fetchone(self):
+        # Callers that read one row are done with the statement.
+        row = self._timed(super().fetchone)
+        record = self._record
+        if record is not None and not record.done:
+            if row is not None:
+                record.rows += 1
+            record.finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, size if size is not None else self.arraysize)
+        if self._record is not None:
+            self._record.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._record is not None:
+            self._record.rows += len(rows)
+            self._record.finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            if self._record is not None:
+                self._record.finish()
+            raise
+        if self._record is not None:
+            self._record.rows += 1
+        return row
+
+    def __del__(self):
+        # Partly read cursors (fetchmany(), a loop that breaks early) finish
+        # here, so threads without a request log still see slow statements.
+        record = self._record
+        if record is not None:
+            record.finish()
+
+
+class TracedConnection(sqlite3.Connection):
+    """sqlite3 connection whose execute()/executemany() are timed."""
+
+    def _run(self, method_name, sql, params, sample_params):
+        log = _current.get()
+        record = _Statement(self, sql, sample_params, log.request_id if log else None)
+        cur = self.cursor(TracingCursor)
+        cur._record = record
+        start = time.perf_counter()
+        try:
+            getattr(sqlite3.Cursor, method_name)(cur, sql, params)
+        finally:
+            record.ms += (time.perf_counter() - start) * 1000
+            if log is not None:
+                log.add(record)
+            for scope in _scopes.get():
+                scope.add(record)
+        if cur.description is None:
+            record.rows = max(cur.rowcount, 0)
+            record.finish()
+        return cur
+
+    def execute(self, sql, parameters=()):
+        if not ENABLED and not _scopes.get():
+            return super().execute(sql, parameters)
+        return self._run("execute", sql, parameters, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not ENABLED and not _scopes.get():
+            return super().executemany(sql, seq_of_parameters)
+        rows = list(seq_of_parameters)
+        return self._run("executemany", sql, rows, rows[0] if rows else ())
+
+
+def begin_request(request_id=None):
+    """Start collecting statements for the current request."""
+    _current.set(QueryLog(request_id))
+
+
+def end_request():
+    """Stop collecting and return the finished QueryLog (or None)."""
+    log = _current.get()
+    _current.set(None)
+    return log.finish() if log is not None else None
+
+
+@contextmanager
+def untraced():
+    """Leave statements in this block out of the request's log (e.g. shard migrations)."""
+    token = _current.set(None)
+    scopes = _scopes.set(())
+    try:
+        yield
+    finally:
+        _scopes.reset(scopes)
+        _current.reset(token)
+
+
+def query_budget(max_queries):
+    """Route decorator: one request to this view may run at most *max_queries* statements.
+
+    *max_queries* may also be a callable, evaluated per request, for views
+    whose statement count depends on the query string.  Apply it below
+    @login_required so the attribute is copied to the wrapper.
+    """
+    def decorator(f):
+        f.query_budget = max_queries
+        return f
+    return decorator
+
+
+def _budget_problems(log, budget):
+    problems = []
+    if budget is not None and log.count > budget:
+        problems.append(f"执行了 {log.count} 条语句，超出预算 {budget}")
+    for sql, n in log.repeated():
+        problems.append(f"疑似 N+1 查询（重复 {n} 次）: {sql}")
+    return problems
+
+
+def check_budget(log, endpoint, budget=None):
+    """Apply QUERY_BUDGET_MODE to a finished request log.
+
+    Over-budget requests and repeated statement shapes are logged in "warn"
+    mode; in "raise" mode an over-budget request raises QueryBudgetExceeded.
+    """
+    if QUERY_BUDGET_MODE == "off" or log is None:
+        return []
+    if callable(budget):
+        budget = budget()
+    problems = _budget_problems(log, budget)
+    for problem in problems:
+        logger.warning("查询预算 %s rid=%s: %s", endpoint, log.request_id or "-", problem)
+    if QUERY_BUDGET_MODE == "raise" and budget is not None and log.count > budget:
+        raise QueryBudgetExceeded(
+            f"{endpoint}: 执行了 {log.count} 条语句，超出预算 {budget}"
+        )
+    return problems
+
+
+@contextmanager
+def expect_queries(max_queries, n1_threshold=None):
+    """Test helper: fail if the block runs more than *max_queries* statements.
+
+    Counts statements on the calling thread only, so writes handed to the
+    group-commit writer thread (DB_WRITE_QUEUE) are not included.  With
+    *n1_threshold* set, a statement shape repeated that often also fails.
+    """
+    log = QueryLog()
+    token = _scopes.set(_scopes.get() + (log,))
+    try:
+        yield log
+    finally:
+        _scopes.reset(token)
+    log.finish()
+    if log.count > max_queries:
+        raise QueryBudgetExceeded(
+            f"执行了 {log.count} 条语句，超出预算 {max_queries}: "
+            + "; ".join(normalize_sql(r.sql) for r in log.statements)
+        )
+    if n1_threshold is not None:
+        repeated = log.repeated(n1_threshold)
+        if repeated:
+            raise QueryBudgetExceeded(f"疑似 N+1 查询: {repeated}")
@@ -0,0 +1,190 @@
+"""
+db_writer — single-writer thread with group commit for SQLite.
+
+Mutations are submitted as callables ``fn(conn)``.  One dedicated thread
+drains whatever has queued up since its last commit and runs the whole
+batch inside a single IMMEDIATE transaction, wrapping each callable in its
+own SAVEPOINT so one failing write does not poison its neighbours.  Every
+submitter gets a Future that resolves once the shared COMMIT succeeds.
+"""
+
+import queue
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _WriteRequest:
+    __slots__ = ("fn", "path", "future")
+
+    def __init__(self, fn, path):
+        self.fn = fn
+        self.path = path
+        self.future = Future()
+
+
+class GroupCommitWriter:
+    """Funnel write transactions through one thread, committing them in groups.
+
+    *connect* is called with a database path and must return a configured
+    connection usable from the writer thread.  At most *max_conns* of those
+    are kept open; the least recently written database is closed first.
+    """
+
+    def __init__(self, connect, max_batch=64, max_conns=64):
+        self._connect = connect
+        self.max_batch = max(1, max_batch)
+        self.max_conns = max(1, max_conns)
+        self._queue = queue.Queue()
+        self._conns = OrderedDict()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "writes": 0,
+            "failed_writes": 0,
+            "batches": 0,
+            "largest_batch": 0,
+            "commit_ms_total": 0.0,
+        }
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="db-writer", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, fn, path):
+        """Queue *fn(conn)* against the database at *path*; returns a Future."""
+        req = _WriteRequest(fn, path)
+        self._ensure_started()
+        self._queue.put(req)
+        return req.future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            stopping = False
+            while len(batch) < self.max_batch:
+                try:
+                    nxt = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    stopping = True
+                    break
+                batch.append(nxt)
+
+            by_path = {}
+            for req in batch:
+                by_path.setdefault(req.path, []).append(req)
+            for path, reqs in by_path.items():
+                self._commit_group(path, reqs)
+            if stopping:
+                break
+        for conn in self._conns.values():
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._conns.clear()
+
+    def _conn_for(self, path):
+        conn = self._conns.get(path)
+        if conn is None:
+            conn = self._connect(path)
+            self._conns[path] = conn
+            while len(self._conns) > self.max_conns:
+                _, old = self._conns.popitem(last=False)
+                try:
+                    old.close()
+                except Exception:
+                    pass
+        else:
+            self._conns.move_to_end(path)
+        return conn
+
+    def _commit_group(self, path, reqs):
+        outcomes = []
+        start = time.perf_counter()
+        try:
+            conn = self._conn_for(path)
+            conn.execute("BEGIN IMMEDIATE")
+            for i, req in enumerate(reqs):
+                if not req.future.set_running_or_notify_cancel():
+                    outcomes.append(None)
+                    continue
+                conn.execute(f"SAVEPOINT w{i}")
+                try:
+                    value = req.fn(conn)
+                except Exception as e:
+                    conn.execute(f"ROLLBACK TO w{i}")
+                    conn.execute(f"RELEASE w{i}")
+                    outcomes.append((False, e))
+                else:
+                    conn.execute(f"RELEASE w{i}")
+                    outcomes.append((True, value))
+            conn.commit()
+        except Exception as e:
+            logger.error("批量写入提交失败 (%d 个请求): %s", len(reqs), e)
+            conn = self._conns.pop(path, None)
+            if conn is not None:
+                try:
+                    conn.rollback()
+                    conn.close()
+                except Exception:
+                    pass
+            for req in reqs:
+                if not req.future.done():
+                    req.future.set_exception(e)
+            with self._stats_lock:
+                self._stats["failed_writes"] += len(reqs)
+            return
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        failed = 0
+        for req, outcome in zip(reqs, outcomes):
+            if outcome is None:
+                continue
+            ok, value = outcome
+            if ok:
+                req.future.set_result(value)
+            else:
+                failed += 1
+                req.future.set_exception(value)
+        with self._stats_lock:
+            stats = self._stats
+            stats["writes"] += len(reqs) - failed
+            stats["failed_writes"] += failed
+            stats["batches"] += 1
+            stats["largest_batch"] = max(stats["largest_batch"], len(reqs))
+            stats["commit_ms_total"] = round(stats["commit_ms_total"] + elapsed_ms, 1)
+
+    def stop(self, timeout=5):
+        """Finish queued writes, then stop the thread."""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queued"] = self._queue.qsize()
+        total = stats["writes"] + stats["failed_writes"]
+        stats["avg_batch"] = round(total / stats["batches"], 2) if stats["batches"] else 0
+        return stats
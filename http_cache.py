@@ -0,0 +1,55 @@
+"""
+http_cache — conditional GET for per-user read endpoints.
+
+A view decorated with @versioned("events", ...) answers with a strong ETag
+derived from the user's data versions (see database.DATA_VERSIONS), the
+request path and query string, and settings that change the output.  A
+request whose If-None-Match carries that ETag gets 304 Not Modified after
+a single indexed read, without running the view's queries or serializing
+JSON.
+
+Versions are read before the view runs, so a write that lands in between
+only makes the ETag older than the body, and the next request fetches it
+again.  Responses are sent with "Cache-Control: private, no-cache", which
+makes browsers revalidate every time instead of reusing them unchecked.
+"""
+
+import hashlib
+from functools import wraps
+
+from flask import request, g, make_response
+
+from config import RECURRENCE_MODE
+from database import get_user_db, data_versions, SCHEMA_VERSION
+
+_CACHE_CONTROL = "private, no-cache"
+
+
+def _etag(user_id, names, versions):
+    key = "|".join((
+        str(user_id), ",".join(names), ",".join(map(str, versions)),
+        request.full_path, RECURRENCE_MODE, str(SCHEMA_VERSION),
+    ))
+    return hashlib.sha1(key.encode()).hexdigest()[:20]
+
+
+def versioned(*names):
+    """Route decorator: 304 on If-None-Match while *names* data of the user is unchanged.
+
+    Apply it below @login_required (and @query_budget, which must count its query).
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = _etag(g.user_id, names, data_versions(get_user_db(), g.user_id, names))
+            if request.if_none_match.contains_weak(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers["Cache-Control"] = _CACHE_CONTROL
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,163 @@
+"""
+intervals — overlap detection for the planner grid.
+
+The events of one day and column are half-open intervals [start_time,
+end_time).  Sorted by start, one sweep that tracks the latest end seen so
+far splits them into groups of (transitively) overlapping events, and a
+heap of lane end times gives each event of a group the lowest free lane,
+so a day of n events costs O(n log n).  A group reports how many lanes it
+needs, which is what the grid uses to draw its events side by side.
+
+Groups are cached per user and day, for the _CACHE_USERS most recently
+active users of a web process.  Each user's entry is stamped with the
+"events" data version, a counter that triggers bump on every write to
+events and event_exceptions, so one indexed read tells whether the cached
+days are still valid, whichever process wrote.
+"""
+
+import heapq
+import threading
+from collections import OrderedDict
+
+from database import data_version, epoch_day, from_epoch_day
+from recurrence import events_between
+
+_CACHE_USERS = 256
+# Days kept per user before that user's entry starts over.
+_MAX_DAYS = 1000
+# Missing days at most this far apart are loaded by one range query.
+_LOAD_GAP = 31
+
+
+def _group(events):
+    """Lane assignment for one group of overlapping events sorted by start."""
+    free, busy, lanes = [], [], 0
+    members = []
+    for e in events:
+        while busy and busy[0][0] <= e["start_time"]:
+            heapq.heappush(free, heapq.heappop(busy)[1])
+        if free:
+            lane = heapq.heappop(free)
+        else:
+            lane, lanes = lanes, lanes + 1
+        heapq.heappush(busy, (e["end_time"], lane))
+        members.append({
+            "id": e["id"], "title": e["title"],
+            "start_time": e["start_time"], "end_time": e["end_time"], "lane": lane,
+        })
+    return {
+        "date": events[0]["date"],
+        "col_type": events[0].get("col_type") or "plan",
+        "start_time": events[0]["start_time"],
+        "end_time": max(e["end_time"] for e in events),
+        "lanes": lanes,
+        "events": members,
+    }
+
+
+def overlap_groups(events):
+    """Groups of two or more overlapping *events* (dicts of one day and column), in time order."""
+    groups, current, reach = [], [], None
+    for e in sorted(events, key=lambda e: (e["start_time"], e["end_time"])):
+        if current and e["start_time"] >= reach:
+            if len(current) > 1:
+                groups.append(_group(current))
+            current = []
+        if not current:
+            reach = e["end_time"]
+        current.append(e)
+        reach = max(reach, e["end_time"])
+    if len(current) > 1:
+        groups.append(_group(current))
+    return groups
+
+
+def conflicts_by_day(events):
+    """{date: overlap groups of every column} for *events* of any days."""
+    columns = {}
+    for e in events:
+        columns.setdefault((e["date"], e.get("col_type") or "plan"), []).append(e)
+    days = {}
+    for (day, _), column in sorted(columns.items()):
+        days.setdefault(day, []).extend(overlap_groups(column))
+    return days
+
+
+class ConflictCache:
+    """LRU of per-user {date: groups}, valid while the user's events version is unchanged."""
+
+    def __init__(self, capacity=_CACHE_USERS):
+        self.capacity = max(1, capacity)
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0}
+
+    def groups(self, conn, user_id, dates):
+        """Overlap groups on *dates* (YYYY-MM-DD strings), in date order."""
+        dates = sorted(set(dates))
+        version = data_version(conn, user_id, "events")
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry[0] == version:
+                self._users.move_to_end(user_id)
+                cached = entry[1]
+            else:
+                cached = {}
+            found = {d: cached[d] for d in dates if d in cached}
+            missing = [d for d in dates if d not in found]
+            self._counters["hits"] += len(found)
+            self._counters["misses"] += len(missing)
+
+        computed = {}
+        for first, last in _runs(missing):
+            loaded = conflicts_by_day(events_between(conn, user_id, first, last))
+            for n in range(epoch_day(first), epoch_day(last) + 1):
+                day = from_epoch_day(n)
+                computed[day] = loaded.get(day, [])
+        if computed:
+            with self._lock:
+                entry = self._users.get(user_id)
+                if entry is None or entry[0] != version or len(entry[1]) > _MAX_DAYS:
+                    entry = self._users[user_id] = (version, {})
+                entry[1].update(computed)
+                self._users.move_to_end(user_id)
+                while len(self._users) > self.capacity:
+                    self._users.popitem(last=False)
+            found.update(computed)
+        return [group for d in dates for group in found[d]]
+
+    def stats(self):
+        with self._lock:
+            return {"users": len(self._users), "capacity": self.capacity, **self._counters}
+
+
+def _runs(dates):
+    """Split sorted *dates* into (first, last) ranges, merging gaps up to _LOAD_GAP days."""
+    runs = []
+    for d in dates:
+        n = epoch_day(d)
+        if runs and n - runs[-1][2] <= _LOAD_GAP:
+            runs[-1][1], runs[-1][2] = d, n
+        else:
+            runs.append([d, d, n])
+    return [(first, last) for first, last, _ in runs]
+
+
+_cache = ConflictCache()
+
+
+def conflicts_between(conn, user_id, start, end):
+    """Overlap groups of *user_id*'s events from *start* to *end* (inclusive)."""
+    first = epoch_day(start)
+    return _cache.groups(
+        conn, user_id, [from_epoch_day(first + i) for i in range(epoch_day(end) - first + 1)]
+    )
+
+
+def conflicts_on(conn, user_id, dates):
+    """Overlap groups on the given dates, e.g. the days a write touched."""
+    return _cache.groups(conn, user_id, [d for d in dates if d])
+
+
+def conflict_cache_stats():
+    return _cache.stats()
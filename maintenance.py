@@ -0,0 +1,289 @@
+"""
+maintenance — background scheduler for database housekeeping.
+
+Jobs (optimize, backup, verification-code cleanup, trash purge, archiving,
+change-log compaction) run on a daemon thread started by app.py, or in a
+standalone sidecar process:
+
+    MAINTENANCE_ENABLED=false gunicorn ... app:app   # workers skip the thread
+    python maintenance.py                            # sidecar runs the jobs
+
+Every job run is guarded by a non-blocking lock file plus a last-run stamp
+in MAINTENANCE_DIR, so when several workers each run a scheduler a given
+slot still executes exactly once.
+"""
+
+import os
+import random
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from config import DB_SHARDING, MAINTENANCE_DIR, MAINTENANCE_JITTER, MAINTENANCE_SCHEDULE
+from database import (
+    file_lock, optimize_db, backup_db, backup_shards, cleanup_verification_codes,
+    purge_trash,
+)
+from archive import run_archive
+from sync import compact_change_log
+from metrics import record_job
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_cron_field(field, lo, hi):
+    values = set()
+    for part in field.split(","):
+        step = 1
+        if "/" in part:
+            part, step_str = part.split("/", 1)
+            step = int(step_str)
+            if step < 1:
+                raise ValueError(f"无效的 cron 步长: {field!r}")
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            a, b = part.split("-", 1)
+            start, end = int(a), int(b)
+        else:
+            start = int(part)
+            end = hi if step > 1 else start
+        if start < lo or end > hi or start > end:
+            raise ValueError(f"cron 字段超出范围: {field!r}")
+        values.update(range(start, end + 1, step))
+    return sorted(values)
+
+
+class CronSchedule:
+    """Five-field cron expression: minute hour day-of-month month day-of-week.
+
+    Supports ``*``, lists, ranges and steps.  Day-of-week uses 0 (or 7) for
+    Sunday; as in cron, when both day fields are restricted either may match.
+    """
+
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron 表达式需要 5 个字段: {expr!r}")
+        self.expr = expr
+        self.minutes = _parse_cron_field(fields[0], 0, 59)
+        self.hours = _parse_cron_field(fields[1], 0, 23)
+        self.days = set(_parse_cron_field(fields[2], 1, 31))
+        self.months = set(_parse_cron_field(fields[3], 1, 12))
+        self.weekdays = {d % 7 for d in _parse_cron_field(fields[4], 0, 7)}
+        self._any_day = fields[2] == "*"
+        self._any_weekday = fields[4] == "*"
+
+    def _day_matches(self, day):
+        in_dom = day.day in self.days
+        in_dow = (day.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_dom and in_dow
+        return in_dom or in_dow
+
+    def next_after(self, dt):
+        """Return the first firing time strictly after *dt*."""
+        start = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        for _ in range(366 * 5):
+            if day.month in self.months and self._day_matches(day):
+                for hour in self.hours:
+                    if day == start.date() and hour < start.hour:
+                        continue
+                    for minute in self.minutes:
+                        candidate = datetime(day.year, day.month, day.day, hour, minute)
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+        raise ValueError(f"cron 表达式永远不会触发: {self.expr!r}")
+
+
+class Job:
+    """A named maintenance task with a cron schedule and timing statistics."""
+
+    def __init__(self, name, schedule, func):
+        self.name = name
+        self.schedule = schedule if isinstance(schedule, CronSchedule) else CronSchedule(schedule)
+        self.func = func
+        self.slot = None
+        self.due = None
+        self.stats = {
+            "runs": 0,
+            "failures": 0,
+            "skipped": 0,
+            "last_run": None,
+            "last_duration_ms": None,
+            "total_duration_ms": 0.0,
+            "last_error": None,
+            "next_run": None,
+        }
+
+
+class MaintenanceScheduler:
+    """Run *jobs* on a background thread without ever blocking a request."""
+
+    def __init__(self, jobs, state_dir=MAINTENANCE_DIR, jitter=MAINTENANCE_JITTER):
+        self.jobs = list(jobs)
+        self.state_dir = state_dir
+        self.jitter = max(0, jitter)
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _plan(self, job, now):
+        job.slot = job.schedule.next_after(now)
+        job.due = job.slot + timedelta(seconds=random.uniform(0, self.jitter))
+        job.stats["next_run"] = job.due.strftime("%Y-%m-%d %H:%M:%S")
+
+    def _stamp_path(self, job):
+        return os.path.join(self.state_dir, f"{job.name}.last")
+
+    def _read_stamp(self, job):
+        try:
+            with open(self._stamp_path(job), "r") as f:
+                return float(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0.0
+
+    def _write_stamp(self, job, value):
+        path = self._stamp_path(job)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(repr(value))
+        os.replace(tmp, path)
+
+    def run_job(self, job, slot=None):
+        """Run *job* for *slot* unless another process already claimed it."""
+        slot_ts = (slot or datetime.now()).timestamp()
+        os.makedirs(self.state_dir, exist_ok=True)
+        lock_path = os.path.join(self.state_dir, f"{job.name}.lock")
+        with file_lock(lock_path, blocking=False) as acquired:
+            if not acquired or self._read_stamp(job) >= slot_ts:
+                with self._lock:
+                    job.stats["skipped"] += 1
+                return False
+
+            error = None
+            start = time.perf_counter()
+            try:
+                job.func()
+            except Exception as e:
+                error = e
+                logger.exception("维护任务 %s 执行失败", job.name)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self._write_stamp(job, slot_ts)
+        record_job(job.name, elapsed_ms / 1000, failed=error is not None)
+
+        with self._lock:
+            stats = job.stats
+            stats["runs"] += 1
+            stats["last_run"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            stats["last_duration_ms"] = round(elapsed_ms, 1)
+            stats["total_duration_ms"] = round(stats["total_duration_ms"] + elapsed_ms, 1)
+            if error is not None:
+                stats["failures"] += 1
+                stats["last_error"] = str(error)
+        logger.info("维护任务 %s 完成，用时 %.1fms", job.name, elapsed_ms)
+        return error is None
+
+    def run_forever(self):
+        now = datetime.now()
+        for job in self.jobs:
+            self._plan(job, now)
+        while not self._stop.is_set():
+            now = datetime.now()
+            for job in self.jobs:
+                if job.due <= now:
+                    self.run_job(job, job.slot)
+                    self._plan(job, datetime.now())
+            next_due = min(job.due for job in self.jobs)
+            wait = (next_due - datetime.now()).total_seconds()
+            self._stop.wait(min(max(wait, 0.5), 60))
+
+    def start(self):
+        if self._thread is not None or not self.jobs:
+            return
+        self._thread = threading.Thread(
+            target=self.run_forever, name="maintenance", daemon=True
+        )
+        self._thread.start()
+        logger.info("维护调度器已启动: %s", ", ".join(j.name for j in self.jobs))
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                job.name: {"schedule": job.schedule.expr, **job.stats}
+                for job in self.jobs
+            }
+
+
+def _backup():
+    if backup_db() is None:
+        raise RuntimeError("数据库备份失败")
+    if DB_SHARDING:
+        backup_shards()
+
+
+_JOB_FUNCS = {
+    "optimize": optimize_db,
+    "backup": _backup,
+    "cleanup_codes": cleanup_verification_codes,
+    "purge_trash": purge_trash,
+    "archive": run_archive,
+    "compact_changes": compact_change_log,
+}
+
+
+def default_jobs():
+    """Build the standard job list from MAINTENANCE_SCHEDULE (empty cron disables a job)."""
+    return [
+        Job(name, expr, _JOB_FUNCS[name])
+        for name, expr in MAINTENANCE_SCHEDULE.items()
+        if expr and name in _JOB_FUNCS
+    ]
+
+
+_scheduler = None
+
+
+def start_scheduler():
+    """Start the process-wide scheduler thread (idempotent)."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = MaintenanceScheduler(default_jobs())
+        _scheduler.start()
+    return _scheduler
+
+
+def stop_scheduler():
+    if _scheduler is not None:
+        _scheduler.stop()
+
+
+def scheduler_stats():
+    return _scheduler.stats() if _scheduler is not None else {}
+
+
+if __name__ == "__main__":
+    from config import LOG_LEVEL
+    from database import init_db
+
+    logging.basicConfig(
+        level=getattr(logging, LOG_LEVEL, logging.INFO),
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    init_db()
+    scheduler = MaintenanceScheduler(default_jobs())
+    logger.info("维护调度器以独立进程运行")
+    try:
+        scheduler.run_forever()
+    except KeyboardInterrupt:
+        pass
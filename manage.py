@@ -0,0 +1,125 @@
+"""
+manage — command-line maintenance tasks for the planner database.
+
+    python manage.py split-shards [--user ID] [--purge]
+    python manage.py backup-user ID [--output FILE]
+    python manage.py restore-user ID FILE
+    python manage.py archive [--days N]
+    python manage.py fts-rebuild
+"""
+
+import sys
+import argparse
+import logging
+
+from config import LOG_LEVEL, DB_SHARDING, ARCHIVE_AFTER_DAYS
+from database import (
+    init_db, get_db_direct, split_user_to_shard, backup_shard, restore_shard,
+    rebuild_search_index, search_tokenizer,
+)
+from archive import run_archive
+
+logger = logging.getLogger("manage")
+
+
+def cmd_split_shards(args):
+    """Copy each user's rows from the monolithic database into their own shard."""
+    if args.user:
+        user_ids = [args.user]
+    else:
+        conn = get_db_direct()
+        try:
+            user_ids = [row["id"] for row in conn.execute("SELECT id FROM users ORDER BY id")]
+        finally:
+            conn.close()
+
+    failed = 0
+    for user_id in user_ids:
+        try:
+            counts = split_user_to_shard(user_id, purge=args.purge)
+        except ValueError as e:
+            logger.warning("跳过: %s", e)
+            continue
+        except Exception as e:
+            failed += 1
+            logger.error("用户 %d 拆分失败: %s", user_id, e)
+            continue
+        logger.info(
+            "用户 %d 已拆分: %s", user_id,
+            ", ".join(f"{table}={n}" for table, n in counts.items() if n),
+        )
+    if not DB_SHARDING:
+        logger.info("拆分完成后设置 DB_SHARDING=true 并重启服务以启用分片存储")
+    return 1 if failed else 0
+
+
+def cmd_backup_user(args):
+    path = backup_shard(args.user_id, args.output)
+    logger.info("用户 %d 分片已备份到 %s", args.user_id, path)
+    return 0
+
+
+def cmd_restore_user(args):
+    restore_shard(args.user_id, args.file)
+    logger.info("用户 %d 分片已从 %s 恢复", args.user_id, args.file)
+    return 0
+
+
+def cmd_archive(args):
+    if args.days <= 0:
+        logger.error("未启用归档：请设置 ARCHIVE_AFTER_DAYS 或使用 --days 指定天数")
+        return 1
+    moved = run_archive(args.days)
+    logger.info("归档完成: %d 条记录移入归档表", moved)
+    return 0
+
+
+def cmd_fts_rebuild(args):
+    rebuilt = rebuild_search_index()
+    logger.info("全文索引已重建: %d 个数据库, 分词器 %s", rebuilt, search_tokenizer())
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Schedule Planner 管理工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("split-shards", help="将单库数据拆分为按用户的分片")
+    p.add_argument("--user", type=int, help="只拆分指定用户")
+    p.add_argument("--purge", action="store_true", help="拆分后从主库删除已复制的数据")
+    p.set_defaults(func=cmd_split_shards)
+
+    p = sub.add_parser("backup-user", help="备份单个用户的分片")
+    p.add_argument("user_id", type=int)
+    p.add_argument("--output", help="备份文件路径（默认写入 backups/shards/）")
+    p.set_defaults(func=cmd_backup_user)
+
+    p = sub.add_parser("restore-user", help="从备份文件恢复单个用户的分片")
+    p.add_argument("user_id", type=int)
+    p.add_argument("file")
+    p.set_defaults(func=cmd_restore_user)
+
+    p = sub.add_parser("archive", help="将旧日程与计时记录移入归档表")
+    p.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS,
+                   help=f"归档早于多少天的数据（默认 {ARCHIVE_AFTER_DAYS}）")
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser("fts-rebuild", help="按当前 SEARCH_TOKENIZER 重建全文搜索索引")
+    p.set_defaults(func=cmd_fts_rebuild)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=getattr(logging, LOG_LEVEL, logging.INFO),
+        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    init_db()
+    try:
+        return args.func(args)
+    except (OSError, ValueError) as e:
+        logger.error("%s", e)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+metrics — Prometheus text-format metrics with multi-process aggregation.
+
+Each process keeps its counters, gauges and histograms in memory.  With
+METRICS_ENABLED and METRICS_DIR set, every process also dumps a snapshot to
+METRICS_DIR/<pid>.json at most every METRICS_FLUSH_INTERVAL seconds, and
+/metrics merges all snapshots so gunicorn workers report as one service:
+
+    counters, histograms  summed over every file (including exited workers)
+    gauges                summed over files refreshed recently (live workers)
+
+Snapshots untouched for a day are removed during a scrape.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+from config import METRICS_ENABLED, METRICS_DIR, METRICS_FLUSH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+_JOB_BUCKETS = (0.1, 0.5, 1, 5, 15, 60, 300, 900, 3600)
+_SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+_COUNT_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250, 1000, 5000)
+
+# name -> (type, help, buckets)
+METRICS = {
+    "planner_http_requests_total": (
+        "counter", "HTTP requests by endpoint, method and status.", None),
+    "planner_http_request_duration_seconds": (
+        "histogram", "Request latency by endpoint.", _LATENCY_BUCKETS),
+    "planner_http_requests_in_flight": (
+        "gauge", "Requests currently being handled.", None),
+    "planner_http_response_bytes": (
+        "histogram", "Response body size by endpoint.", _SIZE_BUCKETS),
+    "planner_http_rate_limited_total": (
+        "counter", "Requests rejected by the rate limiter.", None),
+    "planner_db_time_seconds": (
+        "histogram", "SQL time spent per request by endpoint.", _LATENCY_BUCKETS),
+    "planner_db_queries": (
+        "histogram", "SQL statements executed per request by endpoint.", _COUNT_BUCKETS),
+    "planner_db_rows_total": (
+        "counter", "Rows returned or changed by SQL statements, by endpoint.", None),
+    "planner_maintenance_job_duration_seconds": (
+        "histogram", "Maintenance job run time.", _JOB_BUCKETS),
+    "planner_maintenance_job_failures_total": (
+        "counter", "Maintenance job runs that raised.", None),
+    "planner_storage_operation_duration_seconds": (
+        "histogram", "File-storage backend call latency.", _LATENCY_BUCKETS),
+    "planner_storage_errors_total": (
+        "counter", "File-storage backend calls that raised.", None),
+    "planner_regex_searches_total": (
+        "counter", "Regex searches by outcome (ok, truncated, timeout, busy, error).", None),
+    "planner_regex_search_duration_seconds": (
+        "histogram", "Regex search run time in the sandbox workers.", _LATENCY_BUCKETS),
+    "planner_regex_workers_killed_total": (
+        "counter", "Regex sandbox workers killed after a timeout or failure.", None),
+    "planner_stream_connections": (
+        "gauge", "Open live-update (SSE) connections.", None),
+    "planner_stream_events_total": (
+        "counter", "Live-update events sent, by type (change, reset).", None),
+}
+
+_STALE_GAUGE_AFTER = 3
+_REMOVE_AFTER = 86400
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+class Registry:
+    """In-memory metric values for one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}  # key -> [bucket counts..., +Inf count, sum]
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge_add(self, name, delta, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.gauges[key] = self.gauges.get(key, 0) + delta
+
+    def observe(self, name, value, **labels):
+        buckets = METRICS[name][2]
+        key = _key(name, labels)
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    h[i] += 1
+                    break
+            else:
+                h[len(buckets)] += 1
+            h[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": [[n, list(map(list, l)), v] for (n, l), v in self.counters.items()],
+                "gauges": [[n, list(map(list, l)), v] for (n, l), v in self.gauges.items()],
+                "histograms": [[n, list(map(list, l)), list(h)]
+                               for (n, l), h in self.histograms.items()],
+            }
+
+
+_registry = Registry()
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+inc = _registry.inc
+gauge_add = _registry.gauge_add
+observe = _registry.observe
+
+
+def _snapshot_path(pid=None):
+    return os.path.join(METRICS_DIR, f"{pid or os.getpid()}.json")
+
+
+def flush(force=False):
+    """Write this process's snapshot to METRICS_DIR (rate-limited unless *force*)."""
+    global _last_flush
+    if not METRICS_ENABLED or not METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < METRICS_FLUSH_INTERVAL:
+        return
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _last_flush = now
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = _snapshot_path()
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(_registry.snapshot(), f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("写入指标快照失败: %s", e)
+    finally:
+        _flush_lock.release()
+
+
+def _load_snapshots():
+    """Return snapshots of every process, this one read from memory."""
+    own = _registry.snapshot()
+    if not METRICS_DIR:
+        return [(own, True)]
+    snapshots = [(own, True)]
+    own_name = os.path.basename(_snapshot_path())
+    now = time.time()
+    stale_gauge = max(METRICS_FLUSH_INTERVAL * _STALE_GAUGE_AFTER, 30)
+    try:
+        names = os.listdir(METRICS_DIR)
+    except OSError:
+        return snapshots
+    for fname in names:
+        if not fname.endswith(".json") or fname == own_name:
+            continue
+        path = os.path.join(METRICS_DIR, fname)
+        try:
+            age = now - os.path.getmtime(path)
+            if age > _REMOVE_AFTER:
+                os.remove(path)
+                continue
+            with open(path, "r") as f:
+                snapshots.append((json.load(f), age <= stale_gauge))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _merge(snapshots):
+    counters, gauges, histograms = {}, {}, {}
+    for snap, live in snapshots:
+        for name, labels, value in snap.get("counters", ()):
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        if live:
+            for name, labels, value in snap.get("gauges", ()):
+                key = (name, tuple(map(tuple, labels)))
+                gauges[key] = gauges.get(key, 0) + value
+        for name, labels, h in snap.get("histograms", ()):
+            if name not in METRICS or len(h) != len(METRICS[name][2]) + 2:
+                continue
+            key = (name, tuple(map(tuple, labels)))
+            acc = histograms.setdefault(key, [0] * len(h))
+            for i, v in enumerate(h):
+                acc[i] += v
+    return counters, gauges, histograms
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs, extra=None):
+    pairs = list(pairs) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return repr(round(value, 6))
+    return str(value)
+
+
+def render():
+    """Return all metrics, aggregated across processes, in Prometheus text format."""
+    flush(force=True)
+    counters, gauges, histograms = _merge(_load_snapshots())
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "counter":
+            for (n, labels), v in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{name}{_labels(labels)} {_fmt(v)}")
+        elif kind == "gauge":
+            for (n, labels), v in sorted(gauges.items()):
+                if n == name:
+                    lines.append(f"{name}{_labels(labels)} {_fmt(v)}")
+        else:
+            for (n, labels), h in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, h):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, ('le', bound))} {cumulative}")
+                cumulative += h[len(buckets)]
+                lines.append(f"{name}_bucket{_labels(labels, ('le', '+Inf'))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_fmt(h[-1])}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+def record_request(blueprint, endpoint, method, status, seconds, size, sql=None):
+    """Record one finished HTTP request."""
+    inc("planner_http_requests_total", endpoint=endpoint, method=method, status=str(status))
+    observe("planner_http_request_duration_seconds", seconds, blueprint=blueprint, endpoint=endpoint)
+    if size is not None:
+        observe("planner_http_response_bytes", size, endpoint=endpoint)
+    if sql is not None:
+        observe("planner_db_time_seconds", sql.total_ms / 1000, endpoint=endpoint)
+        observe("planner_db_queries", sql.count, endpoint=endpoint)
+        if sql.rows:
+            inc("planner_db_rows_total", sql.rows, endpoint=endpoint)
+    flush()
+
+
+def record_job(name, seconds, failed=False):
+    """Record one maintenance job run."""
+    observe("planner_maintenance_job_duration_seconds", seconds, job=name)
+    if failed:
+        inc("planner_maintenance_job_failures_total", job=name)
+    flush()
+
+
+def shutdown():
+    """Drop this process's gauge contribution on exit, keeping its counters."""
+    if not METRICS_ENABLED or not METRICS_DIR:
+        return
+    with _registry._lock:
+        _registry.gauges.clear()
+    flush(force=True)
@@ -0,0 +1,150 @@
+"""
+profiler — opt-in sampling profiler for individual requests.
+
+A profiled request gets a background thread that reads the request
+thread's stack from sys._current_frames() every PROFILE_INTERVAL_MS.  Nothing
+is hooked into the interpreter, so unprofiled requests pay nothing and
+profiled ones pay only for the sampling thread.
+
+Requests are profiled at random with probability PROFILE_SAMPLE_RATE, or on
+demand when they carry ``X-Profile: <PROFILE_TOKEN>``.  Each profile is
+written in collapsed-stack format (one ``frame;frame;frame count`` line per
+distinct stack, readable by flamegraph.pl and speedscope) to
+
+    PROFILE_DIR/<endpoint>/<YYYYmmdd-HHMMSS>_<request_id>.folded
+
+and only the newest PROFILE_MAX_FILES files are kept.
+"""
+
+import os
+import sys
+import random
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from config import (
+    BASE_DIR, PROFILE_SAMPLE_RATE, PROFILE_TOKEN, PROFILE_DIR,
+    PROFILE_INTERVAL_MS, PROFILE_MAX_FILES,
+)
+
+logger = logging.getLogger(__name__)
+
+ENABLED = PROFILE_SAMPLE_RATE > 0 or bool(PROFILE_TOKEN)
+
+_rotate_lock = threading.Lock()
+
+
+def _frame_name(code):
+    path = code.co_filename
+    if path.startswith(BASE_DIR):
+        path = os.path.relpath(path, BASE_DIR)
+    else:
+        # Keep the package directory so flask/app.py and app.py stay distinct.
+        path = "/".join(path.replace(os.sep, "/").rsplit("/", 2)[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class Sampler:
+    """Collect stack samples of one thread until stop() is called."""
+
+    def __init__(self, thread_id, interval_ms=PROFILE_INTERVAL_MS):
+        self.thread_id = thread_id
+        self.interval = max(interval_ms, 1) / 1000
+        self.samples = Counter()
+        self.started = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self):
+        names = {}
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = names.get(code)
+                if name is None:
+                    name = names[code] = _frame_name(code)
+                stack.append(name)
+                frame = frame.f_back
+            stack.reverse()
+            self.samples[";".join(stack)] += 1
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+        return self.samples
+
+
+def should_profile(headers):
+    """Return True if the current request should be profiled."""
+    if PROFILE_TOKEN and headers.get("X-Profile") == PROFILE_TOKEN:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_request_profile(headers):
+    """Start sampling the calling thread if this request is selected, else return None."""
+    if not ENABLED or not should_profile(headers):
+        return None
+    return Sampler(threading.get_ident()).start()
+
+
+def _safe_name(value):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in value)[:80] or "unknown"
+
+
+def _rotate(directory, keep):
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if name.endswith(".folded"):
+                path = os.path.join(root, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    pass
+    files.sort()
+    for _, path in files[:max(len(files) - keep, 0)]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def write_profile(sampler, endpoint, request_id, directory=PROFILE_DIR):
+    """Stop *sampler* and write its samples; returns the file path or None."""
+    samples = sampler.stop()
+    if not samples:
+        return None
+    folder = os.path.join(directory, _safe_name(endpoint))
+    path = os.path.join(
+        folder,
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{_safe_name(request_id or '')}.folded",
+    )
+    try:
+        os.makedirs(folder, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        with _rotate_lock:
+            _rotate(directory, PROFILE_MAX_FILES)
+    except OSError as e:
+        logger.warning("写入性能剖析文件失败: %s", e)
+        return None
+    logger.info("性能剖析 %s rid=%s: %d 个样本, %.1fms -> %s",
+                endpoint, request_id, sum(samples.values()),
+                sampler.elapsed * 1000, path)
+    return path
@@ -0,0 +1,635 @@
+"""
+recurrence — read-time expansion of recurring events.
+
+A series is its parent row in events (recur_rule set, col_type 'plan'); the
+parent itself is the first occurrence.  With RECURRENCE_MODE=virtual the
+later occurrences are never stored: expand_occurrences() computes them for
+the requested range and returns rows shaped like events rows, with string
+ids of the form ``r<parent_id>-<YYYYMMDD>``.
+
+Only departures from the rule are stored, in event_exceptions:
+
+    (parent_id, date, event_id)    occurrence replaced by a concrete row
+    (parent_id, date, NULL)        occurrence deleted
+
+Editing a virtual occurrence materializes it (materialize_occurrence) and
+the edit then applies to the concrete row; deleting one records a
+cancellation (cancel_occurrence).  Child rows created by the old
+materializing mode also suppress the virtual occurrence on their date.
+
+With RECURRENCE_MODE=materialize, plan_instances()/store_instances() insert
+the child rows for a range in one statement.  A unique index on
+(user_id, recur_parent_id, date, col_type) makes the insert idempotent and
+recurrence_horizons records how far each series has been stored, so a
+range that is already covered costs one indexed query.
+"""
+
+import re
+from datetime import datetime, timedelta
+
+from config import RECURRENCE_MODE
+from archive import archive_boundary, events_source
+from database import epoch_day, row_dict
+from rrule import compile_rule, split_rule
+
+_VIRTUAL_ID_RE = re.compile(r"^r(\d+)-(\d{8})$")
+# Most occurrences of one series returned by a single expansion.
+_EXPAND_LIMIT = 366
+
+_INSTANCE_COLUMNS = """(user_id, title, description, date, start_time, end_time,
+    color, category, priority, col_type, recur_parent_id)"""
+_INSTANCE_VALUES = "(?, ?, ?, ?, ?, ?, ?, ?, ?, 'plan', ?)"
+
+_TRASH_SERIES_ROWS = """INSERT INTO deleted_events (user_id, original_id, title, description, date,
+    start_time, end_time, color, category, priority, completed, col_type)
+    SELECT user_id, id, title, description, date, start_time, end_time, color,
+    category, priority, completed, col_type FROM events"""
+
+_CANCEL_OCCURRENCE = """INSERT INTO event_exceptions (user_id, parent_id, date, event_id)
+    VALUES (?, ?, ?, NULL)
+    ON CONFLICT(parent_id, date) DO UPDATE SET event_id=NULL"""
+
+
+def virtual_id(parent_id, date_str):
+    return f"r{parent_id}-{date_str.replace('-', '')}"
+
+
+def parse_virtual_id(value):
+    """Return (parent_id, 'YYYY-MM-DD') for a virtual occurrence id, else None."""
+    m = _VIRTUAL_ID_RE.match(str(value))
+    if not m:
+        return None
+    raw = m.group(2)
+    return int(m.group(1)), f"{raw[:4]}-{raw[4:6]}-{raw[6:]}"
+
+
+def _parse(date_str):
+    return datetime.strptime(date_str, "%Y-%m-%d").date()
+
+
+def _format(d):
+    return d.strftime("%Y-%m-%d")
+
+
+def _series(parent):
+    """Compiled recurrence of a series parent row, or None if its rule is invalid."""
+    try:
+        return compile_rule(parent["recur_rule"], parent["date"])
+    except ValueError:
+        return None
+
+
+def _occurrence_row(parent, date_str):
+    row = row_dict(parent)
+    row["id"] = virtual_id(parent["id"], date_str)
+    row["date"] = date_str
+    row["recur_rule"] = None
+    row["recur_parent_id"] = parent["id"]
+    row["completed"] = 0
+    row["virtual"] = True
+    return row
+
+
+def expand_occurrences(conn, user_id, start, end, covered=()):
+    """Virtual occurrences of *user_id*'s series between *start* and *end* (inclusive).
+
+    *covered* is an iterable of (parent_id, date) pairs already represented
+    by concrete rows the caller fetched (e.g. legacy materialized children).
+    """
+    parents = conn.execute(
+        """SELECT * FROM events
+           WHERE user_id=? AND recur_rule IS NOT NULL AND date <= ? AND col_type='plan'""",
+        (user_id, end),
+    ).fetchall()
+    if not parents:
+        return []
+    skip = set(covered)
+    skip.update(
+        (r[0], r[1]) for r in conn.execute(
+            "SELECT parent_id, date FROM event_exceptions WHERE user_id=? AND date BETWEEN ? AND ?",
+            (user_id, start, end),
+        )
+    )
+    start_d, end_d = _parse(start), _parse(end)
+    rows = []
+    for parent in parents:
+        series = _series(parent)
+        if series is None:
+            continue
+        for d in series.between(start_d, end_d, _EXPAND_LIMIT):
+            ds = _format(d)
+            if (parent["id"], ds) not in skip:
+                rows.append(_occurrence_row(parent, ds))
+    return rows
+
+
+def merge_occurrences(rows, occurrences):
+    """Merge concrete *rows* (dicts) and virtual *occurrences* in (date, start_time) order."""
+    if not occurrences:
+        return rows
+    return sorted(rows + occurrences, key=lambda r: (r["date"], r["start_time"]))
+
+
+def events_between(conn, user_id, start, end):
+    """Events of *user_id* dated *start*..*end* as dicts, virtual occurrences included."""
+    events = [row_dict(e) for e in conn.execute(
+        f"SELECT * FROM {events_source(conn, user_id, start)} "
+        "WHERE user_id=? AND date >= ? AND date <= ? ORDER BY date, start_time",
+        (user_id, start, end),
+    )]
+    if RECURRENCE_MODE == "virtual":
+        covered = {(e["recur_parent_id"], e["date"]) for e in events if e["recur_parent_id"]}
+        events = merge_occurrences(events, expand_occurrences(conn, user_id, start, end, covered))
+    return events
+
+
+def occurrence_dates(conn, user_id, start, end):
+    """Dates in [start, end] that have at least one virtual occurrence."""
+    return {row["date"] for row in expand_occurrences(conn, user_id, start, end)}
+
+
+def _load_occurrence(conn, user_id, parent_id, date_str):
+    """Return (parent row, exception row or None) if *date_str* is an occurrence, else (None, None)."""
+    parent = conn.execute(
+        """SELECT * FROM events WHERE id=? AND user_id=? AND recur_rule IS NOT NULL
+           AND col_type='plan'""",
+        (parent_id, user_id),
+    ).fetchone()
+    series = _series(parent) if parent is not None else None
+    if series is None:
+        return None, None
+    try:
+        day = _parse(date_str)
+    except ValueError:
+        return None, None
+    if not series.includes(day):
+        return None, None
+    exc = conn.execute(
+        "SELECT event_id FROM event_exceptions WHERE parent_id=? AND date=?",
+        (parent_id, date_str),
+    ).fetchone()
+    return parent, exc
+
+
+def get_occurrence(conn, user_id, value):
+    """Return the virtual occurrence row for id *value*, or None if it does not exist."""
+    parsed = parse_virtual_id(value)
+    if parsed is None:
+        return None
+    parent, exc = _load_occurrence(conn, user_id, *parsed)
+    if parent is None or exc is not None:
+        return None
+    return _occurrence_row(parent, parsed[1])
+
+
+def materialize_occurrence(conn, user_id, value):
+    """Store virtual occurrence *value* as a concrete child row; returns its id or None.
+
+    Runs inside the caller's transaction.  If the occurrence was already
+    materialized the existing row id is returned.
+    """
+    parsed = parse_virtual_id(value)
+    if parsed is None:
+        return None
+    parent_id, date_str = parsed
+    parent, exc = _load_occurrence(conn, user_id, parent_id, date_str)
+    if parent is None:
+        return None
+    if exc is not None:
+        return exc["event_id"]
+    cur = conn.execute(
+        f"INSERT OR IGNORE INTO events {_INSTANCE_COLUMNS} VALUES {_INSTANCE_VALUES}",
+        _instance_params(user_id, parent, date_str),
+    )
+    if cur.rowcount:
+        new_id = cur.lastrowid
+    else:
+        # A child stored by materializing mode already holds this date.
+        new_id = conn.execute(
+            """SELECT id FROM events WHERE user_id=? AND recur_parent_id=? AND date=?
+               AND col_type='plan'""",
+            (user_id, parent_id, date_str),
+        ).fetchone()[0]
+    conn.execute(
+        "INSERT INTO event_exceptions (user_id, parent_id, date, event_id) VALUES (?, ?, ?, ?)",
+        (user_id, parent_id, date_str, new_id),
+    )
+    return new_id
+
+
+def _load_occurrences(conn, user_id, refs):
+    """Batched _load_occurrence: {ref: (parent row, date, exception row or None)} for valid refs."""
+    parsed = {ref: parse_virtual_id(ref) for ref in refs}
+    parsed = {ref: p for ref, p in parsed.items() if p is not None}
+    if not parsed:
+        return {}
+    parent_ids = sorted({p[0] for p in parsed.values()})
+    dates = sorted({p[1] for p in parsed.values()})
+    pmarks, dmarks = ",".join("?" * len(parent_ids)), ",".join("?" * len(dates))
+    parents = {row["id"]: row for row in conn.execute(
+        f"""SELECT * FROM events WHERE user_id=? AND recur_rule IS NOT NULL AND col_type='plan'
+            AND id IN ({pmarks})""",
+        (user_id, *parent_ids),
+    )}
+    exceptions = {(row["parent_id"], row["date"]): row for row in conn.execute(
+        f"""SELECT parent_id, date, event_id FROM event_exceptions
+            WHERE user_id=? AND parent_id IN ({pmarks}) AND date IN ({dmarks})""",
+        (user_id, *parent_ids, *dates),
+    )}
+    found = {}
+    for ref, (parent_id, date_str) in parsed.items():
+        parent = parents.get(parent_id)
+        series = _series(parent) if parent is not None else None
+        if series is None or not series.includes(_parse(date_str)):
+            continue
+        found[ref] = (parent, date_str, exceptions.get((parent_id, date_str)))
+    return found
+
+
+def get_occurrences(conn, user_id, refs):
+    """Batched get_occurrence(): {ref: virtual occurrence row} for refs that exist."""
+    return {
+        ref: _occurrence_row(parent, date_str)
+        for ref, (parent, date_str, exc) in _load_occurrences(conn, user_id, refs).items()
+        if exc is None
+    }
+
+
+def materialize_occurrences(conn, user_id, refs):
+    """Batched materialize_occurrence(): {ref: concrete id} for refs that exist.
+
+    One INSERT OR IGNORE executemany stores the new children; already
+    materialized occurrences map to their existing row.  Runs inside the
+    caller's transaction.
+    """
+    loaded = _load_occurrences(conn, user_id, refs)
+    resolved, pending = {}, {}
+    for ref, (parent, date_str, exc) in loaded.items():
+        if exc is not None:
+            if exc["event_id"] is not None:
+                resolved[ref] = exc["event_id"]
+        else:
+            pending[ref] = (parent, date_str)
+    if not pending:
+        return resolved
+    conn.executemany(
+        f"INSERT OR IGNORE INTO events {_INSTANCE_COLUMNS} VALUES {_INSTANCE_VALUES}",
+        [_instance_params(user_id, parent, d) for parent, d in pending.values()],
+    )
+    parent_ids = sorted({parent["id"] for parent, _ in pending.values()})
+    dates = sorted({d for _, d in pending.values()})
+    ids = {(row["recur_parent_id"], row["date"]): row["id"] for row in conn.execute(
+        f"""SELECT id, recur_parent_id, date FROM events
+            WHERE user_id=? AND col_type='plan'
+            AND recur_parent_id IN ({",".join("?" * len(parent_ids))})
+            AND date IN ({",".join("?" * len(dates))})""",
+        (user_id, *parent_ids, *dates),
+    )}
+    exceptions = []
+    for ref, (parent, date_str) in pending.items():
+        resolved[ref] = ids[(parent["id"], date_str)]
+        exceptions.append((user_id, parent["id"], date_str, resolved[ref]))
+    conn.executemany(
+        """INSERT OR IGNORE INTO event_exceptions (user_id, parent_id, date, event_id)
+           VALUES (?, ?, ?, ?)""",
+        exceptions,
+    )
+    return resolved
+
+
+def detach_child(conn, user_id, event):
+    """Detach a stored occurrence that is moving to another date or column.
+
+    Its original date stays covered by an exception so the rule does not
+    produce it again, and the moved row cannot collide with the instance
+    stored for its new date.
+    """
+    if event["recur_parent_id"] is None:
+        return
+    conn.execute(
+        """INSERT OR IGNORE INTO event_exceptions (user_id, parent_id, date, event_id)
+           VALUES (?, ?, ?, ?)""",
+        (user_id, event["recur_parent_id"], event["date"], event["id"]),
+    )
+    conn.execute(
+        "UPDATE events SET recur_parent_id=NULL WHERE id=? AND user_id=?",
+        (event["id"], user_id),
+    )
+
+
+def cancel_occurrence(conn, user_id, parent_id, date_str):
+    """Record that the occurrence of *parent_id* on *date_str* was deleted."""
+    conn.execute(_CANCEL_OCCURRENCE, (user_id, parent_id, date_str))
+
+
+def cancel_occurrences(conn, user_id, occurrences):
+    """cancel_occurrence() for many (parent_id, date) pairs in one executemany."""
+    conn.executemany(_CANCEL_OCCURRENCE, [(user_id, p, d) for p, d in occurrences])
+
+
+def forget_child(conn, user_id, event):
+    """Keep a deleted child row's occurrence from reappearing as a virtual one."""
+    updated = conn.execute(
+        "UPDATE event_exceptions SET event_id=NULL WHERE user_id=? AND event_id=?",
+        (user_id, event["id"]),
+    ).rowcount
+    if not updated and event["recur_parent_id"] is not None:
+        # A child from materializing mode has no exception row yet.
+        cancel_occurrence(conn, user_id, event["recur_parent_id"], event["date"])
+
+
+def forget_events(conn, user_id, ids):
+    """Set-based forget_child()/forget_series() for event rows about to be deleted."""
+    if not ids:
+        return
+    marks = ",".join("?" * len(ids))
+    conn.execute(
+        f"UPDATE event_exceptions SET event_id=NULL WHERE user_id=? AND event_id IN ({marks})",
+        (user_id, *ids),
+    )
+    conn.execute(
+        f"""INSERT OR IGNORE INTO event_exceptions (user_id, parent_id, date, event_id)
+            SELECT user_id, recur_parent_id, date, NULL FROM events
+            WHERE user_id=? AND id IN ({marks}) AND recur_parent_id IS NOT NULL""",
+        (user_id, *ids),
+    )
+    conn.execute(
+        f"DELETE FROM event_exceptions WHERE user_id=? AND parent_id IN ({marks})",
+        (user_id, *ids),
+    )
+    conn.execute(
+        f"DELETE FROM recurrence_horizons WHERE user_id=? AND parent_id IN ({marks})",
+        (user_id, *ids),
+    )
+
+
+def delete_events(conn, user_id, ids):
+    """Move concrete events *ids* to the trash and delete them; returns rows removed.
+
+    The set-based counterpart of the single delete in routes/events: one
+    INSERT ... SELECT copies the rows, forget_events() keeps their
+    occurrences from reappearing and one DELETE removes them.
+    """
+    if not ids:
+        return 0
+    marks = ",".join("?" * len(ids))
+    conn.execute(f"{_TRASH_SERIES_ROWS} WHERE user_id=? AND id IN ({marks})", (user_id, *ids))
+    forget_events(conn, user_id, ids)
+    return conn.execute(
+        f"DELETE FROM events WHERE user_id=? AND id IN ({marks})", (user_id, *ids)
+    ).rowcount
+
+
+def forget_series(conn, user_id, parent_id):
+    """Drop the exceptions and stored horizon of a deleted series."""
+    conn.execute(
+        "DELETE FROM event_exceptions WHERE user_id=? AND parent_id=?", (user_id, parent_id)
+    )
+    reset_horizon(conn, user_id, parent_id)
+
+
+def reset_horizon(conn, user_id, parent_id):
+    """Forget how far a series was materialized, e.g. after its rule or start changed."""
+    conn.execute(
+        "DELETE FROM recurrence_horizons WHERE user_id=? AND parent_id=?", (user_id, parent_id)
+    )
+
+
+def find_series(conn, user_id, ref):
+    """Return (parent row, occurrence date) for a member of a series, else (None, None).
+
+    *ref* may be the parent's id, the id of a stored child or a virtual
+    occurrence id.
+    """
+    parsed = parse_virtual_id(ref)
+    if parsed is not None:
+        parent, exc = _load_occurrence(conn, user_id, *parsed)
+        if parent is None or (exc is not None and exc["event_id"] is None):
+            return None, None
+        return parent, parsed[1]
+    try:
+        event_id = int(ref)
+    except (TypeError, ValueError):
+        return None, None
+    row = conn.execute(
+        "SELECT * FROM events WHERE id=? AND user_id=?", (event_id, user_id)
+    ).fetchone()
+    if row is None:
+        return None, None
+    if row["recur_rule"] and row["col_type"] == "plan":
+        return (row, row["date"]) if _series(row) is not None else (None, None)
+    if row["recur_parent_id"] is None:
+        return None, None
+    parent = conn.execute(
+        """SELECT * FROM events WHERE id=? AND user_id=? AND recur_rule IS NOT NULL
+           AND col_type='plan'""",
+        (row["recur_parent_id"], user_id),
+    ).fetchone()
+    if parent is None or _series(parent) is None:
+        return None, None
+    return parent, row["date"]
+
+
+def update_series(conn, user_id, parent_id, fields, params):
+    """Apply SET *fields* to a series' parent and every stored child; returns rows changed."""
+    return conn.execute(
+        f"""UPDATE events SET {', '.join(fields)}, updated_at=datetime('now','localtime')
+            WHERE user_id=? AND (id=? OR recur_parent_id=?)""",
+        (*params, user_id, parent_id, parent_id),
+    ).rowcount
+
+
+def split_series(conn, user_id, parent, pivot, tail_rule=None, fields=(), params=()):
+    """Start a new series at occurrence *pivot*; returns (new parent id, rows changed).
+
+    The existing series is cut off the day before *pivot*.  Stored children,
+    exceptions and the materialized horizon from *pivot* on move to the new
+    parent, and SET *fields* are applied to it and those children in the
+    same statement.  *tail_rule* replaces the continuing rule.  Runs inside
+    the caller's transaction.
+    """
+    parent_id = parent["id"]
+    head, tail = split_rule(parent["recur_rule"], parent["date"], _parse(pivot))
+    conn.execute(
+        "UPDATE events SET recur_rule=?, updated_at=datetime('now','localtime') WHERE id=? AND user_id=?",
+        (head, parent_id, user_id),
+    )
+    template = (parent["title"], parent["description"], parent["start_time"], parent["end_time"],
+                parent["color"], parent["category"], parent["priority"], tail_rule or tail)
+    stored = conn.execute(
+        """SELECT id FROM events WHERE user_id=? AND recur_parent_id=? AND date=?
+           AND col_type='plan'""",
+        (user_id, parent_id, pivot),
+    ).fetchone()
+    if stored:
+        # The stored occurrence becomes the new parent, reset to the series template.
+        new_id = stored["id"]
+        conn.execute(
+            """UPDATE events SET title=?, description=?, start_time=?, end_time=?, color=?,
+               category=?, priority=?, recur_rule=? WHERE id=?""",
+            (*template, new_id),
+        )
+    else:
+        new_id = conn.execute(
+            """INSERT INTO events (title, description, start_time, end_time, color, category,
+               priority, recur_rule, user_id, date, col_type)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'plan')""",
+            (*template, user_id, pivot),
+        ).lastrowid
+
+    conn.execute(
+        "DELETE FROM event_exceptions WHERE user_id=? AND parent_id=? AND date=?",
+        (user_id, parent_id, pivot),
+    )
+    conn.execute(
+        "UPDATE event_exceptions SET parent_id=? WHERE user_id=? AND parent_id=? AND date > ?",
+        (new_id, user_id, parent_id, pivot),
+    )
+    if tail_rule is None:
+        conn.execute(
+            """INSERT OR REPLACE INTO recurrence_horizons (parent_id, user_id, through)
+               SELECT ?, user_id, through FROM recurrence_horizons
+               WHERE parent_id=? AND through >= ?""",
+            (new_id, parent_id, pivot),
+        )
+    sets = list(fields) + [
+        "recur_parent_id=CASE WHEN id=? THEN NULL ELSE ? END",
+        "updated_at=datetime('now','localtime')",
+    ]
+    changed = conn.execute(
+        f"""UPDATE events SET {', '.join(sets)}
+            WHERE user_id=? AND (id=? OR (recur_parent_id=? AND date > ?))""",
+        (*params, new_id, new_id, user_id, new_id, parent_id, pivot),
+    ).rowcount
+    return new_id, changed
+
+
+def split_off_first(conn, user_id, parent):
+    """Turn a series' parent into a one-off event, continuing the series from its next occurrence."""
+    nxt = _series(parent).next_after(_parse(parent["date"]))
+    if nxt is not None:
+        split_series(conn, user_id, parent, _format(nxt))
+
+
+def delete_series(conn, user_id, parent_id):
+    """Move a series' parent and stored children to the trash; returns rows removed."""
+    conn.execute(
+        f"{_TRASH_SERIES_ROWS} WHERE user_id=? AND (id=? OR recur_parent_id=?)",
+        (user_id, parent_id, parent_id),
+    )
+    removed = conn.execute(
+        "DELETE FROM events WHERE user_id=? AND (id=? OR recur_parent_id=?)",
+        (user_id, parent_id, parent_id),
+    ).rowcount
+    forget_series(conn, user_id, parent_id)
+    return removed
+
+
+def end_series(conn, user_id, parent, pivot):
+    """End a series the day before *pivot*, trashing stored children from *pivot* on."""
+    parent_id = parent["id"]
+    head, _ = split_rule(parent["recur_rule"], parent["date"], _parse(pivot))
+    conn.execute(
+        "UPDATE events SET recur_rule=?, updated_at=datetime('now','localtime') WHERE id=? AND user_id=?",
+        (head, parent_id, user_id),
+    )
+    conn.execute(
+        f"{_TRASH_SERIES_ROWS} WHERE user_id=? AND recur_parent_id=? AND date >= ?",
+        (user_id, parent_id, pivot),
+    )
+    removed = conn.execute(
+        "DELETE FROM events WHERE user_id=? AND recur_parent_id=? AND date >= ?",
+        (user_id, parent_id, pivot),
+    ).rowcount
+    conn.execute(
+        "DELETE FROM event_exceptions WHERE user_id=? AND parent_id=? AND date >= ?",
+        (user_id, parent_id, pivot),
+    )
+    return removed
+
+
+def _instance_params(user_id, parent, date_str):
+    return (user_id, parent["title"], parent["description"], date_str, parent["start_time"],
+            parent["end_time"], parent["color"], parent["category"], parent["priority"],
+            parent["id"])
+
+
+def plan_instances(conn, user_id, start, end):
+    """Child rows still missing for *user_id*'s series in [start, end].
+
+    Returns (rows, horizons): insert parameters for store_instances() and
+    the (parent_id, user_id, through) horizons to record.  Series whose
+    horizon already reaches *end* are filtered out by the first query, so a
+    covered range does no further work.  A range that starts right after
+    the horizon extends it; a range beyond a gap is stored without moving
+    the horizon, keeping "everything up to through is stored" true.
+    """
+    parents = conn.execute(
+        """SELECT e.*, h.through FROM events e
+           LEFT JOIN recurrence_horizons h ON h.parent_id = e.id
+           WHERE e.user_id=? AND e.recur_rule IS NOT NULL AND e.col_type='plan'
+             AND e.date <= ? AND (h.through IS NULL OR h.through < ?)""",
+        (user_id, end, end),
+    ).fetchall()
+    if not parents:
+        return [], []
+
+    end_d = _parse(end)
+    work = []
+    for parent in parents:
+        series = _series(parent)
+        if series is None:
+            continue
+        after = _parse(parent["through"] or parent["date"]) + timedelta(days=1)
+        contiguous = _parse(start) <= after
+        work.append((parent, series, after if contiguous else _parse(start), contiguous))
+    if not work:
+        return [], []
+
+    lo = _format(min(w[2] for w in work))
+    # Dates the rule must not fill: edited/deleted occurrences and children
+    # that were moved to the archive (the unique index only sees the hot table).
+    skip = {
+        (r[0], r[1]) for r in conn.execute(
+            "SELECT parent_id, date FROM event_exceptions WHERE user_id=? AND date BETWEEN ? AND ?",
+            (user_id, lo, end),
+        )
+    }
+    boundary = archive_boundary(conn, user_id)
+    if boundary is not None and epoch_day(lo) < boundary:
+        skip.update(
+            (r[0], r[1]) for r in conn.execute(
+                """SELECT recur_parent_id, date FROM events_archive
+                   WHERE user_id=? AND recur_parent_id IS NOT NULL AND date BETWEEN ? AND ?""",
+                (user_id, lo, end),
+            )
+        )
+
+    rows, horizons = [], []
+    for parent, series, gen_start, contiguous in work:
+        dates = series.between(gen_start, end_d, _EXPAND_LIMIT)
+        for d in dates:
+            ds = _format(d)
+            if (parent["id"], ds) not in skip:
+                rows.append(_instance_params(user_id, parent, ds))
+        if contiguous:
+            # A truncated expansion only covers up to its last date.
+            through = _format(dates[-1]) if len(dates) >= _EXPAND_LIMIT else end
+            horizons.append((parent["id"], user_id, through))
+    return rows, horizons
+
+
+def store_instances(conn, rows, horizons):
+    """Insert planned child rows and advance horizons; returns rows actually created."""
+    created = 0
+    if rows:
+        created = conn.executemany(
+            f"INSERT OR IGNORE INTO events {_INSTANCE_COLUMNS} VALUES {_INSTANCE_VALUES}", rows
+        ).rowcount
+    if horizons:
+        conn.executemany(
+            """INSERT INTO recurrence_horizons (parent_id, user_id, through) VALUES (?, ?, ?)
+               ON CONFLICT(parent_id) DO UPDATE SET through=MAX(through, excluded.through)""",
+            horizons,
+        )
+    return created
@@ -0,0 +1,264 @@
+"""
+regex_sandbox — run user-supplied regular expressions in killable processes.
+
+A pattern with catastrophic backtracking cannot be interrupted inside the
+interpreter: a thread running it keeps a core busy (and holds the GIL) long
+after the request gave up.  Regex searches therefore run in a small pool of
+worker processes, REGEX_POOL_SIZE per web process, started on first use.
+
+The caller streams rows to a worker in chunks of REGEX_CHUNK_ROWS, newest
+first, until *limit* rows matched or the history is exhausted.  A chunk
+that is not answered before the search's REGEX_TIMEOUT deadline gets its
+worker killed and replaced; when the deadline passes between chunks the
+rows matched so far are returned.  Workers are also recycled after
+REGEX_WORKER_MAX_JOBS searches.
+
+Each user may run REGEX_MAX_PER_USER searches at once, and a search that
+finds every worker busy waits at most _ACQUIRE_WAIT seconds.  Outcomes,
+durations and killed workers are recorded in metrics.
+
+The worker loop lives in regex_worker.py, which imports nothing from the
+application.  On POSIX a worker is a fresh interpreter running that file,
+connected by a socketpair, so it neither inherits the web process's threads
+nor re-runs the application module the way multiprocessing's child
+bootstrap would.  Elsewhere workers are multiprocessing "spawn" processes.
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+import subprocess
+import multiprocessing
+from itertools import islice
+
+import regex_worker
+from config import (
+    REGEX_POOL_SIZE, REGEX_TIMEOUT, REGEX_MAX_PER_USER, REGEX_CHUNK_ROWS,
+    REGEX_WORKER_MAX_JOBS,
+)
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Longest a search waits for a free worker.
+_ACQUIRE_WAIT = 1.0
+
+_ERRORS = {
+    "timeout": "正则表达式执行超时，请简化搜索模式",
+    "busy": "正则搜索繁忙，请稍后再试",
+    "user_busy": "已有正则搜索正在进行，请稍后再试",
+    "error": "正则搜索失败，请稍后再试",
+}
+
+
+class _Worker:
+    def __init__(self):
+        self.conn, child = multiprocessing.Pipe()
+        if os.name == "posix":
+            fd = child.fileno()
+            self.process = subprocess.Popen(
+                [sys.executable, os.path.abspath(regex_worker.__file__), str(fd)],
+                pass_fds=(fd,), stdin=subprocess.DEVNULL,
+            )
+        else:
+            self.process = multiprocessing.get_context("spawn").Process(
+                target=regex_worker.worker_main, args=(child,), name="regex-sandbox", daemon=True
+            )
+            self.process.start()
+        child.close()
+        self.jobs = 0
+
+    def _wait(self, timeout):
+        if isinstance(self.process, subprocess.Popen):
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                pass
+            return self.process.poll() is None
+        self.process.join(timeout)
+        return self.process.is_alive()
+
+    def kill(self):
+        self.process.kill()
+        self._wait(1)
+        self.conn.close()
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        if self._wait(1):
+            self.kill()
+        else:
+            self.conn.close()
+
+
+class RegexPool:
+    """At most *size* worker processes shared by the threads of one web process."""
+
+    def __init__(self, size=REGEX_POOL_SIZE, max_jobs=REGEX_WORKER_MAX_JOBS,
+                 per_user=REGEX_MAX_PER_USER):
+        self.size = max(1, size)
+        self.max_jobs = max_jobs
+        self.per_user = max(1, per_user)
+        self._idle = []
+        self._started = 0
+        self._users = {}
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+        self._counters = {"started": 0, "killed": 0, "recycled": 0}
+
+    def _check_fork(self):
+        # Workers (and their pipes) belong to the process that started them.
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self._started = 0
+            self._users = {}
+
+    def _acquire(self, wait):
+        deadline = time.monotonic() + wait
+        with self._cond:
+            self._check_fork()
+            while not self._idle and self._started >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._started >= self.size:
+                        return None
+            if self._idle:
+                return self._idle.pop()
+            self._started += 1
+        try:
+            worker = _Worker()
+        except Exception:
+            with self._cond:
+                self._started -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters["started"] += 1
+        return worker
+
+    def _release(self, worker, broken):
+        if broken:
+            worker.kill()
+            metrics.inc("planner_regex_workers_killed_total")
+            counter = "killed"
+        elif worker.jobs >= self.max_jobs:
+            worker.stop()
+            counter = "recycled"
+        else:
+            with self._cond:
+                self._idle.append(worker)
+                self._cond.notify()
+            return
+        with self._cond:
+            self._counters[counter] += 1
+            self._started -= 1
+            self._cond.notify()
+
+    def _run(self, worker, pattern, rows, columns, limit, deadline):
+        matched = []
+        rows = iter(rows)
+        while len(matched) < limit:
+            chunk = list(islice(rows, REGEX_CHUNK_ROWS))
+            if not chunk:
+                return matched, "ok"
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return matched, "truncated"
+            worker.conn.send(
+                (pattern.pattern, pattern.flags, [[row[c] or "" for c in columns] for row in chunk])
+            )
+            if not worker.conn.poll(remaining):
+                return None, "timeout"
+            matched.extend(chunk[i] for i in worker.conn.recv())
+        return matched[:limit], "ok"
+
+    def search(self, user_id, pattern, rows, columns, limit, timeout=REGEX_TIMEOUT):
+        """Rows whose *columns* match compiled *pattern*: returns (rows, error message)."""
+        start = time.monotonic()
+        with self._cond:
+            self._check_fork()
+            if self._users.get(user_id, 0) >= self.per_user:
+                return self._finish(start, None, "user_busy")
+            self._users[user_id] = self._users.get(user_id, 0) + 1
+        try:
+            worker = self._acquire(min(_ACQUIRE_WAIT, timeout))
+            if worker is None:
+                return self._finish(start, None, "busy")
+            worker.jobs += 1
+            matched, outcome, broken = None, "error", True
+            try:
+                matched, outcome = self._run(worker, pattern, rows, columns, limit, start + timeout)
+                broken = outcome == "timeout"
+            except (OSError, EOFError) as e:
+                logger.warning("正则搜索进程异常: %s", e)
+            finally:
+                self._release(worker, broken)
+            return self._finish(start, matched, outcome)
+        finally:
+            with self._cond:
+                self._users[user_id] -= 1
+                if not self._users[user_id]:
+                    del self._users[user_id]
+
+    @staticmethod
+    def _finish(start, matched, outcome):
+        seconds = time.monotonic() - start
+        metrics.inc("planner_regex_searches_total", outcome=outcome.replace("user_busy", "busy"))
+        if outcome in ("ok", "truncated", "timeout"):
+            metrics.observe("planner_regex_search_duration_seconds", seconds)
+        if outcome == "truncated":
+            logger.info("正则搜索在 %.1fs 后截断，返回 %d 条结果", seconds, len(matched))
+        elif outcome == "timeout":
+            logger.warning("正则搜索超时 %.1fs，已终止工作进程", seconds)
+        return matched, _ERRORS.get(outcome)
+
+    def close(self):
+        with self._cond:
+            self._check_fork()
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+        for worker in idle:
+            worker.stop()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "workers": self._started,
+                "idle": len(self._idle),
+                "searching_users": len(self._users),
+                **self._counters,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RegexPool()
+    return _pool
+
+
+def regex_search(user_id, pattern, rows, columns, limit):
+    """Filter *rows* (an iterable, read lazily) with *pattern* in the sandbox."""
+    return get_pool().search(user_id, pattern, rows, columns, limit)
+
+
+def regex_pool_stats():
+    return _pool.stats() if _pool is not None else None
+
+
+def close_regex_pool():
+    if _pool is not None:
+        _pool.close()
@@ -0,0 +1,39 @@
+"""
+regex_worker — the process side of regex_sandbox.
+
+Kept free of application imports: a worker must not load config (which may
+write .secret_key), metrics or anything else with import-time effects.
+Run as "python regex_worker.py <fd>" with one end of a multiprocessing Pipe
+on <fd>, or used as a multiprocessing target through worker_main().
+"""
+
+import re
+import sys
+
+# Compiled patterns a worker keeps between chunks and searches.
+_PATTERN_CACHE = 32
+
+
+def worker_main(conn):
+    """Worker loop: receive (pattern, flags, [fields, ...]), answer with matching indexes."""
+    patterns = {}
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        if message is None:
+            return
+        source, flags, rows = message
+        pattern = patterns.get((source, flags))
+        if pattern is None:
+            if len(patterns) >= _PATTERN_CACHE:
+                patterns.clear()
+            pattern = patterns[(source, flags)] = re.compile(source, flags)
+        conn.send([i for i, fields in enumerate(rows) if any(pattern.search(t) for t in fields)])
+
+
+if __name__ == "__main__":
+    from multiprocessing.connection import Connection
+
+    worker_main(Connection(int(sys.argv[1])))
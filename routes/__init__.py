@@ -7,6 +7,9 @@ from routes.notes import notes_bp
 from routes.stats import stats_bp
 from routes.templates import templates_bp
 from routes.todos import todos_bp
+from routes.suggest import suggest_bp
+from routes.schedule import schedule_bp
+from routes.sync import sync_bp
 
 
 def register_blueprints(app):
@@ -19,3 +22,6 @@ def register_blueprints(app):
     app.register_blueprint(stats_bp)
     app.register_blueprint(templates_bp)
     app.register_blueprint(todos_bp)
+    app.register_blueprint(suggest_bp)
+    app.register_blueprint(schedule_bp)
+    app.register_blueprint(sync_bp)
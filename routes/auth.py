@@ -8,7 +8,7 @@ from datetime import datetime
 from flask import Blueprint, request, jsonify, session
 from werkzeug.security import generate_password_hash, check_password_hash
 
-from database import get_db
+from database import get_db, run_write
 from auth_utils import (
     login_required,
     get_current_user,
@@ -79,13 +79,11 @@ def register():
     password_hash = generate_password_hash(password)
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     language = (data.get("language") or "").strip() or ""
-    cursor = conn.execute(
+    user_id = run_write(lambda conn: conn.execute(
         """INSERT INTO users (email, username, password_hash, last_login, language)
            VALUES (?, ?, ?, ?, ?)""",
         (email, username, password_hash, now, language),
-    )
-    conn.commit()
-    user_id = cursor.lastrowid
+    ).lastrowid)
 
     session.permanent = True
     session["user_id"] = user_id
@@ -142,8 +140,10 @@ def login():
     _clear_login_failures(lockout_key)
 
     now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    conn.execute("UPDATE users SET last_login=? WHERE id=?", (now, user["id"]))
-    conn.commit()
+    user_id = user["id"]
+    run_write(lambda conn: conn.execute(
+        "UPDATE users SET last_login=? WHERE id=?", (now, user_id)
+    ))
 
     session.permanent = bool(remember)
     session["user_id"] = user["id"]
@@ -154,8 +154,9 @@ def login():
 
     language = data.get("language")
     if language and not u.get("language"):
-        conn.execute("UPDATE users SET language=? WHERE id=?", (language, user["id"]))
-        conn.commit()
+        run_write(lambda conn: conn.execute(
+            "UPDATE users SET language=? WHERE id=?", (language, user_id)
+        ))
         u["language"] = language
 
     return jsonify({"user": u})
@@ -229,13 +230,11 @@ def reset_password():
     if not valid:
         return jsonify({"error": msg}), 400
 
-    conn = get_db()
     password_hash = generate_password_hash(password)
-    conn.execute(
+    run_write(lambda conn: conn.execute(
         "UPDATE users SET password_hash=?, updated_at=datetime('now','localtime') WHERE email=?",
         (password_hash, email),
-    )
-    conn.commit()
+    ))
 
     session.pop("reset_email", None)
     session.pop("reset_verified", None)
@@ -1,9 +1,25 @@
-import calendar
 import re
 from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify, g
-from database import get_db
-from auth_utils import login_required, validate_date, run_regex_with_timeout
+from config import RECURRENCE_MODE
+from database import get_user_db, run_user_write, row_dict
+from archive import events_source, thaw_events
+from rrule import normalize_rule
+from recurrence import (
+    events_between, occurrence_dates,
+    parse_virtual_id, get_occurrence, materialize_occurrence, cancel_occurrence,
+    get_occurrences, materialize_occurrences, cancel_occurrences, delete_events,
+    detach_child, forget_child, forget_series, reset_horizon,
+    plan_instances, store_instances,
+    find_series, update_series, split_series, split_off_first, delete_series, end_series,
+)
+from search import find_events, regex_event_rows
+from suggest import record_use, invalidate_suggestions
+from intervals import conflicts_between, conflicts_on
+from db_trace import query_budget
+from http_cache import versioned
+from regex_sandbox import regex_search
+from auth_utils import login_required, validate_date
 
 events_bp = Blueprint("events", __name__)
 
@@ -11,6 +27,8 @@ DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 TIME_RE = re.compile(r"^\d{2}:\d{2}$")
 COLOR_RE = re.compile(r"^#[0-9a-fA-F]{6}$")
 _DEFAULT_COLOR = "#6c5ce7"
+# Longest range /api/events/conflicts reports on at once.
+CONFLICTS_MAX_DAYS = 366
 
 
 def _normalize_color(color):
@@ -18,6 +36,11 @@ def _normalize_color(color):
     return color if (color and COLOR_RE.match(color)) else _DEFAULT_COLOR
 
 
+def _wants_conflicts():
+    """Writes report the overlap groups of the days they touched when asked with ?conflicts=1."""
+    return request.args.get("conflicts") == "1"
+
+
 def _validate_event_data(data, require_all=True):
     if not data:
         return "请求数据不能为空"
@@ -38,26 +61,39 @@ def _validate_event_data(data, require_all=True):
         return "时间格式不正确"
     if require_all and start_time >= end_time:
         return "结束时间必须晚于开始时间"
+    if data.get("recur_rule"):
+        try:
+            normalize_rule(data["recur_rule"])
+        except ValueError as e:
+            return f"重复规则无效: {e}"
     return None
 
 
 @events_bp.route("/api/events", methods=["GET"])
 @login_required
+@query_budget(6)
+@versioned("events")
 def get_events():
     start = request.args.get("start", "")
     end = request.args.get("end", "")
     if not validate_date(start) or not validate_date(end):
         return jsonify({"error": "日期参数格式不正确"}), 400
-    conn = get_db()
-    events = conn.execute(
-        "SELECT * FROM events WHERE user_id=? AND date >= ? AND date <= ? ORDER BY date, start_time",
-        (g.user_id, start, end),
-    ).fetchall()
-    return jsonify([dict(e) for e in events])
+    return jsonify(events_between(get_user_db(), g.user_id, start, end))
+
+
+def _concrete_event_id(ref):
+    """Return the row id for *ref*, materializing a virtual occurrence; None if unknown."""
+    if ref.isdigit():
+        return int(ref)
+    if parse_virtual_id(ref) is None:
+        return None
+    user_id = g.user_id
+    return run_user_write(lambda conn: materialize_occurrence(conn, user_id, ref))
 
 
 @events_bp.route("/api/events", methods=["POST"])
 @login_required
+@query_budget(8)
 def create_event():
     data = request.json
     if not data:
@@ -70,40 +106,42 @@ def create_event():
     if col_type not in ("plan", "actual"):
         return jsonify({"error": "无效的列类型"}), 400
 
-    recur_rule = data.get("recur_rule") or None
-    if recur_rule and recur_rule not in ("daily", "weekdays", "weekly", "monthly"):
-        recur_rule = None
-
-    conn = get_db()
-    cursor = conn.execute(
+    recur_rule = normalize_rule(data["recur_rule"]) if data.get("recur_rule") else None
+
+    params = (
+        g.user_id,
+        data["title"].strip(),
+        data.get("description", ""),
+        data["date"],
+        data["start_time"],
+        data["end_time"],
+        _normalize_color(data.get("color")),
+        data.get("category", "工作"),
+        int(data.get("priority", 1)),
+        col_type,
+        recur_rule,
+    )
+    new_id = run_user_write(lambda conn: conn.execute(
         """INSERT INTO events (user_id, title, description, date, start_time, end_time,
            color, category, priority, col_type, recur_rule)
            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-        (
-            g.user_id,
-            data["title"].strip(),
-            data.get("description", ""),
-            data["date"],
-            data["start_time"],
-            data["end_time"],
-            _normalize_color(data.get("color")),
-            data.get("category", "工作"),
-            int(data.get("priority", 1)),
-            col_type,
-            recur_rule,
-        ),
-    )
-    conn.commit()
-    new_id = cursor.lastrowid
+        params,
+    ).lastrowid)
+    record_use(g.user_id, "event", [(params[1], params[3])])
 
-    new_event = dict(
+    conn = get_user_db()
+    new_event = row_dict(
         conn.execute("SELECT * FROM events WHERE id=?", (new_id,)).fetchone()
     )
-    return jsonify({"event": new_event}), 201
+    body = {"event": new_event}
+    if _wants_conflicts():
+        body["conflicts"] = conflicts_on(conn, g.user_id, [new_event["date"]])
+    return jsonify(body), 201
 
 
-@events_bp.route("/api/events/<int:event_id>", methods=["PUT"])
+@events_bp.route("/api/events/<event_id>", methods=["PUT"])
 @login_required
+@query_budget(17)
 def update_event(event_id):
     data = request.json
     if not data:
@@ -112,45 +150,65 @@ def update_event(event_id):
     if err:
         return jsonify({"error": err}), 400
 
-    conn = get_db()
-    existing = conn.execute(
-        "SELECT id, col_type FROM events WHERE id=? AND user_id=?", (event_id, g.user_id)
-    ).fetchone()
+    event_id = _concrete_event_id(event_id)
+    if event_id is None:
+        return jsonify({"error": "事件不存在"}), 404
+    conn = get_user_db()
+    user_id = g.user_id
+    existing_sql = """SELECT id, title, col_type, date, recur_rule, recur_parent_id
+                      FROM events WHERE id=? AND user_id=?"""
+    existing = conn.execute(existing_sql, (event_id, user_id)).fetchone()
+    if not existing and run_user_write(lambda conn: thaw_events(conn, user_id, [event_id])):
+        existing = conn.execute(existing_sql, (event_id, user_id)).fetchone()
     if not existing:
         return jsonify({"error": "事件不存在"}), 404
 
-    recur_rule = data.get("recur_rule") or None
-    if recur_rule and recur_rule not in ("daily", "weekdays", "weekly", "monthly"):
-        recur_rule = None
+    recur_rule = normalize_rule(data["recur_rule"]) if data.get("recur_rule") else None
 
     col_type = data.get("col_type")
     if col_type not in ("plan", "actual"):
         col_type = existing["col_type"]
 
-    conn.execute(
-        """UPDATE events SET title=?, description=?, date=?, start_time=?, end_time=?,
-           color=?, category=?, priority=?, completed=?, recur_rule=?, col_type=?,
-           updated_at=datetime('now','localtime')
-           WHERE id=? AND user_id=?""",
-        (
-            data["title"].strip(),
-            data.get("description", ""),
-            data["date"],
-            data["start_time"],
-            data["end_time"],
-            _normalize_color(data.get("color")),
-            data.get("category", "工作"),
-            int(data.get("priority", 1)),
-            int(data.get("completed", 0)),
-            recur_rule,
-            col_type,
-            event_id,
-            g.user_id,
-        ),
+    params = (
+        data["title"].strip(),
+        data.get("description", ""),
+        data["date"],
+        data["start_time"],
+        data["end_time"],
+        _normalize_color(data.get("color")),
+        data.get("category", "工作"),
+        int(data.get("priority", 1)),
+        int(data.get("completed", 0)),
+        recur_rule,
+        col_type,
+        event_id,
+        g.user_id,
+    )
+    moved = existing["date"] != data["date"] or existing["col_type"] != col_type
+    reschedules = existing["recur_rule"] and (
+        existing["recur_rule"] != recur_rule or existing["date"] != data["date"]
     )
-    conn.commit()
-    event = conn.execute("SELECT * FROM events WHERE id=? AND user_id=?", (event_id, g.user_id)).fetchone()
-    return jsonify(dict(event))
+
+    def _update(conn):
+        if moved:
+            detach_child(conn, user_id, existing)
+        if reschedules:
+            reset_horizon(conn, user_id, event_id)
+        conn.execute(
+            """UPDATE events SET title=?, description=?, date=?, start_time=?, end_time=?,
+               color=?, category=?, priority=?, completed=?, recur_rule=?, col_type=?,
+               updated_at=datetime('now','localtime')
+               WHERE id=? AND user_id=?""",
+            params,
+        )
+
+    run_user_write(_update)
+    if existing["title"] != params[0]:
+        invalidate_suggestions(user_id)
+    event = row_dict(conn.execute("SELECT * FROM events WHERE id=? AND user_id=?", (event_id, g.user_id)).fetchone())
+    if _wants_conflicts():
+        event["conflicts"] = conflicts_on(conn, user_id, [existing["date"], event["date"]])
+    return jsonify(event)
 
 
 @events_bp.route("/api/events/batch", methods=["PUT"])
@@ -159,28 +217,43 @@ def batch_update_events():
     items = request.json
     if not items or not isinstance(items, list):
         return jsonify({"error": "请求数据格式不正确"}), 400
-    conn = get_db()
+    user_id = g.user_id
     results = []
     valid_ids = set()
+    updates = []
     for item in items:
         if not isinstance(item, dict) or "id" not in item:
             continue
-        try:
-            item["id"] = int(item["id"])
-        except (ValueError, TypeError):
-            continue
+        if parse_virtual_id(item["id"]) is None:
+            try:
+                item["id"] = int(item["id"])
+            except (ValueError, TypeError):
+                continue
         start_time = item.get("start_time", "")
         end_time = item.get("end_time", "")
         if not TIME_RE.match(start_time) or not TIME_RE.match(end_time):
             continue
         if start_time >= end_time:
             continue
-        conn.execute(
-            "UPDATE events SET start_time=?, end_time=?, updated_at=datetime('now','localtime') WHERE id=? AND user_id=?",
-            (start_time, end_time, item["id"], g.user_id),
-        )
+        updates.append((start_time, end_time, item["id"]))
         valid_ids.add(item["id"])
-    conn.commit()
+
+    def _apply(conn):
+        # Virtual occurrences become concrete rows before their times change.
+        resolved = {
+            ref: materialize_occurrence(conn, user_id, ref)
+            for ref in valid_ids if isinstance(ref, str)
+        }
+        thaw_events(conn, user_id, [i for i in valid_ids if isinstance(i, int)])
+        for start_time, end_time, ref in updates:
+            conn.execute(
+                "UPDATE events SET start_time=?, end_time=?, updated_at=datetime('now','localtime') WHERE id=? AND user_id=?",
+                (start_time, end_time, resolved.get(ref, ref), user_id),
+            )
+        return resolved
+
+    resolved = run_user_write(_apply)
+    conn = get_user_db()
     for item in items:
         if not isinstance(item, dict):
             continue
@@ -188,37 +261,254 @@ def batch_update_events():
         if item_id not in valid_ids:
             continue
         row = conn.execute(
-            "SELECT * FROM events WHERE id=? AND user_id=?", (item_id, g.user_id)
+            "SELECT * FROM events WHERE id=? AND user_id=?", (resolved.get(item_id, item_id), g.user_id)
         ).fetchone()
         if row:
-            results.append(dict(row))
+            results.append(row_dict(row))
+    if _wants_conflicts():
+        return jsonify({"events": results, "conflicts": conflicts_on(conn, user_id, [r["date"] for r in results])})
     return jsonify(results)
 
 
-@events_bp.route("/api/events/<int:event_id>", methods=["DELETE"])
+BULK_MAX = 500
+
+_CREATE_SQL = """INSERT INTO events (user_id, title, description, date, start_time, end_time,
+    color, category, priority, col_type, recur_rule)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+
+
+def _event_ref(value):
+    """Return an int id or a virtual occurrence id for *value*, else None."""
+    if isinstance(value, str) and parse_virtual_id(value) is not None:
+        return value
+    if isinstance(value, bool):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _bulk_plan(data, user_id):
+    """Validate a bulk request; returns (creates, updates, deletes, error)."""
+    if not isinstance(data, dict):
+        return None, None, None, "请求数据格式不正确"
+    ops = {key: data.get(key) or [] for key in ("create", "update", "delete")}
+    if not all(isinstance(items, list) for items in ops.values()):
+        return None, None, None, "create、update、delete 必须是数组"
+    total = sum(len(items) for items in ops.values())
+    if not total:
+        return None, None, None, "没有要执行的操作"
+    if total > BULK_MAX:
+        return None, None, None, f"一次最多执行 {BULK_MAX} 项操作"
+
+    creates = []
+    for i, item in enumerate(ops["create"]):
+        err = _validate_event_data(item) if isinstance(item, dict) else "请求数据格式不正确"
+        col_type = item.get("col_type", "plan") if not err else None
+        if not err and col_type not in ("plan", "actual"):
+            err = "无效的列类型"
+        if err:
+            return None, None, None, f"create[{i}]: {err}"
+        creates.append((
+            user_id, item["title"].strip(), item.get("description", ""), item["date"],
+            item["start_time"], item["end_time"], _normalize_color(item.get("color")),
+            item.get("category", "工作"), int(item.get("priority", 1)), col_type,
+            normalize_rule(item["recur_rule"]) if item.get("recur_rule") else None,
+        ))
+
+    updates = []
+    for i, item in enumerate(ops["update"]):
+        ref = _event_ref(item.get("id")) if isinstance(item, dict) else None
+        if ref is None:
+            return None, None, None, f"update[{i}]: 事件 id 无效"
+        fields, params, err = _event_changes(item, per_event=True)
+        if not err and not fields:
+            err = "没有可更新的字段"
+        if err:
+            return None, None, None, f"update[{i}]: {err}"
+        updates.append((ref, item, tuple(fields), params))
+
+    deletes = []
+    for i, value in enumerate(ops["delete"]):
+        ref = _event_ref(value)
+        if ref is None:
+            return None, None, None, f"delete[{i}]: 事件 id 无效"
+        deletes.append(ref)
+
+    refs = [u[0] for u in updates] + deletes
+    if len(set(refs)) != len(refs):
+        return None, None, None, "同一事件在一次请求中只能出现一次"
+    return creates, updates, deletes, None
+
+
+@events_bp.route("/api/events/bulk", methods=["POST"])
 @login_required
+@query_budget(40)
+def bulk_events():
+    """Create, update and delete many events in one transaction.
+
+    Body: {"create": [event, ...], "update": [{"id": ..., field: value}, ...],
+    "delete": [id, ...]}.  Everything is validated before anything is
+    written; updates may be partial and ids may be virtual occurrences.
+    The statement count depends on the number of distinct update field
+    sets, not on the number of events.
+    """
+    user_id = g.user_id
+    creates, updates, deletes, err = _bulk_plan(request.json, user_id)
+    if err:
+        return jsonify({"error": err}), 400
+
+    conn = get_user_db()
+    refs = [u[0] for u in updates] + deletes
+    ids = [r for r in refs if isinstance(r, int)]
+    source = events_source(conn, user_id) if ids else "events"
+    existing = {}
+    if ids:
+        existing = {row["id"]: row for row in conn.execute(
+            f"SELECT * FROM {source} WHERE user_id=? AND id IN ({','.join('?' * len(ids))})",
+            (user_id, *ids),
+        )}
+    virtual = [r for r in refs if isinstance(r, str)]
+    if virtual:
+        existing.update(get_occurrences(conn, user_id, virtual))
+    missing = [r for r in refs if r not in existing]
+    if missing:
+        return jsonify({"error": f"事件不存在: {missing[0]}"}), 404
+
+    def _apply(conn):
+        if ids and source != "events":
+            thaw_events(conn, user_id, ids)
+        resolved = materialize_occurrences(
+            conn, user_id, [u[0] for u in updates if isinstance(u[0], str)]
+        )
+
+        created = []
+        if creates:
+            conn.executemany(_CREATE_SQL, creates)
+            last = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            created = list(range(last - len(creates) + 1, last + 1))
+
+        groups, moved, reschedule = {}, [], []
+        for ref, item, fields, params in updates:
+            event_id = resolved.get(ref, ref)
+            row = existing[ref]
+            groups.setdefault(fields, []).append((*params, event_id, user_id))
+            if row["recur_parent_id"] and (
+                item.get("date", row["date"]) != row["date"]
+                or item.get("col_type", row["col_type"]) != row["col_type"]
+            ):
+                moved.append((user_id, row["recur_parent_id"], row["date"], event_id))
+            if row["recur_rule"] and ("recur_rule" in item or item.get("date", row["date"]) != row["date"]):
+                reschedule.append(event_id)
+        if moved:
+            # Set-based detach_child(): keep the old dates covered, then unlink.
+            conn.executemany(
+                """INSERT OR IGNORE INTO event_exceptions (user_id, parent_id, date, event_id)
+                   VALUES (?, ?, ?, ?)""",
+                moved,
+            )
+            conn.execute(
+                f"UPDATE events SET recur_parent_id=NULL WHERE user_id=? AND id IN ({','.join('?' * len(moved))})",
+                (user_id, *(m[3] for m in moved)),
+            )
+        if reschedule:
+            conn.execute(
+                f"DELETE FROM recurrence_horizons WHERE user_id=? AND parent_id IN ({','.join('?' * len(reschedule))})",
+                (user_id, *reschedule),
+            )
+        for fields, rows in groups.items():
+            conn.executemany(
+                f"""UPDATE events SET {', '.join(fields)}, updated_at=datetime('now','localtime')
+                    WHERE id=? AND user_id=?""",
+                rows,
+            )
+
+        delete_events(conn, user_id, [r for r in deletes if isinstance(r, int)])
+        cancelled = [existing[r] for r in deletes if isinstance(r, str)]
+        if cancelled:
+            conn.executemany(
+                """INSERT INTO deleted_events (user_id, original_id, title, description, date,
+                   start_time, end_time, color, category, priority, completed, col_type)
+                   VALUES (?, NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                [(user_id, e["title"], e["description"], e["date"], e["start_time"],
+                  e["end_time"], e["color"], e["category"], e["priority"], e["completed"],
+                  e["col_type"]) for e in cancelled],
+            )
+            cancel_occurrences(conn, user_id, [(e["recur_parent_id"], e["date"]) for e in cancelled])
+        return created, [resolved.get(u[0], u[0]) for u in updates]
+
+    created, updated = run_user_write(_apply)
+    if deletes or any("title" in u[1] for u in updates):
+        invalidate_suggestions(user_id)
+    else:
+        record_use(user_id, "event", [(c[1], c[3]) for c in creates])
+    wanted = created + updated
+    rows = {}
+    if wanted:
+        rows = {row["id"]: row_dict(row) for row in conn.execute(
+            f"SELECT * FROM events WHERE user_id=? AND id IN ({','.join('?' * len(wanted))})",
+            (user_id, *wanted),
+        )}
+    body = {
+        "created": [rows[i] for i in created if i in rows],
+        "updated": [rows[i] for i in updated if i in rows],
+        "deleted": [row_dict(existing[r]) for r in deletes],
+    }
+    if _wants_conflicts():
+        dates = [r["date"] for r in rows.values()] + [existing[r]["date"] for r in refs]
+        body["conflicts"] = conflicts_on(conn, user_id, dates)
+    return jsonify(body)
+
+
+@events_bp.route("/api/events/<event_id>", methods=["DELETE"])
+@login_required
+@query_budget(15)
 def delete_event(event_id):
-    conn = get_db()
-    event = conn.execute("SELECT * FROM events WHERE id=? AND user_id=?", (event_id, g.user_id)).fetchone()
+    conn = get_user_db()
+    user_id = g.user_id
+    occurrence = parse_virtual_id(event_id)
+    if occurrence is not None:
+        event = get_occurrence(conn, user_id, event_id)
+    elif event_id.isdigit():
+        event_id = int(event_id)
+        event = conn.execute("SELECT * FROM events WHERE id=? AND user_id=?", (event_id, user_id)).fetchone()
+        if not event and run_user_write(lambda conn: thaw_events(conn, user_id, [event_id])):
+            event = conn.execute("SELECT * FROM events WHERE id=? AND user_id=?", (event_id, user_id)).fetchone()
+    else:
+        event = None
     if not event:
         return jsonify({"error": "事件不存在"}), 404
-    event_data = dict(event)
-
-    conn.execute(
-        """INSERT INTO deleted_events (user_id, original_id, title, description, date,
-           start_time, end_time, color, category, priority, completed, col_type)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-        (g.user_id, event["id"], event["title"], event["description"], event["date"],
-         event["start_time"], event["end_time"], event["color"],
-         event["category"], event["priority"], event["completed"], event["col_type"]),
-    )
-    conn.execute("DELETE FROM events WHERE id=? AND user_id=?", (event_id, g.user_id))
-    conn.commit()
-    return jsonify({"success": True, "event": event_data})
+    event_data = row_dict(event)
+
+    def _delete(conn):
+        conn.execute(
+            """INSERT INTO deleted_events (user_id, original_id, title, description, date,
+               start_time, end_time, color, category, priority, completed, col_type)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (user_id, None if occurrence else event["id"], event["title"],
+             event["description"], event["date"], event["start_time"], event["end_time"],
+             event["color"], event["category"], event["priority"], event["completed"],
+             event["col_type"]),
+        )
+        if occurrence is not None:
+            cancel_occurrence(conn, user_id, *occurrence)
+            return
+        conn.execute("DELETE FROM events WHERE id=? AND user_id=?", (event_id, user_id))
+        forget_child(conn, user_id, event)
+        if event["recur_rule"]:
+            forget_series(conn, user_id, event_id)
+
+    run_user_write(_delete)
+    invalidate_suggestions(user_id)
+    body = {"success": True, "event": event_data}
+    if _wants_conflicts():
+        body["conflicts"] = conflicts_on(conn, user_id, [event_data["date"]])
+    return jsonify(body)
 
 
 
-@events_bp.route("/api/events/<int:event_id>/duplicate", methods=["POST"])
+@events_bp.route("/api/events/<event_id>/duplicate", methods=["POST"])
 @login_required
 def duplicate_event(event_id):
     """Copy a single event to a target date."""
@@ -227,120 +517,220 @@ def duplicate_event(event_id):
     if not DATE_RE.match(target_date):
         return jsonify({"error": "目标日期格式不正确"}), 400
 
-    conn = get_db()
-    event = conn.execute(
-        "SELECT * FROM events WHERE id=? AND user_id=?", (event_id, g.user_id)
-    ).fetchone()
+    conn = get_user_db()
+    if event_id.isdigit():
+        event = conn.execute(
+            f"SELECT * FROM {events_source(conn, g.user_id)} WHERE id=? AND user_id=?",
+            (int(event_id), g.user_id),
+        ).fetchone()
+    else:
+        event = get_occurrence(conn, g.user_id, event_id)
     if not event:
         return jsonify({"error": "事件不存在"}), 404
 
     src = dict(event)
-    cursor = conn.execute(
+    params = (g.user_id, src["title"], src.get("description", ""), target_date,
+              src["start_time"], src["end_time"], src["color"],
+              src.get("category", "其他"), src.get("priority", 2), src.get("col_type", "plan"))
+    new_id = run_user_write(lambda conn: conn.execute(
         """INSERT INTO events (user_id, title, description, date, start_time, end_time,
            color, category, priority, col_type)
            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-        (g.user_id, src["title"], src.get("description", ""), target_date,
-         src["start_time"], src["end_time"], src["color"],
-         src.get("category", "其他"), src.get("priority", 2), src.get("col_type", "plan")),
-    )
-    conn.commit()
+        params,
+    ).lastrowid)
+    record_use(g.user_id, "event", [(src["title"], target_date)])
 
-    new_event = dict(conn.execute("SELECT * FROM events WHERE id=?", (cursor.lastrowid,)).fetchone())
+    new_event = row_dict(conn.execute("SELECT * FROM events WHERE id=?", (new_id,)).fetchone())
     return jsonify({"event": new_event}), 201
 
 
+SERIES_SCOPES = ("this", "following", "all")
+
+
+def _event_changes(data, per_event=False):
+    """SET fragments and params for a partial edit, or an error message.
+
+    Series edits change the shared fields; *per_event* also allows the
+    fields that belong to one row (date, column, completion, rule).
+    """
+    fields, params = [], []
+    if "title" in data:
+        title = (data["title"] or "").strip()
+        if not title:
+            return None, None, "标题不能为空"
+        if len(title) > 200:
+            return None, None, "标题不能超过 200 个字符"
+        fields.append("title=?")
+        params.append(title)
+    if "description" in data:
+        desc = data["description"] or ""
+        if len(desc) > 5000:
+            return None, None, "备注不能超过 5000 个字符"
+        fields.append("description=?")
+        params.append(desc)
+    if "start_time" in data or "end_time" in data:
+        start_time = data.get("start_time", "")
+        end_time = data.get("end_time", "")
+        if not TIME_RE.match(start_time or "") or not TIME_RE.match(end_time or ""):
+            return None, None, "时间格式不正确"
+        if start_time >= end_time:
+            return None, None, "结束时间必须晚于开始时间"
+        fields += ["start_time=?", "end_time=?"]
+        params += [start_time, end_time]
+    if "color" in data:
+        fields.append("color=?")
+        params.append(_normalize_color(data["color"]))
+    if "category" in data:
+        fields.append("category=?")
+        params.append(data["category"] or "其他")
+    if "priority" in data:
+        try:
+            params.append(int(data["priority"]))
+        except (TypeError, ValueError):
+            return None, None, "优先级格式不正确"
+        fields.append("priority=?")
+    if not per_event:
+        return fields, params, None
+    if "date" in data:
+        if not validate_date(data["date"]):
+            return None, None, "日期格式不正确"
+        fields.append("date=?")
+        params.append(data["date"])
+    if "col_type" in data:
+        if data["col_type"] not in ("plan", "actual"):
+            return None, None, "无效的列类型"
+        fields.append("col_type=?")
+        params.append(data["col_type"])
+    if "completed" in data:
+        fields.append("completed=?")
+        params.append(1 if data["completed"] else 0)
+    if "recur_rule" in data:
+        try:
+            params.append(normalize_rule(data["recur_rule"]) if data["recur_rule"] else None)
+        except ValueError as e:
+            return None, None, f"重复规则无效: {e}"
+        fields.append("recur_rule=?")
+    return fields, params, None
+
+
+@events_bp.route("/api/events/<event_id>/series", methods=["PUT"])
+@login_required
+@query_budget(16)
+def update_event_series(event_id):
+    """Edit a recurring event: scope "this" (one occurrence), "following" or "all".
+
+    "following" splits the series at the occurrence: the original ends the
+    day before and a new series carrying the changes starts there.  The
+    parent and its stored children are updated by one statement.
+    """
+    data = request.json or {}
+    scope = data.get("scope")
+    if scope not in SERIES_SCOPES:
+        return jsonify({"error": "scope 必须是 this、following 或 all"}), 400
+    conn = get_user_db()
+    user_id = g.user_id
+    parent, pivot = find_series(conn, user_id, event_id)
+    if parent is None:
+        return jsonify({"error": "周期性事件不存在"}), 404
+
+    if scope == "this":
+        err = _validate_event_data(data)
+        if err:
+            return jsonify({"error": err}), 400
+        if pivot == parent["date"]:
+            run_user_write(lambda conn: split_off_first(conn, user_id, parent))
+        return update_event(event_id)
+
+    fields, params, err = _event_changes(data)
+    if err:
+        return jsonify({"error": err}), 400
+    new_rule = None
+    if data.get("recur_rule"):
+        try:
+            new_rule = normalize_rule(data["recur_rule"])
+        except ValueError as e:
+            return jsonify({"error": f"重复规则无效: {e}"}), 400
+    if not fields and not new_rule:
+        return jsonify({"error": "没有可更新的字段"}), 400
+
+    if scope == "all" or pivot == parent["date"]:
+        def _update_all(conn):
+            changed = update_series(conn, user_id, parent["id"], fields, params) if fields else 0
+            if new_rule:
+                conn.execute(
+                    "UPDATE events SET recur_rule=? WHERE id=? AND user_id=?",
+                    (new_rule, parent["id"], user_id),
+                )
+                reset_horizon(conn, user_id, parent["id"])
+            return parent["id"], changed
+        series_id, changed = run_user_write(_update_all)
+    else:
+        series_id, changed = run_user_write(
+            lambda conn: split_series(conn, user_id, parent, pivot, new_rule, fields, params)
+        )
+    if "title" in data:
+        invalidate_suggestions(user_id)
+    event = conn.execute(
+        "SELECT * FROM events WHERE id=? AND user_id=?", (series_id, user_id)
+    ).fetchone()
+    return jsonify({"success": True, "event": row_dict(event), "updated": changed})
+
+
+@events_bp.route("/api/events/<event_id>/series", methods=["DELETE"])
+@login_required
+@query_budget(18)
+def delete_event_series(event_id):
+    """Delete one occurrence ("this"), an occurrence and all later ones ("following") or a whole series ("all")."""
+    scope = request.args.get("scope", "")
+    if scope not in SERIES_SCOPES:
+        return jsonify({"error": "scope 必须是 this、following 或 all"}), 400
+    conn = get_user_db()
+    user_id = g.user_id
+    parent, pivot = find_series(conn, user_id, event_id)
+    if parent is None:
+        return jsonify({"error": "周期性事件不存在"}), 404
+
+    if scope == "this":
+        if pivot == parent["date"]:
+            run_user_write(lambda conn: split_off_first(conn, user_id, parent))
+        return delete_event(event_id)
+    if scope == "all" or pivot == parent["date"]:
+        removed = run_user_write(lambda conn: delete_series(conn, user_id, parent["id"]))
+    else:
+        removed = run_user_write(lambda conn: end_series(conn, user_id, parent, pivot))
+    invalidate_suggestions(user_id)
+    return jsonify({"success": True, "removed": removed})
+
+
 @events_bp.route("/api/events/generate-recurring", methods=["POST"])
 @login_required
+@query_budget(6)
 def generate_recurring():
-    """Generate instances for recurring events within a date range."""
+    """Generate instances for recurring events within a date range.
+
+    Only used with RECURRENCE_MODE=materialize; virtual mode expands series
+    when events are read, so there is nothing to generate.
+    """
     data = request.json or {}
     start = data.get("start", "")
     end = data.get("end", "")
     if not validate_date(start) or not validate_date(end):
         return jsonify({"error": "日期参数格式不正确"}), 400
-
-    conn = get_db()
-    recurring = conn.execute(
-        "SELECT * FROM events WHERE user_id=? AND recur_rule IS NOT NULL AND col_type='plan'",
-        (g.user_id,),
-    ).fetchall()
-
-    created = 0
-    start_dt = datetime.strptime(start, "%Y-%m-%d")
-    end_dt = datetime.strptime(end, "%Y-%m-%d")
-
-    for evt in recurring:
-        rule = evt["recur_rule"]
-        base_date = datetime.strptime(evt["date"], "%Y-%m-%d")
-        dates = _expand_recur(rule, base_date, start_dt, end_dt)
-
-        for d in dates:
-            ds = d.strftime("%Y-%m-%d")
-            existing = conn.execute(
-                "SELECT id FROM events WHERE user_id=? AND date=? AND recur_parent_id=? AND col_type='plan'",
-                (g.user_id, ds, evt["id"]),
-            ).fetchone()
-            if existing:
-                continue
-
-            conn.execute(
-                """INSERT INTO events (user_id, title, description, date, start_time, end_time,
-                   color, category, priority, col_type, recur_parent_id)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'plan', ?)""",
-                (g.user_id, evt["title"], evt["description"], ds,
-                 evt["start_time"], evt["end_time"], evt["color"],
-                 evt["category"], evt["priority"], evt["id"]),
-            )
-            created += 1
-
-    if created > 0:
-        conn.commit()
+    if RECURRENCE_MODE == "virtual":
+        return jsonify({"created": 0})
+
+    conn = get_user_db()
+    rows, horizons = plan_instances(conn, g.user_id, start, end)
+    if not rows and not horizons:
+        return jsonify({"created": 0})
+    created = run_user_write(lambda conn: store_instances(conn, rows, horizons))
     return jsonify({"created": created})
 
 
-def _expand_recur(rule, base_date, start_dt, end_dt):
-    """Return list of dates that match a recurrence rule within a range."""
-    dates = []
-    limit = 366
-
-    if rule == "monthly":
-        d = base_date
-        for _ in range(limit):
-            if d.month == 12:
-                next_year, next_mon = d.year + 1, 1
-            else:
-                next_year, next_mon = d.year, d.month + 1
-            max_day = calendar.monthrange(next_year, next_mon)[1]
-            d = d.replace(year=next_year, month=next_mon,
-                          day=min(base_date.day, max_day))
-            if d > end_dt:
-                break
-            if d >= start_dt:
-                dates.append(d)
-        return dates
-
-    d = base_date + timedelta(days=1)
-    count = 0
-    while d <= end_dt and count < limit:
-        if d >= start_dt:
-            if rule == "daily":
-                dates.append(d)
-            elif rule == "weekdays":
-                if d.weekday() < 5:
-                    dates.append(d)
-            elif rule == "weekly":
-                if d.weekday() == base_date.weekday():
-                    dates.append(d)
-        d += timedelta(days=1)
-        count += 1
-
-    return dates
-
-
 @events_bp.route("/api/events/trash", methods=["GET"])
 @login_required
 def get_trash():
-    conn = get_db()
+    conn = get_user_db()
     rows = conn.execute(
         """SELECT * FROM deleted_events WHERE user_id=?
            ORDER BY deleted_at DESC LIMIT 200""",
@@ -352,57 +742,89 @@ def get_trash():
 @events_bp.route("/api/events/trash/<int:item_id>/restore", methods=["POST"])
 @login_required
 def restore_from_trash(item_id):
-    conn = get_db()
+    conn = get_user_db()
     item = conn.execute(
         "SELECT * FROM deleted_events WHERE id=? AND user_id=?", (item_id, g.user_id)
     ).fetchone()
     if not item:
         return jsonify({"error": "回收站中不存在此事件"}), 404
 
-    cursor = conn.execute(
-        """INSERT INTO events (user_id, title, description, date, start_time, end_time,
-           color, category, priority, completed, col_type)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-        (g.user_id, item["title"], item["description"], item["date"],
-         item["start_time"], item["end_time"], item["color"],
-         item["category"], item["priority"], item["completed"], item["col_type"]),
-    )
-    conn.execute("DELETE FROM deleted_events WHERE id=?", (item_id,))
-    conn.commit()
+    user_id = g.user_id
+
+    def _restore(conn):
+        cursor = conn.execute(
+            """INSERT INTO events (user_id, title, description, date, start_time, end_time,
+               color, category, priority, completed, col_type)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (user_id, item["title"], item["description"], item["date"],
+             item["start_time"], item["end_time"], item["color"],
+             item["category"], item["priority"], item["completed"], item["col_type"]),
+        )
+        conn.execute("DELETE FROM deleted_events WHERE id=?", (item_id,))
+        return cursor.lastrowid
 
-    new_event = conn.execute("SELECT * FROM events WHERE id=?", (cursor.lastrowid,)).fetchone()
-    return jsonify({"success": True, "event": dict(new_event)})
+    new_id = run_user_write(_restore)
+    record_use(user_id, "event", [(item["title"], item["date"])])
+    new_event = conn.execute("SELECT * FROM events WHERE id=?", (new_id,)).fetchone()
+    return jsonify({"success": True, "event": row_dict(new_event)})
 
 
 @events_bp.route("/api/events/trash", methods=["DELETE"])
 @login_required
 def empty_trash():
-    conn = get_db()
-    conn.execute("DELETE FROM deleted_events WHERE user_id=?", (g.user_id,))
-    conn.commit()
+    user_id = g.user_id
+    run_user_write(lambda conn: conn.execute(
+        "DELETE FROM deleted_events WHERE user_id=?", (user_id,)
+    ))
     return jsonify({"success": True})
 
 
 @events_bp.route("/api/events/dates", methods=["GET"])
 @login_required
+@query_budget(5)
+@versioned("events")
 def events_dates():
     """Return distinct dates that have at least one event, within a date range."""
     start = request.args.get("start", "")
     end   = request.args.get("end",   "")
     if not validate_date(start) or not validate_date(end):
         return jsonify([])
-    conn = get_db()
-    rows = conn.execute(
-        "SELECT DISTINCT date FROM events WHERE user_id=? AND date BETWEEN ? AND ? ORDER BY date",
+    conn = get_user_db()
+    dates = {r["date"] for r in conn.execute(
+        f"SELECT DISTINCT date FROM {events_source(conn, g.user_id, start)} "
+        "WHERE user_id=? AND date BETWEEN ? AND ?",
         (g.user_id, start, end),
-    ).fetchall()
-    return jsonify([r["date"] for r in rows])
+    )}
+    if RECURRENCE_MODE == "virtual":
+        dates |= occurrence_dates(conn, g.user_id, start, end)
+    return jsonify(sorted(dates))
+
+
+@events_bp.route("/api/events/conflicts", methods=["GET"])
+@login_required
+@query_budget(7)
+@versioned("events")
+def events_conflicts():
+    """Groups of overlapping events per day and column, with a lane for each event.
+
+    Ranges longer than CONFLICTS_MAX_DAYS are cut short, as in /api/analytics.
+    """
+    start = request.args.get("start", "")
+    end = request.args.get("end", "")
+    if not validate_date(start) or not validate_date(end):
+        return jsonify({"error": "日期参数格式不正确"}), 400
+    start_dt = datetime.strptime(start, "%Y-%m-%d")
+    if (datetime.strptime(end, "%Y-%m-%d") - start_dt).days >= CONFLICTS_MAX_DAYS:
+        end = (start_dt + timedelta(days=CONFLICTS_MAX_DAYS - 1)).strftime("%Y-%m-%d")
+    if end < start:
+        return jsonify([])
+    return jsonify(conflicts_between(get_user_db(), g.user_id, start, end))
 
 
 @events_bp.route("/api/events/search", methods=["GET"])
 @login_required
 def search_events():
-    """Search events by keyword in title/description."""
+    """Search events by keyword in title/description (full-text index, fuzzy, or regex)."""
     q = (request.args.get("q") or "").strip()
     if not q:
         return jsonify([])
@@ -413,7 +835,8 @@ def search_events():
     case_sensitive = request.args.get("case_sensitive") == "1"
     whole_word     = request.args.get("whole_word")     == "1"
     use_regex      = request.args.get("regex")          == "1"
-    conn = get_db()
+    fuzzy          = request.args.get("fuzzy")          == "1"
+    conn = get_user_db()
 
     if use_regex:
         try:
@@ -421,38 +844,10 @@ def search_events():
             pattern = re.compile(q, flags)
         except re.error as exc:
             return jsonify({"error": str(exc)}), 400
-        rows = conn.execute(
-            "SELECT * FROM events WHERE user_id=? ORDER BY date DESC, start_time LIMIT ?",
-            (g.user_id, limit * 20),
-        ).fetchall()
-        matched, err = run_regex_with_timeout(
-            pattern, rows,
-            [lambda r: r["title"] or "", lambda r: r["description"] or ""],
-        )
+        rows = regex_event_rows(conn, g.user_id, pattern)
+        matched, err = regex_search(g.user_id, pattern, rows, ("title", "description"), limit)
         if err:
             return jsonify({"error": err}), 400
-        return jsonify([dict(r) for r in matched[:limit]])
-
-    # Non-regex: use LIKE for initial broad filter, then Python-refine
-    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
-    keyword = f"%{escaped}%"
-    fetch_limit = limit * 5 if (case_sensitive or whole_word) else limit
-    rows = conn.execute(
-        """SELECT * FROM events WHERE user_id=?
-           AND (title LIKE ? ESCAPE '\\' OR description LIKE ? ESCAPE '\\')
-           ORDER BY date DESC, start_time LIMIT ?""",
-        (g.user_id, keyword, keyword, fetch_limit),
-    ).fetchall()
-
-    if whole_word:
-        flags = 0 if case_sensitive else re.IGNORECASE
-        pattern = re.compile(r"\b" + re.escape(q) + r"\b", flags)
-        events = [dict(r) for r in rows
-                  if pattern.search(r["title"] or "") or pattern.search(r["description"] or "")]
-    elif case_sensitive:
-        events = [dict(r) for r in rows
-                  if q in (r["title"] or "") or q in (r["description"] or "")]
-    else:
-        events = [dict(r) for r in rows]
+        return jsonify([row_dict(r) for r in matched])
 
-    return jsonify(events[:limit])
+    return jsonify(find_events(conn, g.user_id, q, limit, case_sensitive, whole_word, fuzzy))
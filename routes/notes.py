@@ -7,8 +7,12 @@ from flask import Blueprint, request, jsonify, g
 from werkzeug.utils import secure_filename
 
 from config import ALLOWED_NOTE_IMAGE_EXTENSIONS, NOTE_IMAGE_MAX_SIZE
-from database import get_db
-from auth_utils import login_required, validate_date, run_regex_with_timeout
+from database import get_user_db, run_user_write
+from search import find_notes, regex_note_rows
+from db_trace import query_budget
+from http_cache import versioned
+from regex_sandbox import regex_search
+from auth_utils import login_required, validate_date
 from storage import get_storage
 
 logger = logging.getLogger(__name__)
@@ -65,13 +69,12 @@ def upload_note_image():
         logger.warning("笔记图片处理失败: %s", e)
         return jsonify({"error": "图片处理失败，请上传有效的图片文件"}), 400
 
+    user_id = g.user_id
     try:
-        conn = get_db()
-        conn.execute(
+        run_user_write(lambda conn: conn.execute(
             "INSERT INTO note_images (user_id, token, storage_path) VALUES (?, ?, ?)",
-            (g.user_id, token, storage_path),
-        )
-        conn.commit()
+            (user_id, token, storage_path),
+        ))
     except Exception:
         storage.delete(storage_path)
         logger.error("保存图片记录失败，已清理存储文件: %s", storage_path)
@@ -86,7 +89,7 @@ def serve_note_image(token):
     if not re.match(r"^[0-9a-f]{32}$", token):
         return jsonify({"error": "无效的图片令牌"}), 404
 
-    conn = get_db()
+    conn = get_user_db()
     row = conn.execute(
         "SELECT storage_path FROM note_images WHERE token=? AND user_id=?",
         (token, g.user_id),
@@ -100,13 +103,15 @@ def serve_note_image(token):
 
 @notes_bp.route("/api/notes/dates", methods=["GET"])
 @login_required
+@query_budget(3)
+@versioned("notes")
 def notes_dates():
     """Return dates that have non-empty notes, within a date range."""
     start = request.args.get("start", "")
     end   = request.args.get("end",   "")
     if not validate_date(start) or not validate_date(end):
         return jsonify([])
-    conn = get_db()
+    conn = get_user_db()
     rows = conn.execute(
         """SELECT DISTINCT date FROM notes WHERE user_id=? AND date BETWEEN ? AND ?
            AND content IS NOT NULL AND content != '' ORDER BY date""",
@@ -118,7 +123,7 @@ def notes_dates():
 @notes_bp.route("/api/notes/search", methods=["GET"])
 @login_required
 def search_notes():
-    """Search notes by keyword in content."""
+    """Search notes by keyword in content (full-text index, fuzzy, or regex)."""
     q = (request.args.get("q") or "").strip()
     if not q:
         return jsonify([])
@@ -129,7 +134,8 @@ def search_notes():
     case_sensitive = request.args.get("case_sensitive") == "1"
     whole_word     = request.args.get("whole_word")     == "1"
     use_regex      = request.args.get("regex")          == "1"
-    conn = get_db()
+    fuzzy          = request.args.get("fuzzy")          == "1"
+    conn = get_user_db()
 
     if use_regex:
         try:
@@ -137,48 +143,25 @@ def search_notes():
             pattern = re.compile(q, flags)
         except re.error as exc:
             return jsonify({"error": str(exc)}), 400
-        rows = conn.execute(
-            "SELECT * FROM notes WHERE user_id=? ORDER BY date DESC LIMIT ?",
-            (g.user_id, limit * 20),
-        ).fetchall()
-        matched, err = run_regex_with_timeout(
-            pattern, rows,
-            [lambda r: r["content"] or ""],
-        )
+        rows = regex_note_rows(conn, g.user_id, pattern)
+        matched, err = regex_search(g.user_id, pattern, rows, ("content",), limit)
         if err:
             return jsonify({"error": err}), 400
-        return jsonify([dict(r) for r in matched[:limit]])
+        return jsonify([dict(r) for r in matched])
 
-    # Non-regex: LIKE broad filter then Python-refine
-    escaped = q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
-    keyword = f"%{escaped}%"
-    fetch_limit = limit * 5 if (case_sensitive or whole_word) else limit
-    rows = conn.execute(
-        """SELECT * FROM notes WHERE user_id=? AND content LIKE ? ESCAPE '\\'
-           ORDER BY date DESC LIMIT ?""",
-        (g.user_id, keyword, fetch_limit),
-    ).fetchall()
-
-    if whole_word:
-        flags = 0 if case_sensitive else re.IGNORECASE
-        pattern = re.compile(r"\b" + re.escape(q) + r"\b", flags)
-        notes = [dict(r) for r in rows if pattern.search(r["content"] or "")]
-    elif case_sensitive:
-        notes = [dict(r) for r in rows if q in (r["content"] or "")]
-    else:
-        notes = [dict(r) for r in rows]
-
-    return jsonify(notes[:limit])
+    return jsonify(find_notes(conn, g.user_id, q, limit, case_sensitive, whole_word, fuzzy))
 
 
 @notes_bp.route("/api/notes", methods=["GET"])
 @login_required
+@query_budget(3)
+@versioned("notes")
 def list_notes():
     """Return all notes for a given date, ordered by creation time."""
     date = request.args.get("date", "")
     if not validate_date(date):
         return jsonify({"error": "日期格式不正确"}), 400
-    conn = get_db()
+    conn = get_user_db()
     rows = conn.execute(
         "SELECT * FROM notes WHERE user_id=? AND date=? ORDER BY id",
         (g.user_id, date),
@@ -202,13 +185,12 @@ def create_note():
     if len(content) > MAX_NOTE_LENGTH:
         return jsonify({"error": f"笔记内容不能超过 {MAX_NOTE_LENGTH} 个字符"}), 400
 
-    conn = get_db()
-    cursor = conn.execute(
+    user_id = g.user_id
+    new_id = run_user_write(lambda conn: conn.execute(
         "INSERT INTO notes (user_id, date, content) VALUES (?, ?, ?)",
-        (g.user_id, date, content),
-    )
-    conn.commit()
-    row = conn.execute("SELECT * FROM notes WHERE id=?", (cursor.lastrowid,)).fetchone()
+        (user_id, date, content),
+    ).lastrowid)
+    row = get_user_db().execute("SELECT * FROM notes WHERE id=?", (new_id,)).fetchone()
     return jsonify(dict(row)), 201
 
 
@@ -223,18 +205,18 @@ def update_note(note_id):
     if len(content) > MAX_NOTE_LENGTH:
         return jsonify({"error": f"笔记内容不能超过 {MAX_NOTE_LENGTH} 个字符"}), 400
 
-    conn = get_db()
+    conn = get_user_db()
     row = conn.execute(
         "SELECT id FROM notes WHERE id=? AND user_id=?", (note_id, g.user_id)
     ).fetchone()
     if not row:
         return jsonify({"error": "笔记不存在"}), 404
 
-    conn.execute(
+    user_id = g.user_id
+    run_user_write(lambda conn: conn.execute(
         "UPDATE notes SET content=?, updated_at=datetime('now','localtime') WHERE id=? AND user_id=?",
-        (content, note_id, g.user_id),
-    )
-    conn.commit()
+        (content, note_id, user_id),
+    ))
     return jsonify({"success": True})
 
 
@@ -242,13 +224,15 @@ def update_note(note_id):
 @login_required
 def delete_note(note_id):
     """Delete a note by ID."""
-    conn = get_db()
+    conn = get_user_db()
     row = conn.execute(
         "SELECT id FROM notes WHERE id=? AND user_id=?", (note_id, g.user_id)
     ).fetchone()
     if not row:
         return jsonify({"error": "笔记不存在"}), 404
 
-    conn.execute("DELETE FROM notes WHERE id=? AND user_id=?", (note_id, g.user_id))
-    conn.commit()
+    user_id = g.user_id
+    run_user_write(lambda conn: conn.execute(
+        "DELETE FROM notes WHERE id=? AND user_id=?", (note_id, user_id)
+    ))
     return jsonify({"success": True})
@@ -0,0 +1,221 @@
+import re
+
+from flask import Blueprint, request, jsonify, g
+
+from database import get_user_db, run_user_write, epoch_day, row_dict
+from db_trace import query_budget
+from auth_utils import login_required, validate_date
+from suggest import record_use
+from scheduler import (
+    STRATEGIES, DEFAULT_WORK_START, DEFAULT_WORK_END, DEFAULT_WEEKDAYS,
+    free_slots, pack, to_minutes, to_clock,
+)
+
+schedule_bp = Blueprint("schedule", __name__)
+
+TIME_RE = re.compile(r"^(?:[01]\d|2[0-3]):[0-5]\d$|^24:00$")
+COLOR_RE = re.compile(r"^#[0-9a-fA-F]{6}$")
+SCHEDULE_MAX_DAYS = 62
+MAX_ITEMS = 100
+MAX_GAP = 120
+_DEFAULT_TODO_MINUTES = 30
+
+_INSERT_SQL = """INSERT INTO events (user_id, title, description, date, start_time, end_time,
+    color, category, priority, col_type)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'plan')"""
+
+
+def _window(data):
+    """Validate the date range and working hours shared by both endpoints; returns (options, error)."""
+    start, end = data.get("start") or "", data.get("end") or ""
+    if not validate_date(start) or not validate_date(end):
+        return None, "日期参数格式不正确"
+    if end < start:
+        return None, "结束日期不能早于开始日期"
+    if epoch_day(end) - epoch_day(start) >= SCHEDULE_MAX_DAYS:
+        return None, f"日期范围不能超过 {SCHEDULE_MAX_DAYS} 天"
+    work_start = data.get("work_start") or DEFAULT_WORK_START
+    work_end = data.get("work_end") or DEFAULT_WORK_END
+    not_before = data.get("not_before") or None
+    if not all(TIME_RE.match(t) for t in (work_start, work_end, not_before or "00:00")):
+        return None, "时间格式不正确"
+    if to_minutes(work_start) >= to_minutes(work_end):
+        return None, "结束时间必须晚于开始时间"
+    weekdays = data.get("weekdays", DEFAULT_WEEKDAYS)
+    if isinstance(weekdays, str):
+        weekdays = [w for w in weekdays.split(",") if w.strip()]
+    try:
+        weekdays = {int(w) for w in weekdays}
+    except (TypeError, ValueError):
+        return None, "weekdays 必须是 0（周一）到 6（周日）的数字"
+    if not weekdays or not weekdays <= set(range(7)):
+        return None, "weekdays 必须是 0（周一）到 6（周日）的数字"
+    return {
+        "start": start, "end": end, "work_start": work_start, "work_end": work_end,
+        "weekdays": weekdays, "not_before": not_before,
+    }, None
+
+
+def _bounded(value, default, low, high):
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        raise ValueError(value)
+    return min(max(int(value), low), high)
+
+
+def _load_items(conn, user_id, raw):
+    """Resolve [{"todo_id" | "template_id", "duration_minutes"?, "priority"?}, ...]; returns (items, error, status)."""
+    if not isinstance(raw, list) or not raw:
+        return None, "请选择要安排的待办或模板", 400
+    if len(raw) > MAX_ITEMS:
+        return None, f"一次最多安排 {MAX_ITEMS} 项", 400
+    refs = {"todo_id": set(), "template_id": set()}
+    for i, item in enumerate(raw):
+        keys = [k for k in refs if isinstance(item, dict) and item.get(k) is not None]
+        if len(keys) != 1:
+            return None, f"items[{i}]: 需要 todo_id 或 template_id 之一", 400
+        try:
+            refs[keys[0]].add(int(item[keys[0]]))
+        except (TypeError, ValueError):
+            return None, f"items[{i}]: id 无效", 400
+
+    def _rows(sql, ids):
+        if not ids:
+            return {}
+        return {row["id"]: row for row in conn.execute(
+            sql.format(",".join("?" * len(ids))), (user_id, *ids)
+        )}
+
+    todos = _rows("SELECT id, text FROM todos WHERE user_id=? AND id IN ({})", refs["todo_id"])
+    templates = _rows(
+        """SELECT id, title, description, duration_minutes, color, category, priority
+           FROM event_templates WHERE user_id=? AND id IN ({})""",
+        refs["template_id"],
+    )
+
+    items = []
+    for i, item in enumerate(raw):
+        if item.get("todo_id") is not None:
+            row = todos.get(int(item["todo_id"]))
+            if row is None:
+                return None, "待办不存在", 404
+            base = {
+                "source": "todo", "source_id": row["id"], "title": row["text"][:200],
+                "description": "", "duration_minutes": _DEFAULT_TODO_MINUTES,
+                "color": None, "category": "工作", "priority": 2,
+            }
+        else:
+            row = templates.get(int(item["template_id"]))
+            if row is None:
+                return None, "模板不存在", 404
+            base = {
+                "source": "template", "source_id": row["id"], "title": row["title"],
+                "description": row["description"] or "",
+                "duration_minutes": row["duration_minutes"] or 60,
+                "color": row["color"], "category": row["category"] or "其他",
+                "priority": row["priority"] or 2,
+            }
+        try:
+            base["duration_minutes"] = _bounded(item.get("duration_minutes"), base["duration_minutes"], 5, 480)
+            base["priority"] = _bounded(item.get("priority"), base["priority"], 1, 3)
+        except (TypeError, ValueError):
+            return None, f"items[{i}]: 时长或优先级无效", 400
+        if not COLOR_RE.match(base["color"] or ""):
+            base["color"] = "#6c5ce7"
+        items.append(base)
+    return items, None, None
+
+
+def _public(item):
+    return {k: v for k, v in item.items() if k not in ("description", "color", "category")}
+
+
+@schedule_bp.route("/api/schedule/free", methods=["GET"])
+@login_required
+@query_budget(5)
+def get_free_slots():
+    """Open time in the plan column within working hours, per day."""
+    options, err = _window(request.args)
+    if err:
+        return jsonify({"error": err}), 400
+    try:
+        min_minutes = _bounded(request.args.get("min"), 15, 5, 1440)
+    except (TypeError, ValueError):
+        return jsonify({"error": "min 参数无效"}), 400
+    slots = free_slots(get_user_db(), g.user_id, min_minutes=min_minutes, **options)
+    return jsonify([
+        {"date": day, "start_time": to_clock(s), "end_time": to_clock(e), "minutes": e - s}
+        for day, s, e in slots
+    ])
+
+
+@schedule_bp.route("/api/schedule", methods=["POST"])
+@login_required
+@query_budget(12)
+def auto_schedule():
+    """Pack todos and templates into free time; with "apply": true, create the events.
+
+    Body: {"start", "end", "work_start", "work_end", "weekdays", "not_before",
+    "gap", "strategy", "items": [{"todo_id" | "template_id", "duration_minutes",
+    "priority"}, ...], "apply"}.  Applying plans again inside the write
+    transaction, so the events never overlap plans written in the meantime.
+    """
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({"error": "请求数据不能为空"}), 400
+    options, err = _window(data)
+    if err:
+        return jsonify({"error": err}), 400
+    name = data.get("strategy") or "priority"
+    if name not in STRATEGIES:
+        return jsonify({"error": f"未知的排程策略: {name}"}), 400
+    try:
+        gap = _bounded(data.get("gap"), 0, 0, MAX_GAP)
+    except (TypeError, ValueError):
+        return jsonify({"error": "gap 参数无效"}), 400
+
+    user_id = g.user_id
+    conn = get_user_db()
+    items, err, status = _load_items(conn, user_id, data.get("items"))
+    if err:
+        return jsonify({"error": err}), status
+
+    def _plan(conn):
+        return pack(items, free_slots(conn, user_id, **options), gap, name)
+
+    if not data.get("apply"):
+        placed, unplaced = _plan(conn)
+        return jsonify({
+            "strategy": name,
+            "scheduled": [_public(p) for p in placed],
+            "unscheduled": [_public(u) for u in unplaced],
+        })
+
+    def _apply(conn):
+        placed, unplaced = _plan(conn)
+        created = []
+        if placed:
+            conn.executemany(_INSERT_SQL, [
+                (user_id, p["title"], p["description"], p["date"], p["start_time"],
+                 p["end_time"], p["color"], p["category"], p["priority"])
+                for p in placed
+            ])
+            last = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+            created = list(range(last - len(placed) + 1, last + 1))
+        return placed, unplaced, created
+
+    placed, unplaced, created = run_user_write(_apply)
+    rows = {}
+    if created:
+        record_use(user_id, "event", [(p["title"], p["date"]) for p in placed])
+        rows = {row["id"]: row_dict(row) for row in conn.execute(
+            f"SELECT * FROM events WHERE user_id=? AND id IN ({','.join('?' * len(created))})",
+            (user_id, *created),
+        )}
+    return jsonify({
+        "strategy": name,
+        "scheduled": [{**_public(p), "event_id": i} for p, i in zip(placed, created)],
+        "unscheduled": [_public(u) for u in unplaced],
+        "created": [rows[i] for i in created if i in rows],
+    }), 201
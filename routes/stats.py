@@ -1,7 +1,9 @@
 import re
 from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify, g
-from database import get_db
+from database import get_user_db, epoch_day, from_epoch_day, row_dict
+from archive import events_source, timer_source
+from db_trace import query_budget
 from auth_utils import login_required
 
 stats_bp = Blueprint("stats", __name__)
@@ -11,31 +13,32 @@ DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 
 @stats_bp.route("/api/stats", methods=["GET"])
 @login_required
+@query_budget(3)
 def get_stats():
     date = request.args.get("date", "")
     if not DATE_RE.match(date):
         return jsonify({"error": "日期格式不正确"}), 400
-    conn = get_db()
-    total = conn.execute(
-        "SELECT COUNT(*) as count FROM events WHERE user_id=? AND date = ? AND col_type='actual'",
-        (g.user_id, date),
-    ).fetchone()["count"]
-    completed = conn.execute(
-        "SELECT COUNT(*) as count FROM events WHERE user_id=? AND date = ? AND col_type='actual' AND completed = 1",
-        (g.user_id, date),
-    ).fetchone()["count"]
-    events = conn.execute(
-        "SELECT start_time, end_time FROM events WHERE user_id=? AND date = ? AND col_type='actual'",
-        (g.user_id, date),
-    ).fetchall()
-    total_minutes = 0
-    for e in events:
-        try:
-            sh, sm = map(int, e["start_time"].split(":"))
-            eh, em = map(int, e["end_time"].split(":"))
-            total_minutes += (eh * 60 + em) - (sh * 60 + sm)
-        except (ValueError, AttributeError):
-            continue
+    try:
+        day_num = epoch_day(date)
+    except ValueError:
+        return jsonify({"error": "日期格式不正确"}), 400
+    conn = get_user_db()
+    row = conn.execute(
+        """SELECT COUNT(*) AS total,
+                  COALESCE(SUM(completed = 1), 0) AS completed,
+                  COALESCE(SUM(end_min - start_min), 0) AS minutes
+           FROM events WHERE user_id=? AND col_type='actual' AND day_num=?""",
+        (g.user_id, day_num),
+    ).fetchone()
+    total, completed, total_minutes = row["total"], row["completed"], row["minutes"]
+    archived = conn.execute(
+        "SELECT events, completed_events, event_minutes FROM daily_summaries WHERE user_id=? AND day_num=?",
+        (g.user_id, day_num),
+    ).fetchone()
+    if archived:
+        total += archived["events"]
+        completed += archived["completed_events"]
+        total_minutes += archived["event_minutes"]
     return jsonify(
         {
             "total": total,
@@ -48,6 +51,9 @@ def get_stats():
 
 @stats_bp.route("/api/analytics", methods=["GET"])
 @login_required
+# Summary: 3 aggregates, the archive lookup and 2 breakdowns; the detail
+# lists add the timer archive lookup and 2 row queries.
+@query_budget(lambda: 6 if request.args.get("detail", "1") == "0" else 9)
 def get_analytics():
     start = request.args.get("start", "")
     end = request.args.get("end", "")
@@ -59,21 +65,107 @@ def get_analytics():
     if (end_dt - start_dt).days > 366:
         end = (start_dt + timedelta(days=366)).strftime("%Y-%m-%d")
 
-    conn = get_db()
-    events = conn.execute(
-        "SELECT * FROM events WHERE user_id=? AND date >= ? AND date <= ? ORDER BY date",
-        (g.user_id, start, end),
-    ).fetchall()
-    timer_records = conn.execute(
-        "SELECT * FROM timer_records WHERE user_id=? AND date >= ? AND date <= ? ORDER BY date",
-        (g.user_id, start, end),
-    ).fetchall()
-    return jsonify(
-        {
-            "events": [dict(e) for e in events],
-            "timer_records": [dict(r) for r in timer_records],
-        }
-    )
+    conn = get_user_db()
+    source = events_source(conn, g.user_id, start)
+    result = {"summary": _analytics_summary(conn, g.user_id, start, end, source)}
+    if request.args.get("detail", "1") != "0":
+        events = conn.execute(
+            f"SELECT * FROM {source} "
+            "WHERE user_id=? AND date >= ? AND date <= ? ORDER BY date",
+            (g.user_id, start, end),
+        ).fetchall()
+        timer_records = conn.execute(
+            f"SELECT * FROM {timer_source(conn, g.user_id, start)} "
+            "WHERE user_id=? AND date >= ? AND date <= ? ORDER BY date",
+            (g.user_id, start, end),
+        ).fetchall()
+        result["events"] = [row_dict(e) for e in events]
+        result["timer_records"] = [row_dict(r) for r in timer_records]
+    return jsonify(result)
+
+
+def _analytics_summary(conn, user_id, start, end, source):
+    """Aggregate actual events and timer records over [start, end] in SQL.
+
+    *source* is the events FROM-clause for *start* (see events_source).
+    """
+    lo, hi = epoch_day(start), epoch_day(end)
+    days = {}
+
+    def _day(day_num):
+        return days.setdefault(day_num, {
+            "date": from_epoch_day(day_num), "events": 0,
+            "event_minutes": 0, "timer_count": 0, "focus_minutes": 0,
+        })
+
+    totals = {"events": 0, "event_minutes": 0, "timer_count": 0,
+              "timer_completed": 0, "focus_seconds": 0}
+    for row in conn.execute(
+        """SELECT day_num, COUNT(*) AS n, SUM(end_min - start_min) AS minutes
+           FROM events WHERE user_id=? AND col_type='actual' AND day_num BETWEEN ? AND ?
+           GROUP BY day_num""",
+        (user_id, lo, hi),
+    ):
+        d = _day(row["day_num"])
+        d["events"] += row["n"]
+        d["event_minutes"] += row["minutes"]
+        totals["events"] += row["n"]
+        totals["event_minutes"] += row["minutes"]
+
+    for row in conn.execute(
+        """SELECT day_num, COUNT(*) AS n, SUM(completed = 1) AS done,
+                  SUM(actual_seconds) AS seconds,
+                  SUM(CAST(ROUND(actual_seconds / 60.0) AS INTEGER)) AS minutes
+           FROM timer_records WHERE user_id=? AND day_num BETWEEN ? AND ?
+           GROUP BY day_num""",
+        (user_id, lo, hi),
+    ):
+        d = _day(row["day_num"])
+        d["timer_count"] += row["n"]
+        d["focus_minutes"] += row["minutes"]
+        totals["timer_count"] += row["n"]
+        totals["timer_completed"] += row["done"]
+        totals["focus_seconds"] += row["seconds"]
+
+    # Archived days contribute through their pre-aggregated summaries.
+    for row in conn.execute(
+        """SELECT day_num, events, event_minutes, timer_count, timer_completed,
+                  focus_seconds, focus_minutes
+           FROM daily_summaries WHERE user_id=? AND day_num BETWEEN ? AND ?""",
+        (user_id, lo, hi),
+    ):
+        d = _day(row["day_num"])
+        d["events"] += row["events"]
+        d["event_minutes"] += row["event_minutes"]
+        d["timer_count"] += row["timer_count"]
+        d["focus_minutes"] += row["focus_minutes"]
+        for key in totals:
+            totals[key] += row[key]
+
+    categories = {
+        row["category"]: row["minutes"]
+        for row in conn.execute(
+            f"""SELECT category, SUM(end_min - start_min) AS minutes
+               FROM {source} WHERE user_id=? AND col_type='actual' AND day_num BETWEEN ? AND ?
+               GROUP BY category""",
+            (user_id, lo, hi),
+        )
+    }
+    priorities = {
+        str(row["priority"]): row["n"]
+        for row in conn.execute(
+            f"""SELECT priority, COUNT(*) AS n
+               FROM {source} WHERE user_id=? AND col_type='actual' AND day_num BETWEEN ? AND ?
+               GROUP BY priority""",
+            (user_id, lo, hi),
+        )
+    }
+    return {
+        **totals,
+        "daily": [days[k] for k in sorted(days)],
+        "category_minutes": categories,
+        "priority_counts": priorities,
+    }
 
 
 @stats_bp.route("/api/stats/heatmap", methods=["GET"])
@@ -82,7 +174,7 @@ def get_heatmap():
     """Return daily activity counts for the past year (for heatmap rendering)."""
     end_date = datetime.now().strftime("%Y-%m-%d")
     start_date = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
-    conn = get_db()
+    conn = get_user_db()
     events = conn.execute(
         """SELECT date, COUNT(*) as count FROM events
            WHERE user_id=? AND col_type='actual' AND date >= ? AND date <= ?
@@ -97,18 +189,33 @@ def get_heatmap():
         (g.user_id, start_date, end_date),
     ).fetchall()
 
+    archived = conn.execute(
+        """SELECT date, events, timer_count, focus_seconds FROM daily_summaries
+           WHERE user_id=? AND day_num BETWEEN ? AND ?""",
+        (g.user_id, epoch_day(start_date), epoch_day(end_date)),
+    ).fetchall()
+
     activity = {}
-    for row in events:
-        d = row["date"]
+    seconds = {}
+
+    def _entry(d):
         if d not in activity:
             activity[d] = {"events": 0, "timer_count": 0, "focus_minutes": 0}
-        activity[d]["events"] = row["count"]
+            seconds[d] = 0
+        return activity[d]
+
+    for row in events:
+        _entry(row["date"])["events"] += row["count"]
     for row in timer:
-        d = row["date"]
-        if d not in activity:
-            activity[d] = {"events": 0, "timer_count": 0, "focus_minutes": 0}
-        activity[d]["timer_count"] = row["count"]
-        activity[d]["focus_minutes"] = round(row["seconds"] / 60)
+        _entry(row["date"])["timer_count"] += row["count"]
+        seconds[row["date"]] += row["seconds"]
+    for row in archived:
+        entry = _entry(row["date"])
+        entry["events"] += row["events"]
+        entry["timer_count"] += row["timer_count"]
+        seconds[row["date"]] += row["focus_seconds"]
+    for d, entry in activity.items():
+        entry["focus_minutes"] = round(seconds[d] / 60)
 
     result = []
     for date_str, data in sorted(activity.items()):
@@ -131,43 +238,34 @@ def get_heatmap():
 @login_required
 def get_streak():
     """Calculate the current streak (consecutive days with activity)."""
-    conn = get_db()
-    cutoff = (datetime.now() - timedelta(days=730)).strftime("%Y-%m-%d")
-    rows = conn.execute(
-        """SELECT DISTINCT date FROM (
-            SELECT date FROM events WHERE user_id=? AND col_type='actual' AND date >= ?
-            UNION
-            SELECT date FROM timer_records WHERE user_id=? AND date >= ?
-        ) ORDER BY date DESC""",
-        (g.user_id, cutoff, g.user_id, cutoff),
+    conn = get_user_db()
+    today = epoch_day(datetime.now())
+    cutoff = today - 730
+    # Gaps-and-islands: consecutive day numbers share day_num - row_number().
+    runs = conn.execute(
+        """WITH days AS (
+               SELECT day_num FROM events WHERE user_id=? AND col_type='actual' AND day_num >= ?
+               UNION
+               SELECT day_num FROM timer_records WHERE user_id=? AND day_num >= ?
+               UNION
+               SELECT day_num FROM daily_summaries
+               WHERE user_id=? AND day_num >= ? AND (events > 0 OR timer_count > 0)
+           )
+           SELECT MAX(day_num) AS last_day, COUNT(*) AS length
+           FROM (SELECT day_num, day_num - ROW_NUMBER() OVER (ORDER BY day_num) AS grp FROM days)
+           GROUP BY grp""",
+        (g.user_id, cutoff, g.user_id, cutoff, g.user_id, cutoff),
     ).fetchall()
 
-    if not rows:
+    if not runs:
         return jsonify({"current_streak": 0, "longest_streak": 0, "total_active_days": 0})
 
-    dates = sorted(set(r["date"] for r in rows), reverse=True)
-    today = datetime.now().strftime("%Y-%m-%d")
-    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
-
     current_streak = 0
-    if dates[0] == today or dates[0] == yesterday:
-        check_date = datetime.strptime(dates[0], "%Y-%m-%d")
-        date_set = set(dates)
-        while check_date.strftime("%Y-%m-%d") in date_set:
-            current_streak += 1
-            check_date -= timedelta(days=1)
-
-    longest_streak = 0
-    streak = 1
-    for i in range(1, len(dates)):
-        d1 = datetime.strptime(dates[i - 1], "%Y-%m-%d")
-        d2 = datetime.strptime(dates[i], "%Y-%m-%d")
-        if (d1 - d2).days == 1:
-            streak += 1
-        else:
-            longest_streak = max(longest_streak, streak)
-            streak = 1
-    longest_streak = max(longest_streak, streak)
+    for run in runs:
+        if run["last_day"] in (today, today - 1):
+            current_streak = run["length"]
+    longest_streak = max(run["length"] for run in runs)
+    total_active_days = sum(run["length"] for run in runs)
 
     total_events = conn.execute(
         "SELECT COUNT(*) as c FROM events WHERE user_id=? AND col_type='actual'",
@@ -177,11 +275,18 @@ def get_streak():
         "SELECT COALESCE(SUM(actual_seconds), 0) as s FROM timer_records WHERE user_id=?",
         (g.user_id,),
     ).fetchone()["s"]
+    archived = conn.execute(
+        """SELECT COALESCE(SUM(events), 0) AS events, COALESCE(SUM(focus_seconds), 0) AS seconds
+           FROM daily_summaries WHERE user_id=?""",
+        (g.user_id,),
+    ).fetchone()
+    total_events += archived["events"]
+    total_focus_seconds += archived["seconds"]
 
     return jsonify({
         "current_streak": current_streak,
         "longest_streak": longest_streak,
-        "total_active_days": len(dates),
+        "total_active_days": total_active_days,
         "total_events": total_events,
         "total_focus_hours": round(total_focus_seconds / 3600, 1),
     })
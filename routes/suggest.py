@@ -0,0 +1,26 @@
+from flask import Blueprint, request, jsonify, g
+
+from database import get_user_db
+from db_trace import query_budget
+from auth_utils import login_required
+from suggest import KINDS, suggest
+
+suggest_bp = Blueprint("suggest", __name__)
+
+MAX_SUGGESTIONS = 20
+
+
+@suggest_bp.route("/api/suggest", methods=["GET"])
+@login_required
+@query_budget(3)
+def get_suggestions():
+    """Complete a title prefix from the user's events, timer records and templates."""
+    q = (request.args.get("q") or "").strip()
+    if len(q) > 100:
+        return jsonify([])
+    kinds = tuple(k for k in (request.args.get("kind") or "").split(",") if k in KINDS) or KINDS
+    try:
+        limit = min(max(int(request.args.get("limit", 8)), 1), MAX_SUGGESTIONS)
+    except (ValueError, TypeError):
+        limit = 8
+    return jsonify(suggest(get_user_db, g.user_id, q, kinds, limit))
@@ -0,0 +1,23 @@
+from flask import Blueprint, request, jsonify, g
+
+from database import get_user_db
+from db_trace import query_budget
+from auth_utils import login_required
+from sync import changes_since
+
+sync_bp = Blueprint("sync", __name__)
+
+SYNC_PAGE_SIZE = 200
+SYNC_PAGE_MAX = 1000
+
+
+@sync_bp.route("/api/sync", methods=["GET"])
+@login_required
+@query_budget(8)
+def get_changes():
+    """Events, notes, todos and timer records changed after ?cursor=, one entry per item."""
+    try:
+        limit = min(max(int(request.args.get("limit", SYNC_PAGE_SIZE)), 1), SYNC_PAGE_MAX)
+    except (ValueError, TypeError):
+        limit = SYNC_PAGE_SIZE
+    return jsonify(changes_since(get_user_db(), g.user_id, request.args.get("cursor"), limit))
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, g
-from database import get_db
+from database import get_user_db, run_user_write
 from auth_utils import login_required
+from suggest import record_use, invalidate_suggestions
 
 templates_bp = Blueprint("templates", __name__)
 
@@ -10,7 +11,7 @@ MAX_TEMPLATES = 50
 @templates_bp.route("/api/templates", methods=["GET"])
 @login_required
 def get_templates():
-    conn = get_db()
+    conn = get_user_db()
     rows = conn.execute(
         "SELECT * FROM event_templates WHERE user_id=? ORDER BY created_at DESC",
         (g.user_id,),
@@ -29,7 +30,7 @@ def create_template():
     if len(name) > 50 or len(title) > 100:
         return jsonify({"error": "名称或标题过长"}), 400
 
-    conn = get_db()
+    conn = get_user_db()
     count = conn.execute(
         "SELECT COUNT(*) as c FROM event_templates WHERE user_id=?", (g.user_id,)
     ).fetchone()["c"]
@@ -40,31 +41,32 @@ def create_template():
         duration = min(max(int(data.get("duration_minutes", 60)), 5), 480)
     except (ValueError, TypeError):
         duration = 60
-    cursor = conn.execute(
+    params = (
+        g.user_id,
+        name,
+        title,
+        data.get("description", ""),
+        duration,
+        data.get("color", "#6c5ce7"),
+        data.get("category", "其他"),
+        min(max(int(data.get("priority", 2)), 1), 3),
+    )
+    new_id = run_user_write(lambda conn: conn.execute(
         """INSERT INTO event_templates (user_id, name, title, description, duration_minutes, color, category, priority)
            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-        (
-            g.user_id,
-            name,
-            title,
-            data.get("description", ""),
-            duration,
-            data.get("color", "#6c5ce7"),
-            data.get("category", "其他"),
-            min(max(int(data.get("priority", 2)), 1), 3),
-        ),
-    )
-    conn.commit()
-    row = conn.execute("SELECT * FROM event_templates WHERE id=?", (cursor.lastrowid,)).fetchone()
+        params,
+    ).lastrowid)
+    row = conn.execute("SELECT * FROM event_templates WHERE id=?", (new_id,)).fetchone()
+    record_use(g.user_id, "template", [(name, (row["created_at"] or "")[:10], new_id)])
     return jsonify(dict(row)), 201
 
 
 @templates_bp.route("/api/templates/<int:template_id>", methods=["DELETE"])
 @login_required
 def delete_template(template_id):
-    conn = get_db()
-    conn.execute(
-        "DELETE FROM event_templates WHERE id=? AND user_id=?", (template_id, g.user_id)
-    )
-    conn.commit()
+    user_id = g.user_id
+    run_user_write(lambda conn: conn.execute(
+        "DELETE FROM event_templates WHERE id=? AND user_id=?", (template_id, user_id)
+    ))
+    invalidate_suggestions(user_id)
     return jsonify({"success": True})
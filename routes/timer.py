@@ -1,6 +1,10 @@
 import re
 from flask import Blueprint, request, jsonify, g
-from database import get_db
+from database import get_user_db, run_user_write, row_dict
+from archive import timer_source, thaw_timer_records
+from suggest import record_use, invalidate_suggestions
+from db_trace import query_budget
+from http_cache import versioned
 from auth_utils import login_required, validate_date
 
 timer_bp = Blueprint("timer", __name__)
@@ -10,16 +14,19 @@ DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
 
 @timer_bp.route("/api/timer/records", methods=["GET"])
 @login_required
+@query_budget(4)
+@versioned("timer")
 def get_timer_records():
     date = request.args.get("date", "")
     if not validate_date(date):
         return jsonify({"error": "日期格式不正确"}), 400
-    conn = get_db()
+    conn = get_user_db()
     records = conn.execute(
-        "SELECT * FROM timer_records WHERE user_id=? AND date = ? ORDER BY created_at DESC",
+        f"SELECT * FROM {timer_source(conn, g.user_id, date)} "
+        "WHERE user_id=? AND date = ? ORDER BY created_at DESC",
         (g.user_id, date),
     ).fetchall()
-    return jsonify([dict(r) for r in records])
+    return jsonify([row_dict(r) for r in records])
 
 
 @timer_bp.route("/api/timer/records", methods=["POST"])
@@ -52,52 +59,60 @@ def create_timer_record():
     if actual_seconds > 86400:
         return jsonify({"error": "实际时长不能超过 86400 秒（24 小时）"}), 400
 
-    conn = get_db()
-    cursor = conn.execute(
+    params = (
+        g.user_id,
+        task_name,
+        planned_minutes,
+        actual_seconds,
+        date,
+        int(data.get("completed", 0)),
+    )
+    new_id = run_user_write(lambda conn: conn.execute(
         """INSERT INTO timer_records (user_id, task_name, planned_minutes, actual_seconds, date, completed)
            VALUES (?, ?, ?, ?, ?, ?)""",
-        (
-            g.user_id,
-            task_name,
-            planned_minutes,
-            actual_seconds,
-            date,
-            int(data.get("completed", 0)),
-        ),
-    )
-    conn.commit()
-    record = conn.execute(
-        "SELECT * FROM timer_records WHERE id = ?", (cursor.lastrowid,)
+        params,
+    ).lastrowid)
+    record_use(g.user_id, "timer", [(task_name, date)])
+    record = get_user_db().execute(
+        "SELECT * FROM timer_records WHERE id = ?", (new_id,)
     ).fetchone()
-    return jsonify(dict(record)), 201
+    return jsonify(row_dict(record)), 201
 
 
 @timer_bp.route("/api/timer/records/<int:record_id>", methods=["DELETE"])
 @login_required
 def delete_timer_record(record_id):
-    conn = get_db()
-    conn.execute("DELETE FROM timer_records WHERE id=? AND user_id=?", (record_id, g.user_id))
-    conn.commit()
+    user_id = g.user_id
+
+    def _delete(conn):
+        thaw_timer_records(conn, user_id, [record_id])
+        conn.execute("DELETE FROM timer_records WHERE id=? AND user_id=?", (record_id, user_id))
+
+    run_user_write(_delete)
+    invalidate_suggestions(user_id)
     return jsonify({"success": True})
 
 
 @timer_bp.route("/api/timer/stats", methods=["GET"])
 @login_required
+@query_budget(6)
+@versioned("timer")
 def get_timer_stats():
     date = request.args.get("date", "")
     if not validate_date(date):
         return jsonify({"error": "日期格式不正确"}), 400
-    conn = get_db()
+    conn = get_user_db()
+    source = timer_source(conn, g.user_id, date)
     total = conn.execute(
-        "SELECT COUNT(*) as c FROM timer_records WHERE user_id=? AND date = ?",
+        f"SELECT COUNT(*) as c FROM {source} WHERE user_id=? AND date = ?",
         (g.user_id, date),
     ).fetchone()["c"]
     completed = conn.execute(
-        "SELECT COUNT(*) as c FROM timer_records WHERE user_id=? AND date = ? AND completed = 1",
+        f"SELECT COUNT(*) as c FROM {source} WHERE user_id=? AND date = ? AND completed = 1",
         (g.user_id, date),
     ).fetchone()["c"]
     row = conn.execute(
-        "SELECT COALESCE(SUM(actual_seconds), 0) as s FROM timer_records WHERE user_id=? AND date = ?",
+        f"SELECT COALESCE(SUM(actual_seconds), 0) as s FROM {source} WHERE user_id=? AND date = ?",
         (g.user_id, date),
     ).fetchone()
     return jsonify(
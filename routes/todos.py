@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify, g
 
-from database import get_db
+from database import get_user_db, run_user_write
+from db_trace import query_budget
 from auth_utils import login_required
 
 todos_bp = Blueprint("todos", __name__)
@@ -11,8 +12,9 @@ MAX_TODOS = 200
 
 @todos_bp.route("/api/todos", methods=["GET"])
 @login_required
+@query_budget(2)
 def list_todos():
-    conn = get_db()
+    conn = get_user_db()
     rows = conn.execute(
         "SELECT * FROM todos WHERE user_id=? ORDER BY sort_order ASC, id ASC",
         (g.user_id,),
@@ -22,6 +24,7 @@ def list_todos():
 
 @todos_bp.route("/api/todos", methods=["POST"])
 @login_required
+@query_budget(4)
 def create_todo():
     data = request.json
     if not data:
@@ -32,7 +35,7 @@ def create_todo():
     if len(text) > MAX_TODO_TEXT:
         return jsonify({"error": f"待办内容不能超过 {MAX_TODO_TEXT} 个字符"}), 400
 
-    conn = get_db()
+    conn = get_user_db()
     count = conn.execute(
         "SELECT COUNT(*) FROM todos WHERE user_id=?", (g.user_id,)
     ).fetchone()[0]
@@ -45,12 +48,12 @@ def create_todo():
     ).fetchone()[0]
     sort_order = (min_order - 1) if min_order is not None else 0
 
-    cursor = conn.execute(
+    user_id = g.user_id
+    new_id = run_user_write(lambda conn: conn.execute(
         "INSERT INTO todos (user_id, text, done, sort_order) VALUES (?, ?, 0, ?)",
-        (g.user_id, text, sort_order),
-    )
-    conn.commit()
-    row = conn.execute("SELECT * FROM todos WHERE id=?", (cursor.lastrowid,)).fetchone()
+        (user_id, text, sort_order),
+    ).lastrowid)
+    row = conn.execute("SELECT * FROM todos WHERE id=?", (new_id,)).fetchone()
     return jsonify(dict(row)), 201
 
 
@@ -61,7 +64,7 @@ def update_todo(todo_id):
     if not data:
         return jsonify({"error": "请求数据不能为空"}), 400
 
-    conn = get_db()
+    conn = get_user_db()
     row = conn.execute(
         "SELECT id FROM todos WHERE id=? AND user_id=?", (todo_id, g.user_id)
     ).fetchone()
@@ -89,24 +92,23 @@ def update_todo(todo_id):
         return jsonify({"error": "没有可更新的字段"}), 400
 
     params.extend([todo_id, g.user_id])
-    conn.execute(
-        f"UPDATE todos SET {', '.join(fields)} WHERE id=? AND user_id=?",
-        params,
-    )
-    conn.commit()
+    sql = f"UPDATE todos SET {', '.join(fields)} WHERE id=? AND user_id=?"
+    run_user_write(lambda conn: conn.execute(sql, params))
     return jsonify({"success": True})
 
 
 @todos_bp.route("/api/todos/<int:todo_id>", methods=["DELETE"])
 @login_required
 def delete_todo(todo_id):
-    conn = get_db()
+    conn = get_user_db()
     row = conn.execute(
         "SELECT id FROM todos WHERE id=? AND user_id=?", (todo_id, g.user_id)
     ).fetchone()
     if not row:
         return jsonify({"error": "待办不存在"}), 404
 
-    conn.execute("DELETE FROM todos WHERE id=? AND user_id=?", (todo_id, g.user_id))
-    conn.commit()
+    user_id = g.user_id
+    run_user_write(lambda conn: conn.execute(
+        "DELETE FROM todos WHERE id=? AND user_id=?", (todo_id, user_id)
+    ))
     return jsonify({"success": True})
@@ -9,10 +9,12 @@ from flask import Blueprint, request, jsonify, g, session, Response
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 
-from config import ALLOWED_AVATAR_EXTENSIONS, AVATAR_MAX_SIZE
-from database import get_db
+from config import ALLOWED_AVATAR_EXTENSIONS, AVATAR_MAX_SIZE, DB_SHARDING
+from database import get_db, get_user_db, run_write, run_user_write, drop_shard
+from archive import events_source, timer_source
 from auth_utils import login_required, validate_password, validate_date
 from storage import get_storage
+from suggest import invalidate_suggestions
 
 logger = logging.getLogger(__name__)
 
@@ -55,18 +57,14 @@ def update_profile():
     if language and language not in ("en", "zh-CN", "zh-TW", "fr", "de", "ja", "ar", "he"):
         language = None
 
-    conn = get_db()
     if language:
-        conn.execute(
-            "UPDATE users SET username=?, bio=?, language=?, updated_at=datetime('now','localtime') WHERE id=?",
-            (username, bio, language, g.user_id),
-        )
+        sql = "UPDATE users SET username=?, bio=?, language=?, updated_at=datetime('now','localtime') WHERE id=?"
+        params = (username, bio, language, g.user_id)
     else:
-        conn.execute(
-            "UPDATE users SET username=?, bio=?, updated_at=datetime('now','localtime') WHERE id=?",
-            (username, bio, g.user_id),
-        )
-    conn.commit()
+        sql = "UPDATE users SET username=?, bio=?, updated_at=datetime('now','localtime') WHERE id=?"
+        params = (username, bio, g.user_id)
+    run_write(lambda conn: conn.execute(sql, params))
+    conn = get_db()
     user = conn.execute("SELECT * FROM users WHERE id=?", (g.user_id,)).fetchone()
     u = dict(user)
     u.pop("password_hash", None)
@@ -122,12 +120,12 @@ def upload_avatar():
         "SELECT avatar FROM users WHERE id=?", (g.user_id,)
     ).fetchone()
 
+    user_id = g.user_id
     try:
-        conn.execute(
+        run_write(lambda conn: conn.execute(
             "UPDATE users SET avatar=?, updated_at=datetime('now','localtime') WHERE id=?",
-            (filename, g.user_id),
-        )
-        conn.commit()
+            (filename, user_id),
+        ))
     except Exception:
         storage.delete(relative_path)
         logger.error("保存头像记录失败，已清理存储文件: %s", relative_path)
@@ -150,7 +148,7 @@ def serve_avatar(filename):
 @user_bp.route("/api/user/settings", methods=["GET"])
 @login_required
 def get_settings():
-    conn = get_db()
+    conn = get_user_db()
     row = conn.execute(
         "SELECT * FROM user_settings WHERE user_id=?", (g.user_id,)
     ).fetchone()
@@ -172,21 +170,16 @@ def update_settings():
         except (ValueError, TypeError):
             return jsonify({"error": "无效的目标时长"}), 400
 
-    conn = get_db()
+    conn = get_user_db()
     existing = conn.execute(
         "SELECT id FROM user_settings WHERE user_id=?", (g.user_id,)
     ).fetchone()
     if existing:
-        conn.execute(
-            "UPDATE user_settings SET daily_goal_hours=?, updated_at=datetime('now','localtime') WHERE user_id=?",
-            (daily_goal, g.user_id),
-        )
+        sql = "UPDATE user_settings SET daily_goal_hours=?, updated_at=datetime('now','localtime') WHERE user_id=?"
     else:
-        conn.execute(
-            "INSERT INTO user_settings (user_id, daily_goal_hours) VALUES (?, ?)",
-            (g.user_id, daily_goal),
-        )
-    conn.commit()
+        sql = "INSERT INTO user_settings (daily_goal_hours, user_id) VALUES (?, ?)"
+    params = (daily_goal, g.user_id)
+    run_user_write(lambda conn: conn.execute(sql, params))
     row = conn.execute(
         "SELECT * FROM user_settings WHERE user_id=?", (g.user_id,)
     ).fetchone()
@@ -216,11 +209,11 @@ def change_password():
         return jsonify({"error": "原密码错误"}), 400
 
     password_hash = generate_password_hash(new_password)
-    conn.execute(
+    user_id = g.user_id
+    run_write(lambda conn: conn.execute(
         "UPDATE users SET password_hash=?, updated_at=datetime('now','localtime') WHERE id=?",
-        (password_hash, g.user_id),
-    )
-    conn.commit()
+        (password_hash, user_id),
+    ))
 
     return jsonify({"success": True, "message": "密码修改成功"})
 
@@ -228,23 +221,23 @@ def change_password():
 @user_bp.route("/api/user/export", methods=["GET"])
 @login_required
 def export_data():
-    conn = get_db()
+    conn = get_user_db()
     events = conn.execute(
-        "SELECT * FROM events WHERE user_id=? ORDER BY date, start_time",
+        f"SELECT * FROM {events_source(conn, g.user_id)} WHERE user_id=? ORDER BY date, start_time",
         (g.user_id,),
     ).fetchall()
     timer_records = conn.execute(
-        "SELECT * FROM timer_records WHERE user_id=? ORDER BY date, created_at",
+        f"SELECT * FROM {timer_source(conn, g.user_id)} WHERE user_id=? ORDER BY date, created_at",
         (g.user_id,),
     ).fetchall()
     notes = conn.execute(
         "SELECT * FROM notes WHERE user_id=? ORDER BY date", (g.user_id,)
     ).fetchall()
-    user = conn.execute("SELECT * FROM users WHERE id=?", (g.user_id,)).fetchone()
+    user = get_db().execute("SELECT * FROM users WHERE id=?", (g.user_id,)).fetchone()
     if not user:
         return jsonify({"error": "用户不存在"}), 404
 
-    STRIP_FIELDS = {"id", "user_id"}
+    STRIP_FIELDS = {"id", "user_id", "day_num", "start_min", "end_min"}
 
     exported_events = [
         {k: v for k, v in dict(e).items() if k not in STRIP_FIELDS}
@@ -282,13 +275,13 @@ def export_data():
 @user_bp.route("/api/user/export-csv", methods=["GET"])
 @login_required
 def export_csv():
-    conn = get_db()
+    conn = get_user_db()
     events = conn.execute(
-        "SELECT * FROM events WHERE user_id=? ORDER BY date, start_time",
+        f"SELECT * FROM {events_source(conn, g.user_id)} WHERE user_id=? ORDER BY date, start_time",
         (g.user_id,),
     ).fetchall()
     timer_records = conn.execute(
-        "SELECT * FROM timer_records WHERE user_id=? ORDER BY date, created_at",
+        f"SELECT * FROM {timer_source(conn, g.user_id)} WHERE user_id=? ORDER BY date, created_at",
         (g.user_id,),
     ).fetchall()
 
@@ -333,9 +326,10 @@ def export_csv():
 @user_bp.route("/api/user/export-ical", methods=["GET"])
 @login_required
 def export_ical():
-    conn = get_db()
+    conn = get_user_db()
     events = conn.execute(
-        "SELECT * FROM events WHERE user_id=? AND col_type='actual' ORDER BY date, start_time",
+        f"SELECT * FROM {events_source(conn, g.user_id)} "
+        "WHERE user_id=? AND col_type='actual' ORDER BY date, start_time",
         (g.user_id,),
     ).fetchall()
 
@@ -417,8 +411,8 @@ def import_data():
     _DEFAULT_COLOR = "#6c5ce7"
     _MAX_NOTE_LEN = 100_000
 
-    conn = get_db()
-    event_count = 0
+    user_id = g.user_id
+    event_rows = []
     for e in imported_events:
         title = (e.get("title") or "").strip()
         if not title or not e.get("date") or not e.get("start_time") or not e.get("end_time"):
@@ -441,18 +435,14 @@ def import_data():
             priority = 2
         raw_color = e.get("color") or ""
         color = raw_color if _COLOR_RE.match(raw_color) else _DEFAULT_COLOR
-        conn.execute(
-            """INSERT INTO events (user_id, title, description, date, start_time, end_time,
-               color, category, priority, completed, col_type)
-               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-            (g.user_id, title, description, e["date"],
+        event_rows.append(
+            (user_id, title, description, e["date"],
              e["start_time"], e["end_time"], color,
              e.get("category", "其他"), priority,
-             1 if e.get("completed") else 0, col_type),
+             1 if e.get("completed") else 0, col_type)
         )
-        event_count += 1
 
-    timer_count = 0
+    timer_rows = []
     for r in imported_timer:
         task_name = (r.get("task_name") or "").strip()
         if not task_name or not r.get("date"):
@@ -465,15 +455,12 @@ def import_data():
             actual = max(0, min(int(r.get("actual_seconds", 0)), 86400))
         except (ValueError, TypeError):
             continue
-        conn.execute(
-            """INSERT INTO timer_records (user_id, task_name, planned_minutes, actual_seconds, date, completed)
-               VALUES (?, ?, ?, ?, ?, ?)""",
-            (g.user_id, task_name, planned, actual,
-             r["date"], 1 if r.get("completed") else 0),
+        timer_rows.append(
+            (user_id, task_name, planned, actual,
+             r["date"], 1 if r.get("completed") else 0)
         )
-        timer_count += 1
 
-    note_count = 0
+    note_rows = []
     for n in imported_notes:
         if not n.get("date"):
             continue
@@ -483,13 +470,28 @@ def import_data():
         if not content.strip():
             continue
         content = content[:_MAX_NOTE_LEN]
-        conn.execute(
+        note_rows.append((user_id, n["date"], content))
+
+    def _import(conn):
+        conn.executemany(
+            """INSERT INTO events (user_id, title, description, date, start_time, end_time,
+               color, category, priority, completed, col_type)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            event_rows,
+        )
+        conn.executemany(
+            """INSERT INTO timer_records (user_id, task_name, planned_minutes, actual_seconds, date, completed)
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            timer_rows,
+        )
+        conn.executemany(
             "INSERT INTO notes (user_id, date, content) VALUES (?, ?, ?)",
-            (g.user_id, n["date"], content),
+            note_rows,
         )
-        note_count += 1
 
-    conn.commit()
+    run_user_write(_import)
+    invalidate_suggestions(user_id)
+    event_count, timer_count, note_count = len(event_rows), len(timer_rows), len(note_rows)
 
     return jsonify({
         "success": True,
@@ -509,20 +511,48 @@ def delete_account():
     if not user or not check_password_hash(user["password_hash"], password):
         return jsonify({"error": "密码错误"}), 400
 
-    note_images = conn.execute(
+    note_images = get_user_db().execute(
         "SELECT storage_path FROM note_images WHERE user_id=?", (g.user_id,)
     ).fetchall()
 
-    conn.execute("DELETE FROM events WHERE user_id=?", (g.user_id,))
-    conn.execute("DELETE FROM timer_records WHERE user_id=?", (g.user_id,))
-    conn.execute("DELETE FROM notes WHERE user_id=?", (g.user_id,))
-    conn.execute("DELETE FROM note_images WHERE user_id=?", (g.user_id,))
-    conn.execute("DELETE FROM event_templates WHERE user_id=?", (g.user_id,))
-    conn.execute("DELETE FROM user_settings WHERE user_id=?", (g.user_id,))
-    conn.execute("DELETE FROM deleted_events WHERE user_id=?", (g.user_id,))
-    conn.execute("DELETE FROM verification_codes WHERE email=(SELECT email FROM users WHERE id=?)", (g.user_id,))
-    conn.execute("DELETE FROM users WHERE id=?", (g.user_id,))
-    conn.commit()
+    user_id = g.user_id
+
+    def _delete_user_data(conn):
+        conn.execute("DELETE FROM events WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM timer_records WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM notes WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM note_images WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM event_templates WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM user_settings WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM deleted_events WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM events_archive WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM timer_records_archive WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM daily_summaries WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM archive_state WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM event_exceptions WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM recurrence_horizons WHERE user_id=?", (user_id,))
+        conn.execute("DELETE FROM todos WHERE user_id=?", (user_id,))
+        # Last: the deletes above bump it.  The change log keeps the
+        # tombstones they wrote until compaction prunes them.
+        conn.execute("DELETE FROM data_versions WHERE user_id=?", (user_id,))
+
+    def _delete_user(conn):
+        conn.execute("DELETE FROM verification_codes WHERE email=(SELECT email FROM users WHERE id=?)", (user_id,))
+        conn.execute("DELETE FROM users WHERE id=?", (user_id,))
+
+    if DB_SHARDING:
+        run_write(_delete_user)
+        shard_conn = g.pop("user_db", None)
+        if shard_conn is not None:
+            shard_conn.close()
+        drop_shard(user_id)
+    else:
+        def _delete_all(conn):
+            _delete_user_data(conn)
+            _delete_user(conn)
+
+        run_write(_delete_all)
+    invalidate_suggestions(user_id)
 
     storage = get_storage()
     if user["avatar"]:
@@ -0,0 +1,469 @@
+"""
+rrule — arithmetic expansion of RFC 5545 recurrence rules.
+
+events.recur_rule holds either one of the legacy keywords (daily,
+weekdays, weekly, monthly) or RRULE text, optionally followed by an EXDATE
+line:
+
+    FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;UNTIL=20241231
+    RRULE:FREQ=MONTHLY;BYDAY=-1FR;COUNT=12
+    EXDATE:20240628,20240726
+
+Supported parts are FREQ (DAILY, WEEKLY, MONTHLY, YEARLY), INTERVAL, BYDAY
+(ordinals such as 2MO or -1FR with MONTHLY), BYMONTHDAY (negative values
+count from the end of the month), COUNT, UNTIL, WKST and EXDATE, plus the
+RFC 7529 SKIP=BACKWARD (with RSCALE=GREGORIAN) that moves days missing from
+a month, such as the 31st, to its last day.  Rules are
+date-only: the series parent carries the times, and is itself the first
+occurrence (it counts towards COUNT).
+
+Occurrences are produced one period (day, week, month, year) at a time,
+starting from the period that contains the start of the requested range,
+found by division.  Expanding a range therefore costs O(occurrences in the
+range) however far it lies from DTSTART.  compile_rule() is cached on
+(rule, dtstart), which in practice means once per series.
+"""
+
+import re
+import calendar
+from datetime import date, datetime
+from functools import lru_cache
+
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+FREQS = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+
+# Legacy keywords and the rule each stands for.
+LEGACY_RULES = {
+    "daily": "FREQ=DAILY",
+    "weekdays": "FREQ=WEEKLY;BYDAY=MO,TU,WE,TH,FR",
+    "weekly": "FREQ=WEEKLY",
+    "monthly": "RSCALE=GREGORIAN;FREQ=MONTHLY;SKIP=BACKWARD",
+}
+
+MAX_RULE_LENGTH = 2000
+# Periods scanned while looking for the COUNT-th occurrence of a rule that
+# rarely or never matches (e.g. BYMONTHDAY=31 with INTERVAL=12 from February).
+_MAX_PERIODS = 50000
+
+_BYDAY_RE = re.compile(r"^([+-]?\d{1,2})?(MO|TU|WE|TH|FR|SA|SU)$")
+_DATE_RE = re.compile(r"^(\d{4})-?(\d{2})-?(\d{2})(?:T\d{6}Z?)?$")
+_ALLOWED = {
+    "DAILY": {"BYDAY", "BYMONTHDAY"},
+    "WEEKLY": {"BYDAY"},
+    "MONTHLY": {"BYDAY", "BYMONTHDAY"},
+    "YEARLY": set(),
+}
+
+
+def _parse_date(value):
+    m = _DATE_RE.match(value.strip())
+    if not m:
+        raise ValueError(f"日期格式不正确: {value}")
+    try:
+        return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+    except ValueError:
+        raise ValueError(f"日期格式不正确: {value}") from None
+
+
+def _parse_int(name, value, low, high, signed=False):
+    try:
+        n = int(value)
+    except ValueError:
+        raise ValueError(f"{name} 必须是整数") from None
+    if not low <= (abs(n) if signed else n) <= high:
+        raise ValueError(f"{name} 超出范围: {value}")
+    return n
+
+
+class Rule:
+    """A parsed recurrence rule, independent of any start date."""
+
+    __slots__ = ("freq", "interval", "byday", "bymonthday", "count", "until",
+                 "wkst", "exdates", "clamp", "legacy")
+
+    def __init__(self, freq, interval=1, byday=(), bymonthday=(), count=None,
+                 until=None, wkst=0, exdates=frozenset(), clamp=False, legacy=None):
+        self.freq = freq
+        self.interval = interval
+        self.byday = byday            # ((ordinal or None, weekday 0-6), ...)
+        self.bymonthday = bymonthday  # (day, ...), negative from month end
+        self.count = count
+        self.until = until
+        self.wkst = wkst
+        self.exdates = exdates
+        self.clamp = clamp
+        self.legacy = legacy
+
+    def copy(self, **changes):
+        """A non-legacy copy of this rule with *changes* applied."""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(legacy=None, **changes)
+        return Rule(**values)
+
+    def __str__(self):
+        if self.legacy:
+            return self.legacy
+        parts = ["RSCALE=GREGORIAN"] if self.clamp else []
+        parts.append(f"FREQ={self.freq}")
+        if self.interval != 1:
+            parts.append(f"INTERVAL={self.interval}")
+        if self.clamp:
+            parts.append("SKIP=BACKWARD")
+        if self.byday:
+            parts.append("BYDAY=" + ",".join(
+                f"{n if n is not None else ''}{WEEKDAYS[wd]}" for n, wd in self.byday))
+        if self.bymonthday:
+            parts.append("BYMONTHDAY=" + ",".join(map(str, self.bymonthday)))
+        if self.wkst:
+            parts.append(f"WKST={WEEKDAYS[self.wkst]}")
+        if self.count is not None:
+            parts.append(f"COUNT={self.count}")
+        if self.until is not None:
+            parts.append(f"UNTIL={self.until:%Y%m%d}")
+        text = ";".join(parts)
+        if self.exdates:
+            text += "\nEXDATE:" + ",".join(f"{d:%Y%m%d}" for d in sorted(self.exdates))
+        return text
+
+
+def _parse_rrule(text, exdates):
+    fields = {}
+    for part in text.split(";"):
+        if not part:
+            continue
+        key, sep, value = part.partition("=")
+        key = key.strip().upper()
+        if not sep or not value.strip():
+            raise ValueError(f"无法解析: {part}")
+        if key in fields:
+            raise ValueError(f"{key} 重复出现")
+        fields[key] = value.strip().upper()
+
+    freq = fields.pop("FREQ", None)
+    if freq not in FREQS:
+        raise ValueError("FREQ 必须是 DAILY、WEEKLY、MONTHLY 或 YEARLY")
+    interval = _parse_int("INTERVAL", fields.pop("INTERVAL", "1"), 1, 1000)
+    count = fields.pop("COUNT", None)
+    until = fields.pop("UNTIL", None)
+    if count is not None and until is not None:
+        raise ValueError("COUNT 与 UNTIL 不能同时使用")
+    count = _parse_int("COUNT", count, 1, 10000) if count is not None else None
+    until = _parse_date(until) if until is not None else None
+    wkst = fields.pop("WKST", "MO")
+    if wkst not in WEEKDAYS:
+        raise ValueError(f"WKST 无效: {wkst}")
+    if fields.pop("RSCALE", "GREGORIAN") != "GREGORIAN":
+        raise ValueError("RSCALE 只支持 GREGORIAN")
+    skip = fields.pop("SKIP", "OMIT")
+    if skip not in ("OMIT", "BACKWARD") or (skip != "OMIT" and freq in ("DAILY", "WEEKLY")):
+        raise ValueError(f"SKIP 无效: {skip}")
+
+    unsupported = set(fields) - _ALLOWED[freq]
+    if unsupported:
+        raise ValueError(f"FREQ={freq} 不支持: {', '.join(sorted(unsupported))}")
+
+    byday = []
+    for item in fields.get("BYDAY", "").split(",") if "BYDAY" in fields else ():
+        m = _BYDAY_RE.match(item.strip())
+        if not m:
+            raise ValueError(f"BYDAY 无效: {item}")
+        ordinal = int(m.group(1)) if m.group(1) else None
+        if ordinal is not None and (freq != "MONTHLY" or not 1 <= abs(ordinal) <= 5):
+            raise ValueError(f"BYDAY 序号无效: {item}")
+        byday.append((ordinal, WEEKDAYS.index(m.group(2))))
+    bymonthday = tuple(
+        _parse_int("BYMONTHDAY", v, 1, 31, signed=True) for v in fields["BYMONTHDAY"].split(",")
+    ) if "BYMONTHDAY" in fields else ()
+
+    return Rule(freq, interval, tuple(dict.fromkeys(byday)), tuple(dict.fromkeys(bymonthday)),
+                count, until, WEEKDAYS.index(wkst), frozenset(exdates), clamp=skip == "BACKWARD")
+
+
+def parse_rule(text):
+    """Parse a stored or submitted rule; raises ValueError with a readable message."""
+    if not isinstance(text, str) or not text.strip():
+        raise ValueError("重复规则为空")
+    text = text.strip()
+    if len(text) > MAX_RULE_LENGTH:
+        raise ValueError("重复规则过长")
+    if text.lower() in LEGACY_RULES:
+        key = text.lower()
+        rule = _parse_rrule(LEGACY_RULES[key], ())
+        rule.legacy = key
+        return rule
+
+    rrule, exdates = None, []
+    for line in re.split(r"[\r\n]+", text):
+        line = line.strip()
+        name, sep, value = line.partition(":")
+        name = name.split(";")[0].upper()
+        if sep and name == "EXDATE":
+            exdates.extend(_parse_date(v) for v in value.split(",") if v.strip())
+        elif (sep and name == "RRULE") or (not sep and "=" in line):
+            if rrule is not None:
+                raise ValueError("只能包含一条 RRULE")
+            rrule = value if sep else line
+        elif sep and name == "DTSTART":
+            continue  # the series' own date is the start
+        else:
+            raise ValueError(f"无法解析: {line}")
+    if rrule is None:
+        raise ValueError("缺少 RRULE")
+    if len(exdates) > 1000:
+        raise ValueError("EXDATE 过多")
+    return _parse_rrule(rrule, exdates)
+
+
+def normalize_rule(text):
+    """Canonical form of *text* for storage (legacy keywords stay as they are)."""
+    return str(parse_rule(text))
+
+
+class Recurrence:
+    """A rule anchored at the date of its first occurrence.
+
+    Dates are handled as proleptic ordinals (date.toordinal()) internally;
+    DAILY and WEEKLY ranges are then plain integer steps.
+    """
+
+    def __init__(self, rule, dtstart):
+        self.rule = rule
+        self.dtstart = dtstart
+        self._start = dtstart.toordinal()
+        self._exdates = {d.toordinal() for d in rule.exdates}
+        self._last = rule.until
+        self._count_resolved = rule.count is None
+        if rule.freq == "WEEKLY":
+            days = [wd for _, wd in rule.byday] or [dtstart.weekday()]
+            self._offsets = sorted({(wd - rule.wkst) % 7 for wd in days})
+            self._week0 = self._start - (dtstart.weekday() - rule.wkst) % 7
+        self._weekdays = {wd for _, wd in rule.byday}
+        self._month0 = dtstart.year * 12 + dtstart.month - 1
+
+    # -- periods ---------------------------------------------------------
+
+    def _period_start(self, k):
+        """First date of period *k* (0 = the period of dtstart)."""
+        r = self.rule
+        if r.freq == "DAILY":
+            return date.fromordinal(self._start + k * r.interval)
+        if r.freq == "WEEKLY":
+            return date.fromordinal(self._week0 + 7 * k * r.interval)
+        if r.freq == "MONTHLY":
+            y, m = divmod(self._month0 + k * r.interval, 12)
+            return date(y, m + 1, 1)
+        return date(self.dtstart.year + k * r.interval, 1, 1)
+
+    def _candidates(self, k):
+        """Dates the rule selects in period *k*, ascending (dtstart/UNTIL not applied)."""
+        r = self.rule
+        if r.freq == "DAILY":
+            d = self._period_start(k)
+            if self._weekdays and d.weekday() not in self._weekdays:
+                return ()
+            if r.bymonthday and not _month_day_matches(d, r.bymonthday):
+                return ()
+            return (d,)
+        if r.freq == "WEEKLY":
+            start = self._week0 + 7 * k * r.interval
+            return tuple(date.fromordinal(start + o) for o in self._offsets)
+        if r.freq == "MONTHLY":
+            first = self._period_start(k)
+            return _month_days(self, first.year, first.month)
+        year = self.dtstart.year + k * r.interval
+        if not 1 <= year <= 9999:
+            return ()
+        try:
+            return (self.dtstart.replace(year=year),)
+        except ValueError:  # 29 February in a common year
+            return (date(year, 2, 28),) if r.clamp else ()
+
+    def _ordinals(self, lo, hi):
+        """Ordinals selected by the rule in [lo, hi], ascending."""
+        r = self.rule
+        if r.freq == "DAILY":
+            step = r.interval
+            first = self._start - (self._start - lo) // step * step
+            days = range(first, hi + 1, step)
+            if not self._weekdays and not r.bymonthday:
+                return days
+            return (o for o in days
+                    if (not self._weekdays or (o - 1) % 7 in self._weekdays)
+                    and (not r.bymonthday
+                         or _month_day_matches(date.fromordinal(o), r.bymonthday)))
+        if r.freq == "WEEKLY":
+            return self._weekly_ordinals(lo, hi)
+        return self._period_ordinals(lo, hi)
+
+    def _weekly_ordinals(self, lo, hi):
+        span = 7 * self.rule.interval
+        base = self._week0 + max((lo - self._week0) // span, 0) * span
+        offsets = self._offsets
+        while base <= hi:
+            for o in offsets:
+                o += base
+                if o > hi:
+                    return
+                if o >= lo:
+                    yield o
+            base += span
+
+    def _period_ordinals(self, lo, hi):
+        r = self.rule
+        first, last = date.fromordinal(lo), date.fromordinal(hi)
+        if r.freq == "MONTHLY":
+            pos, stop = first.year * 12 + first.month - 1, last.year * 12 + last.month - 1
+            origin = self._month0
+        else:
+            pos, stop, origin = first.year, last.year, self.dtstart.year
+        k = max((pos - origin) // r.interval, 0)
+        while origin + k * r.interval <= stop:
+            if r.freq == "MONTHLY":
+                y, m = divmod(origin + k * r.interval, 12)
+                candidates = _month_days(self, y, m + 1)
+            else:
+                candidates = self._candidates(k)
+            for d in candidates:
+                o = d.toordinal()
+                if lo <= o <= hi:
+                    yield o
+            k += 1
+
+    # -- bounds ----------------------------------------------------------
+
+    def last(self):
+        """Date of the final occurrence, or None if the rule never ends."""
+        if not self._count_resolved:
+            self._last = self._nth(self.rule.count)
+            self._count_resolved = True
+        return self._last
+
+    def _nth(self, n):
+        # dtstart is occurrence 1.  EXDATE removes occurrences after COUNT
+        # has been applied, so excluded dates still count here.
+        seen, last = 1, self.dtstart
+        if n <= 1:
+            return last
+        for k in range(_MAX_PERIODS):
+            try:
+                candidates = self._candidates(k)
+            except (ValueError, OverflowError):
+                break
+            for d in candidates:
+                if d <= self.dtstart:
+                    continue
+                seen, last = seen + 1, d
+                if seen >= n:
+                    return last
+        return last
+
+    # -- queries ---------------------------------------------------------
+
+    def between(self, start, end, limit=None):
+        """Occurrences after dtstart with start <= date <= end, ascending."""
+        lo = max(start.toordinal(), self._start + 1)
+        hi = end.toordinal()
+        last = self.last()
+        if last is not None:
+            hi = min(hi, last.toordinal())
+        if lo > hi:
+            return []
+        exdates = self._exdates
+        fromordinal = date.fromordinal
+        if limit is None and not exdates:
+            return [fromordinal(o) for o in self._ordinals(lo, hi)]
+        out = []
+        for o in self._ordinals(lo, hi):
+            if o in exdates:
+                continue
+            out.append(fromordinal(o))
+            if limit is not None and len(out) >= limit:
+                break
+        return out
+
+    def includes(self, day):
+        """True if *day* is an occurrence after dtstart."""
+        return bool(self.between(day, day, 1))
+
+    def next_after(self, day):
+        """First occurrence after *day*, or None."""
+        if day >= date.max:
+            return None
+        found = self.between(date.fromordinal(day.toordinal() + 1), date.max, 1)
+        return found[0] if found else None
+
+    def count_before(self, day):
+        """Occurrences before *day*, dtstart and EXDATEs included (as COUNT counts them)."""
+        hi = day.toordinal() - 1
+        last = self.last()
+        if last is not None:
+            hi = min(hi, last.toordinal())
+        if hi < self._start:
+            return 0
+        return 1 + sum(1 for _ in self._ordinals(self._start + 1, hi))
+
+
+def _month_day_matches(d, bymonthday):
+    n = calendar.monthrange(d.year, d.month)[1]
+    return any(d.day == (md if md > 0 else n + md + 1) for md in bymonthday)
+
+
+def _month_days(rec, year, month):
+    r = rec.rule
+    n = calendar.monthrange(year, month)[1]
+    days = None
+    if r.bymonthday:
+        days = {md if md > 0 else n + md + 1 for md in r.bymonthday}
+        if r.clamp:
+            days = {min(d, n) for d in days}
+        days = {d for d in days if 1 <= d <= n}
+    if r.byday:
+        first_wd = calendar.weekday(year, month, 1)
+        by = set()
+        for ordinal, wd in r.byday:
+            matches = list(range(1 + (wd - first_wd) % 7, n + 1, 7))
+            if ordinal is None:
+                by.update(matches)
+            elif ordinal > 0 and ordinal <= len(matches):
+                by.add(matches[ordinal - 1])
+            elif ordinal < 0 and -ordinal <= len(matches):
+                by.add(matches[ordinal])
+        days = by if days is None else days & by
+    if days is None:
+        day = rec.dtstart.day
+        if day > n:
+            if not r.clamp:
+                return ()
+            day = n
+        return (date(year, month, day),)
+    return tuple(date(year, month, d) for d in sorted(days))
+
+
+def split_rule(text, dtstart, pivot):
+    """Split a series at occurrence *pivot* (a date after *dtstart*).
+
+    Returns (head, tail): the rule ending the day before *pivot*, for the
+    existing series, and the rule continuing from *pivot*, for the series
+    that starts there.  COUNT and EXDATE are divided between the two.
+    """
+    rule = parse_rule(text)
+    recurrence = compile_rule(text, dtstart)
+    before = frozenset(d for d in rule.exdates if d < pivot)
+    head = rule.copy(count=None, until=date.fromordinal(pivot.toordinal() - 1), exdates=before)
+    changes = {"exdates": rule.exdates - before}
+    if rule.count is not None:
+        changes["count"] = max(rule.count - recurrence.count_before(pivot), 1)
+    if rule.freq == "MONTHLY" and not rule.byday and not rule.bymonthday:
+        # The day of the month came from dtstart; pivot may be a shortened month.
+        changes["bymonthday"] = (recurrence.dtstart.day,)
+    tail = rule.copy(**changes) if (rule.legacy is None or len(changes) > 1) else rule
+    return str(head), str(tail)
+
+
+@lru_cache(maxsize=4096)
+def compile_rule(text, dtstart):
+    """Compiled recurrence for rule *text* starting on *dtstart* ('YYYY-MM-DD').
+
+    Raises ValueError for rules parse_rule() rejects.
+    """
+    return Recurrence(parse_rule(text), datetime.strptime(dtstart, "%Y-%m-%d").date())
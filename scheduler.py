@@ -0,0 +1,176 @@
+"""
+scheduler — free-slot finder and auto-scheduler.
+
+Free time is what the plan column leaves open inside the working hours of
+each chosen day.  The plan events of the whole range (recurring occurrences
+included, generated or not) are read once, grouped by day and swept in start order, so a day
+of n events costs O(n log n) and a month of dense calendars is computed in
+a few milliseconds.
+
+A strategy packs items (todos or templates with a duration and priority)
+into those slots.  Strategies are plain functions registered in STRATEGIES
+with @strategy(name); each takes the items and the free slots and returns
+the (item, (date, start, end)) placements it booked with take().
+"""
+
+from config import RECURRENCE_MODE
+from database import epoch_day, from_epoch_day
+from recurrence import events_between, plan_instances
+
+DEFAULT_WORK_START = "09:00"
+DEFAULT_WORK_END = "18:00"
+DEFAULT_WEEKDAYS = (0, 1, 2, 3, 4)
+# Slot starts are rounded up to a multiple of this many minutes.
+_ALIGN = 5
+
+STRATEGIES = {}
+
+
+def strategy(name):
+    """Register a packing strategy under *name*."""
+    def register(fn):
+        STRATEGIES[name] = fn
+        return fn
+    return register
+
+
+def to_minutes(value):
+    """Minutes since midnight of an "HH:MM" time (up to "24:00")."""
+    hours, minutes = value.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def to_clock(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def _align(minutes):
+    return -(-minutes // _ALIGN) * _ALIGN
+
+
+def _busy_by_day(events):
+    """{date: [(start, end), ...] sorted by start} of the plan column."""
+    days = {}
+    for e in events:
+        if (e.get("col_type") or "plan") != "plan":
+            continue
+        try:
+            interval = (to_minutes(e["start_time"]), to_minutes(e["end_time"]))
+        except (AttributeError, ValueError):
+            continue
+        days.setdefault(e["date"], []).append(interval)
+    for intervals in days.values():
+        intervals.sort()
+    return days
+
+
+def _day_slots(busy, work_start, work_end, min_minutes):
+    """Sweep sorted *busy* intervals; yields the free (start, end) gaps of one day."""
+    cursor = _align(work_start)
+    for start, end in busy:
+        if start >= work_end:
+            break
+        if start - cursor >= min_minutes:
+            yield cursor, start
+        cursor = max(cursor, _align(end))
+    if work_end - cursor >= min_minutes:
+        yield cursor, work_end
+
+
+def free_slots(conn, user_id, start, end, work_start=DEFAULT_WORK_START,
+               work_end=DEFAULT_WORK_END, weekdays=DEFAULT_WEEKDAYS, min_minutes=_ALIGN,
+               not_before=None):
+    """Open [date, start, end] slots (minutes) in the plan column, in time order.
+
+    *not_before* ("HH:MM") moves the start of the first day's working hours,
+    e.g. to the current time when planning from today.
+    """
+    events = events_between(conn, user_id, start, end)
+    if RECURRENCE_MODE == "materialize":
+        # Instances not generated yet still take their time.
+        rows, _ = plan_instances(conn, user_id, start, end)
+        events += [{"date": r[3], "start_time": r[4], "end_time": r[5]} for r in rows]
+    busy = _busy_by_day(events)
+    lo, hi = to_minutes(work_start), to_minutes(work_end)
+    first = epoch_day(start)
+    slots = []
+    for n in range(first, epoch_day(end) + 1):
+        # Epoch day 0 (1970-01-01) was a Thursday.
+        if (n + 3) % 7 not in weekdays:
+            continue
+        day = from_epoch_day(n)
+        day_start = max(lo, to_minutes(not_before)) if n == first and not_before else lo
+        slots.extend([day, s, e] for s, e in _day_slots(busy.get(day, ()), day_start, hi, min_minutes))
+    return slots
+
+
+def take(slots, index, minutes, gap):
+    """Book *minutes* at the start of slots[index]; returns the booked (date, start, end)."""
+    slot = slots[index]
+    booked = (slot[0], slot[1], slot[1] + minutes)
+    slot[1] = min(slot[2], _align(booked[2] + gap))
+    return booked
+
+
+def _first_fit(slots, minutes):
+    for i, slot in enumerate(slots):
+        if slot[2] - slot[1] >= minutes:
+            return i
+    return None
+
+
+def _by_priority(items):
+    # Priority 1 is the highest; longer items first so they still find room.
+    return sorted(items, key=lambda item: (item["priority"], -item["duration_minutes"]))
+
+
+@strategy("priority")
+def greedy_priority(items, slots, gap):
+    """Highest priority first, each into the earliest slot long enough."""
+    placed = []
+    for item in _by_priority(items):
+        i = _first_fit(slots, item["duration_minutes"])
+        if i is not None:
+            placed.append((item, take(slots, i, item["duration_minutes"], gap)))
+    return placed
+
+
+@strategy("best_fit")
+def best_fit(items, slots, gap):
+    """Highest priority first, each into the slot it leaves the least of, keeping long blocks free."""
+    placed = []
+    for item in _by_priority(items):
+        best = None
+        for i, slot in enumerate(slots):
+            left = slot[2] - slot[1] - item["duration_minutes"]
+            if left >= 0 and (best is None or left < best[0]):
+                best = (left, i)
+        if best is not None:
+            placed.append((item, take(slots, best[1], item["duration_minutes"], gap)))
+    return placed
+
+
+@strategy("longest_first")
+def longest_first(items, slots, gap):
+    """Longest items first into the earliest slot that fits, which usually places the most time."""
+    placed = []
+    for item in sorted(items, key=lambda item: (-item["duration_minutes"], item["priority"])):
+        i = _first_fit(slots, item["duration_minutes"])
+        if i is not None:
+            placed.append((item, take(slots, i, item["duration_minutes"], gap)))
+    return placed
+
+
+def pack(items, slots, gap=0, name="priority"):
+    """Place *items* into *slots* with strategy *name*: returns (placed, unplaced).
+
+    Items are dicts with at least "duration_minutes" and "priority"; the
+    placed ones are returned with "date", "start_time" and "end_time" added,
+    in time order.  *slots* are used up in place.
+    """
+    placed, seen = [], set()
+    for item, (day, start, end) in STRATEGIES[name](items, slots, gap):
+        placed.append({**item, "date": day, "start_time": to_clock(start), "end_time": to_clock(end)})
+        seen.add(id(item))
+    placed.sort(key=lambda item: (item["date"], item["start_time"]))
+    return placed, [item for item in items if id(item) not in seen]
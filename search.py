@@ -0,0 +1,455 @@
+"""
+search — full-text search over events and notes.
+
+Migration 9 creates FTS5 indexes over event titles/descriptions (hot and
+archived) and note content; triggers keep them in step with every write and
+`manage.py fts-rebuild` recreates them, e.g. after SEARCH_TOKENIZER changed.
+Matches are ranked by BM25, with title hits weighing more than description
+hits, and come with highlighted snippets (HTML-escaped, hits in <mark>).
+
+A query is split into terms ("a quoted phrase" is one term) and every term
+must match.  With the trigram tokenizer a term matches anywhere inside the
+text, so it also works as a prefix; with unicode61 it matches words that
+start with it.  Trigram cannot index terms shorter than three characters:
+those are checked with LIKE on the rows the other terms found, or, when
+every term is that short, by a LIKE scan of the user's rows.
+
+Case-sensitive and whole-word searches read the (case-insensitive) matches
+in rank order and keep refining until *limit* rows qualify, so no match is
+lost to a fixed over-fetch window.
+
+The trigram index doubles as a posting index for regex search: the literals
+a pattern cannot match without ("foo(bar|baz)" needs "foo" and "ba") become
+an AND/OR query of phrases, and only the rows it finds are sent to the
+regex sandbox.  Patterns without such a literal, and the unicode61
+tokenizer, scan every row as before.
+
+Fuzzy search (trigram only) takes the best FUZZY_CANDIDATES rows sharing
+any trigram with the terms and keeps those where each term of four or more
+characters is within len // 4 edits (at least one) of some substring.  A
+typo that leaves no trigram of a word intact, as in most four-letter
+words, cannot be found this way.
+"""
+
+import re
+import html
+import logging
+import sqlite3
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+from archive import EVENT_COLUMNS, archive_boundary, events_source
+from database import row_dict, search_tokenizer
+
+logger = logging.getLogger(__name__)
+
+_TERM_RE = re.compile(r'"([^"]+)"|(\S+)')
+_MARK_OPEN, _MARK_CLOSE = "\x02", "\x03"
+_MARKDOWN_RE = re.compile(r"[#*`>_~\[\]!]")
+_SNIPPET_TOKENS = 16
+_EVENT_SELECT = ", ".join("e." + col for col in EVENT_COLUMNS)
+# Patterns whose literal query would be larger than this scan instead.
+_MAX_PLAN_LITERALS = 32
+# Rows verified by edit distance in a fuzzy search.
+FUZZY_CANDIDATES = 300
+# Occurrences of one trigram examined per text when measuring edit distance.
+_FUZZY_HITS = 32
+
+
+def parse_terms(q):
+    """Split a query into terms; a double-quoted phrase stays one term."""
+    return [phrase or word for phrase, word in _TERM_RE.findall(q)]
+
+
+def match_expression(terms, whole_word=False):
+    """Return (FTS5 MATCH string or None, terms the index cannot answer)."""
+    trigram = search_tokenizer() == "trigram"
+    parts, short = [], []
+    for term in terms:
+        if trigram and len(term) < 3:
+            short.append(term)
+            continue
+        phrase = '"' + term.replace('"', '""') + '"'
+        parts.append(phrase if trigram or whole_word else phrase + "*")
+    return (" AND ".join(parts) or None), short
+
+
+def _like(term):
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _like_clause(terms, columns, alias=""):
+    """SQL requiring every term in one of *columns*, and its params."""
+    clause = " OR ".join(f"{alias}{col} LIKE ? ESCAPE '\\'" for col in columns)
+    return (
+        "".join(f" AND ({clause})" for _ in terms),
+        [_like(term) for term in terms for _ in columns],
+    )
+
+
+def _matcher(terms, case_sensitive, whole_word):
+    """Predicate for the exact-match refinement, or None when the index already decided."""
+    if not case_sensitive and not whole_word:
+        return None
+    flags = 0 if case_sensitive else re.IGNORECASE
+    patterns = [
+        re.compile((r"\b" + re.escape(t) + r"\b") if whole_word else re.escape(t), flags)
+        for t in terms
+    ]
+    return lambda texts: all(any(p.search(t) for t in texts) for p in patterns)
+
+
+def _highlight(text, markdown=False):
+    text = text or ""
+    if markdown:
+        text = _MARKDOWN_RE.sub("", text)
+    text = html.escape(" ".join(text.split()), quote=False)
+    return text.replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+
+
+def _collect(rows, columns, match, limit, shape):
+    found = []
+    for row in rows:
+        if match is None or match([row[c] or "" for c in columns]):
+            found.append(shape(row))
+            if len(found) >= limit:
+                break
+    return found
+
+
+def _run_ranked(conn, sql, params, columns, match, limit, shape):
+    """Run a ranked FTS query; returns None if the index is unusable here."""
+    if match is None:
+        sql += " LIMIT ?"
+        params = (*params, limit)
+    try:
+        return _collect(conn.execute(sql, params), columns, match, limit, shape)
+    except sqlite3.OperationalError as e:
+        # No FTS5 tables (SQLite without FTS5) or a query FTS5 cannot parse.
+        logger.warning("全文搜索不可用，改用 LIKE: %s", e)
+        return None
+
+
+def _event_result(row):
+    event = row_dict(row)
+    event["title_highlight"] = _highlight(event.get("title_highlight"))
+    event["snippet"] = _highlight(event.get("snippet"))
+    return event
+
+
+def _event_tables(conn, user_id):
+    tables = [("events_fts", "events")]
+    if archive_boundary(conn, user_id) is not None:
+        tables.append(("events_archive_fts", "events_archive"))
+    return tables
+
+
+def _ranked_events_sql(tables, where):
+    """UNION of the ranked FTS selects over *tables*, each filtered by *where*."""
+    # Explicit columns: events and events_archive order them differently.
+    return " UNION ALL ".join(
+        f"""SELECT {_EVENT_SELECT}, bm25({fts}, 4.0, 1.0) AS rank,
+               highlight({fts}, 0, char(2), char(3)) AS title_highlight,
+               snippet({fts}, 1, char(2), char(3), '…', {_SNIPPET_TOKENS}) AS snippet
+            FROM {fts} JOIN {content} e ON e.id = {fts}.rowid
+            WHERE {fts} MATCH ? AND e.user_id=?{where}"""
+        for fts, content in tables
+    )
+
+
+def find_events(conn, user_id, q, limit, case_sensitive=False, whole_word=False, fuzzy=False):
+    """Events of *user_id* matching *q*, best match first."""
+    terms = parse_terms(q)
+    columns = ("title", "description")
+    if fuzzy and search_tokenizer() == "trigram":
+        expr, short = fuzzy_expression(terms)
+        if expr is not None:
+            tables = _event_tables(conn, user_id)
+            like_sql, like_params = _like_clause(short, columns, "e.")
+            found = _run_fuzzy(
+                conn, f"SELECT * FROM ({_ranked_events_sql(tables, like_sql)}) ORDER BY rank",
+                [expr, user_id, *like_params] * len(tables), terms, columns, limit, _event_result,
+            )
+            if found is not None:
+                return found
+
+    expr, short = match_expression(terms, whole_word)
+    match = _matcher(terms, case_sensitive, whole_word)
+    if expr is not None:
+        tables = _event_tables(conn, user_id)
+        like_sql, like_params = _like_clause(short, columns, "e.")
+        found = _run_ranked(
+            conn, f"SELECT * FROM ({_ranked_events_sql(tables, like_sql)}) ORDER BY rank",
+            [expr, user_id, *like_params] * len(tables), columns, match, limit, _event_result,
+        )
+        if found is not None:
+            return found
+
+    like_sql, like_params = _like_clause(terms, columns)
+    sql = (f"SELECT * FROM {events_source(conn, user_id)} WHERE user_id=?{like_sql} "
+           "ORDER BY date DESC, start_time")
+    params = [user_id, *like_params]
+    if match is None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return _collect(conn.execute(sql, params), columns, match, limit, row_dict)
+
+
+def _note_result(row):
+    note = dict(row)
+    note["snippet"] = _highlight(note.get("snippet"), markdown=True)
+    return note
+
+
+def _ranked_notes_sql(where):
+    return f"""SELECT n.*, bm25(notes_fts) AS rank,
+                   snippet(notes_fts, 0, char(2), char(3), '…', {_SNIPPET_TOKENS}) AS snippet
+                FROM notes_fts JOIN notes n ON n.id = notes_fts.rowid
+                WHERE notes_fts MATCH ? AND n.user_id=?{where}
+                ORDER BY rank"""
+
+
+def find_notes(conn, user_id, q, limit, case_sensitive=False, whole_word=False, fuzzy=False):
+    """Notes of *user_id* matching *q*, best match first."""
+    terms = parse_terms(q)
+    columns = ("content",)
+    if fuzzy and search_tokenizer() == "trigram":
+        expr, short = fuzzy_expression(terms)
+        if expr is not None:
+            like_sql, like_params = _like_clause(short, columns, "n.")
+            found = _run_fuzzy(
+                conn, _ranked_notes_sql(like_sql), [expr, user_id, *like_params],
+                terms, columns, limit, _note_result,
+            )
+            if found is not None:
+                return found
+
+    expr, short = match_expression(terms, whole_word)
+    match = _matcher(terms, case_sensitive, whole_word)
+    if expr is not None:
+        like_sql, like_params = _like_clause(short, columns, "n.")
+        found = _run_ranked(
+            conn, _ranked_notes_sql(like_sql), [expr, user_id, *like_params],
+            columns, match, limit, _note_result,
+        )
+        if found is not None:
+            return found
+
+    like_sql, like_params = _like_clause(terms, columns)
+    sql = f"SELECT * FROM notes WHERE user_id=?{like_sql} ORDER BY date DESC"
+    params = [user_id, *like_params]
+    if match is None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return _collect(conn.execute(sql, params), columns, match, limit, dict)
+
+
+# ---------------------------------------------------------------------------
+# Fuzzy matching
+# ---------------------------------------------------------------------------
+
+def _trigrams(term):
+    return list(dict.fromkeys(term[i:i + 3] for i in range(len(term) - 2)))
+
+
+def fuzzy_expression(terms):
+    """Return (FTS5 MATCH string or None, terms too short for trigrams): any trigram of each term."""
+    parts, short = [], []
+    for term in terms:
+        grams = _trigrams(term.lower())
+        if not grams:
+            short.append(term)
+            continue
+        parts.append("(" + " OR ".join('"' + g.replace('"', '""') + '"' for g in grams) + ")")
+    return (" AND ".join(parts) or None), short
+
+
+def max_edits(term):
+    """Edits a fuzzy match may need for *term*; terms under four characters must match exactly."""
+    return max(1, len(term) // 4) if len(term) >= 4 else 0
+
+
+def _edit_distance(term, text):
+    """Fewest edits turning *term* into some substring of *text* (Sellers' algorithm)."""
+    prev = [0] * (len(text) + 1)
+    for i, tc in enumerate(term, 1):
+        cur = [i]
+        for j, xc in enumerate(text, 1):
+            cur.append(min(prev[j - 1] + (tc != xc), prev[j] + 1, cur[j - 1] + 1))
+        prev = cur
+    return min(prev)
+
+
+def fuzzy_distance(term, texts, limit):
+    """Edit distance of *term* to its closest substring in *texts* if at most *limit*, else None.
+
+    Only windows around occurrences of the term's trigrams are measured,
+    the same trigrams the fuzzy candidates were found by.
+    """
+    term = term.lower()
+    if limit == 0 or len(term) < 3:
+        return 0 if any(term in t.lower() for t in texts) else None
+    best = None
+    for text in texts:
+        text = text.lower()
+        spans = []
+        for offset, gram in enumerate(_trigrams(term)):
+            pos = text.find(gram)
+            for _ in range(_FUZZY_HITS):
+                if pos < 0:
+                    break
+                start = max(0, pos - offset - limit)
+                spans.append((start, pos - offset + len(term) + limit))
+                pos = text.find(gram, pos + 1)
+        spans.sort()
+        merged = []
+        for start, end in spans:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        for start, end in merged:
+            d = _edit_distance(term, text[start:end])
+            if d <= limit and (best is None or d < best):
+                best = d
+                if d == 0:
+                    return 0
+    return best
+
+
+def _run_fuzzy(conn, sql, params, terms, columns, limit, shape):
+    """Verify the best FUZZY_CANDIDATES rows by edit distance; None if the index is unusable."""
+    terms = [t for t in terms if len(t) >= 3]
+    try:
+        rows = conn.execute(sql + " LIMIT ?", (*params, FUZZY_CANDIDATES)).fetchall()
+    except sqlite3.OperationalError as e:
+        logger.warning("模糊搜索不可用: %s", e)
+        return None
+    scored = []
+    for row in rows:
+        texts = [row[c] or "" for c in columns]
+        total = 0
+        for term in terms:
+            d = fuzzy_distance(term, texts, max_edits(term))
+            if d is None:
+                break
+            total += d
+        else:
+            scored.append((total, row["rank"], row))
+    scored.sort(key=lambda item: item[:2])
+    found = []
+    for total, _, row in scored[:limit]:
+        item = shape(row)
+        item["fuzzy"] = total
+        found.append(item)
+    return found
+
+
+# ---------------------------------------------------------------------------
+# Regex candidates
+# ---------------------------------------------------------------------------
+
+_REPEATS = {
+    sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT,
+    getattr(sre_parse, "POSSESSIVE_REPEAT", sre_parse.MAX_REPEAT),
+}
+_ATOMIC_GROUP = getattr(sre_parse, "ATOMIC_GROUP", None)
+
+
+def _required(items):
+    """Literals a parsed sequence cannot match without: ("lit", s), ("and"|"or", [...]) or None."""
+    parts, run = [], []
+
+    def flush():
+        if len(run) >= 3:
+            parts.append(("lit", "".join(run)))
+        run.clear()
+
+    for op, av in items:
+        if op is sre_parse.LITERAL:
+            run.append(chr(av))
+            continue
+        if op is sre_parse.AT:
+            continue  # anchors are zero-width: the literals around them stay adjacent
+        flush()
+        if op is sre_parse.SUBPATTERN:
+            node = _required(av[-1])
+        elif op is _ATOMIC_GROUP:
+            node = _required(av)
+        elif op is sre_parse.BRANCH:
+            branches = [_required(b) for b in av[1]]
+            node = None if None in branches else ("or", branches)
+        elif op in _REPEATS and av[0] >= 1:
+            node = _required(av[2])
+        else:
+            node = None
+        if node is not None:
+            parts.append(node)
+    flush()
+    if not parts:
+        return None
+    return parts[0] if len(parts) == 1 else ("and", parts)
+
+
+def _count_literals(node):
+    return 1 if node[0] == "lit" else sum(_count_literals(n) for n in node[1])
+
+
+def _to_match(node):
+    if node[0] == "lit":
+        return '"' + node[1].replace('"', '""') + '"'
+    return "(" + f" {node[0].upper()} ".join(_to_match(n) for n in node[1]) + ")"
+
+
+def regex_expression(pattern):
+    """FTS5 MATCH string every match of compiled *pattern* satisfies, or None to scan."""
+    if search_tokenizer() != "trigram":
+        return None
+    try:
+        node = _required(sre_parse.parse(pattern.pattern, pattern.flags))
+    except (re.error, RecursionError):
+        return None
+    if node is None or _count_literals(node) > _MAX_PLAN_LITERALS:
+        return None
+    return _to_match(node)
+
+
+def regex_event_rows(conn, user_id, pattern):
+    """Events that may match *pattern*, newest first, read lazily by the regex sandbox."""
+    expr = regex_expression(pattern)
+    if expr is not None:
+        tables = _event_tables(conn, user_id)
+        sql = " UNION ALL ".join(
+            f"""SELECT {_EVENT_SELECT} FROM {fts} JOIN {content} e ON e.id = {fts}.rowid
+                WHERE {fts} MATCH ? AND e.user_id=?"""
+            for fts, content in tables
+        )
+        try:
+            return conn.execute(
+                f"SELECT * FROM ({sql}) ORDER BY date DESC, start_time",
+                [expr, user_id] * len(tables),
+            )
+        except sqlite3.OperationalError as e:
+            logger.warning("正则候选查询失败，改为全量扫描: %s", e)
+    return conn.execute(
+        f"SELECT * FROM {events_source(conn, user_id)} WHERE user_id=? ORDER BY date DESC, start_time",
+        (user_id,),
+    )
+
+
+def regex_note_rows(conn, user_id, pattern):
+    """Notes that may match *pattern*, newest first, read lazily by the regex sandbox."""
+    expr = regex_expression(pattern)
+    if expr is not None:
+        try:
+            return conn.execute(
+                """SELECT n.* FROM notes_fts JOIN notes n ON n.id = notes_fts.rowid
+                   WHERE notes_fts MATCH ? AND n.user_id=? ORDER BY n.date DESC""",
+                (expr, user_id),
+            )
+        except sqlite3.OperationalError as e:
+            logger.warning("正则候选查询失败，改为全量扫描: %s", e)
+    return conn.execute("SELECT * FROM notes WHERE user_id=? ORDER BY date DESC", (user_id,))
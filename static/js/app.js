@@ -1,6 +1,7 @@
 import { PlannerApp } from './planner.js';
 import { TimerManager } from './timer.js';
 import { StatisticsManager } from './stats.js';
+import { startLiveUpdates } from './live.js';
 
 function initTabs() {
     document.querySelectorAll('.tab').forEach(tab => {
@@ -19,6 +20,7 @@ document.addEventListener('DOMContentLoaded', () => {
     window.planner = new PlannerApp();
     window.timer = new TimerManager();
     window.stats = new StatisticsManager();
+    startLiveUpdates();
 
     if (window.I18n) {
         if (window.I18n.applyTranslations) window.I18n.applyTranslations();
@@ -30,3 +30,35 @@ export function showToast(message, options = {}) {
         toast.classList.remove('active', 'toast-error', 'toast-success', 'toast-warning');
     }, showUndo ? 6000 : 3000);
 }
+
+/**
+ * Fill a <datalist> for `input` with /api/suggest completions as the user types.
+ * `kinds` narrows the sources ("event", "timer", "template"; comma-separated).
+ */
+export function attachSuggestions(input, kinds) {
+    if (!input) return;
+    const list = document.createElement('datalist');
+    list.id = `${input.id}Suggestions`;
+    input.after(list);
+    input.setAttribute('list', list.id);
+    let timer = null, seq = 0;
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        timer = setTimeout(async () => {
+            const mine = ++seq;
+            const q = input.value.trim();
+            if (!q) { list.replaceChildren(); return; }
+            try {
+                const res = await fetch(`/api/suggest?${new URLSearchParams({ q, kind: kinds, limit: 8 })}`);
+                if (!res.ok || mine !== seq) return;
+                const items = await res.json();
+                // An exact match would only repeat what is already typed.
+                list.replaceChildren(...items.filter(i => i.text !== q).map(i => {
+                    const option = document.createElement('option');
+                    option.value = i.text;
+                    return option;
+                }));
+            } catch (e) { /* network error: no suggestions */ }
+        }, 80);
+    });
+}
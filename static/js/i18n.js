@@ -338,7 +338,10 @@
       'todo.title': 'To-Do',
       'todo.add': 'Add',
       'todo.placeholder': 'New to-do...',
-      'todo.delete': 'Delete'
+      'todo.delete': 'Delete',
+      'todo.autoSchedule': 'Schedule into free time',
+      'todo.scheduled': 'Scheduled {count} to-dos',
+      'todo.unscheduled': '{count} did not fit'
     },
     'zh-CN': {
       'app.title': '日程计划',
@@ -674,7 +677,10 @@
       'todo.title': '待办',
       'todo.add': '添加',
       'todo.placeholder': '新建待办...',
-      'todo.delete': '删除'
+      'todo.delete': '删除',
+      'todo.autoSchedule': '排入空闲时间',
+      'todo.scheduled': '已安排 {count} 项待办',
+      'todo.unscheduled': '{count} 项放不下'
     },
     'zh-TW': {
       'app.title': '日程計劃',
@@ -1010,7 +1016,10 @@
       'todo.title': '待辦',
       'todo.add': '新增',
       'todo.placeholder': '新增待辦...',
-      'todo.delete': '刪除'
+      'todo.delete': '刪除',
+      'todo.autoSchedule': '排入空閒時間',
+      'todo.scheduled': '已安排 {count} 項待辦',
+      'todo.unscheduled': '{count} 項放不下'
     },
     'fr': {
       'app.title': 'Planificateur d\'emploi du temps',
@@ -1346,7 +1355,10 @@
       'todo.title': 'À faire',
       'todo.add': 'Ajouter',
       'todo.placeholder': 'Nouvelle tâche...',
-      'todo.delete': 'Supprimer'
+      'todo.delete': 'Supprimer',
+      'todo.autoSchedule': 'Planifier dans le temps libre',
+      'todo.scheduled': '{count} tâches planifiées',
+      'todo.unscheduled': '{count} sans créneau'
     },
     'de': {
       'app.title': 'Terminplaner',
@@ -1682,7 +1694,10 @@
       'todo.title': 'Aufgaben',
       'todo.add': 'Hinzufügen',
       'todo.placeholder': 'Neue Aufgabe...',
-      'todo.delete': 'Löschen'
+      'todo.delete': 'Löschen',
+      'todo.autoSchedule': 'In freie Zeit einplanen',
+      'todo.scheduled': '{count} Aufgaben eingeplant',
+      'todo.unscheduled': '{count} passten nicht'
     },
     'ja': {
       'app.title': 'スケジュールプランナー',
@@ -2018,7 +2033,10 @@
       'todo.title': 'やること',
       'todo.add': '追加',
       'todo.placeholder': '新しいタスク...',
-      'todo.delete': '削除'
+      'todo.delete': '削除',
+      'todo.autoSchedule': '空き時間に割り当て',
+      'todo.scheduled': '{count} 件のやることを割り当てました',
+      'todo.unscheduled': '{count} 件は入りませんでした'
     },
     'ar': {
       'app.title': 'مخطط الجدول الزمني',
@@ -2354,7 +2372,10 @@
       'todo.title': 'المهام',
       'todo.add': 'إضافة',
       'todo.placeholder': 'مهمة جديدة...',
-      'todo.delete': 'حذف'
+      'todo.delete': 'حذف',
+      'todo.autoSchedule': 'جدولة في الوقت المتاح',
+      'todo.scheduled': 'تمت جدولة {count} مهام',
+      'todo.unscheduled': 'لم تتسع {count}'
     },
     'he': {
       'app.title': 'מתכנן לוח זמנים',
@@ -2690,7 +2711,10 @@
       'todo.title': 'מטלות',
       'todo.add': 'הוסף',
       'todo.placeholder': 'משימה חדשה...',
-      'todo.delete': 'מחק'
+      'todo.delete': 'מחק',
+      'todo.autoSchedule': 'שבץ בזמן פנוי',
+      'todo.scheduled': 'שובצו {count} מטלות',
+      'todo.unscheduled': '{count} לא נכנסו'
     }
   };
 
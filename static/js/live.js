@@ -0,0 +1,70 @@
+/* ================================================================
+   LIVE UPDATES
+   Server-Sent Events from /api/stream: when another tab or device of
+   the same user changes something, refetch the views that show it.
+   ================================================================ */
+
+const REFRESH_DELAY = 300;
+
+export function startLiveUpdates() {
+    const url = document.body.dataset.stream;
+    if (!url || !window.EventSource) return;
+
+    const pending = new Set();
+    const noteDates = new Set();
+    let timer = null;
+
+    const refresh = () => {
+        timer = null;
+        // Hidden pages catch up when shown again.
+        if (document.visibilityState !== 'visible') return;
+        const planner = window.planner;
+        // Never pull data out from under an edit in progress; try again shortly.
+        if (planner && (planner.isDragging || planner.resizeEventId != null
+            || document.querySelector('#todoList .todo-editing'))) {
+            schedule();
+            return;
+        }
+        if (planner) {
+            const reset = pending.has('reset');
+            if (reset || pending.has('event')) planner.fetchEvents();
+            if (reset || pending.has('event') || pending.has('note')) {
+                planner._markerCacheMonth = null;
+                planner.fetchCalendarMarkers();
+            }
+            const editor = document.getElementById('notesEditor');
+            if ((reset || noteDates.has(planner.selectedDateStr()))
+                && document.activeElement !== editor && !planner._pendingNoteSave) {
+                planner.fetchNotes();
+            }
+            if (reset || pending.has('todo')) planner.fetchTodos();
+        }
+        if (window.timer && (pending.has('timer') || pending.has('reset'))) {
+            window.timer.fetchRecords();
+            window.timer.fetchStats();
+        }
+        pending.clear();
+        noteDates.clear();
+    };
+
+    const schedule = () => {
+        if (!timer) timer = setTimeout(refresh, REFRESH_DELAY);
+    };
+
+    const source = new EventSource(url, { withCredentials: true });
+    source.addEventListener('change', e => {
+        let change;
+        try { change = JSON.parse(e.data); } catch (err) { return; }
+        pending.add(change.entity);
+        if (change.entity === 'note') noteDates.add(change.date);
+        schedule();
+    });
+    source.addEventListener('reset', () => {
+        pending.add('reset');
+        schedule();
+    });
+
+    document.addEventListener('visibilitychange', () => {
+        if (document.visibilityState === 'visible' && pending.size) schedule();
+    });
+}
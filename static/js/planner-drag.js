@@ -92,7 +92,9 @@ export const DragMixin = {
         e.stopPropagation();
 
         const eventEl = handle.closest('.event');
-        const id = parseInt(eventEl.dataset.eventId);
+        // Virtual recurring occurrences carry string ids like "r12-20240501".
+        const raw = eventEl.dataset.eventId;
+        const id = /^\d+$/.test(raw) ? parseInt(raw) : raw;
         const col = eventEl.closest('.day-column');
 
         this.isResizing = true;
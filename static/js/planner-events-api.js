@@ -8,12 +8,18 @@ export const EventsApiMixin = {
     async fetchEvents() {
         const ds = this.selectedDateStr();
         try {
-            await fetch('/api/events/generate-recurring', {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ start: ds, end: ds }),
-            }).catch(() => {});
-            const r = await fetch(`/api/events?start=${ds}&end=${ds}`);
+            // Virtual recurrence (the default) expands series server-side on read.
+            if (document.body.dataset.recurrence === 'materialize') {
+                await fetch('/api/events/generate-recurring', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ start: ds, end: ds }),
+                }).catch(() => {});
+            }
+            const [r, c] = await Promise.all([
+                fetch(`/api/events?start=${ds}&end=${ds}`),
+                fetch(`/api/events/conflicts?start=${ds}&end=${ds}`).catch(() => null),
+            ]);
             if (!r.ok) {
                 const d = await r.json().catch(() => ({}));
                 const msg = (window.I18n && window.I18n.translateError) ? window.I18n.translateError(d.error) : d.error;
@@ -21,6 +27,7 @@ export const EventsApiMixin = {
                 return;
             }
             this.events = await r.json();
+            this.setConflicts(c && c.ok ? await c.json() : []);
             this.renderEvents();
             this.scheduleReminders();
         } catch (e) {
@@ -29,9 +36,18 @@ export const EventsApiMixin = {
         }
     },
 
+    /** Lanes for overlapping events, from the server's overlap groups of the shown day. */
+    setConflicts(groups) {
+        this.eventLanes = new Map();
+        for (const g of groups || []) {
+            if (g.date !== this.selectedDateStr()) continue;
+            for (const e of g.events) this.eventLanes.set(e.id, { lane: e.lane, lanes: g.lanes });
+        }
+    },
+
     async createEvent(data) {
         try {
-            const r = await fetch('/api/events', {
+            const r = await fetch('/api/events?conflicts=1', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(data),
@@ -44,6 +60,7 @@ export const EventsApiMixin = {
             }
             const result = await r.json();
             if (result.event) this.events.push(result.event);
+            if (result.conflicts) this.setConflicts(result.conflicts);
             this.renderEvents();
             this._markerCacheMonth = null;
             this.fetchCalendarMarkers();
@@ -57,7 +74,7 @@ export const EventsApiMixin = {
 
     async updateEvent(id, data) {
         try {
-            const r = await fetch(`/api/events/${id}`, {
+            const r = await fetch(`/api/events/${id}?conflicts=1`, {
                 method: 'PUT',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify(data),
@@ -68,9 +85,10 @@ export const EventsApiMixin = {
                 showToast(msg || ((window.I18n && window.I18n.t) ? window.I18n.t('toast.updateFailed') : 'Failed to update event'), { type: 'error' });
                 return null;
             }
-            const u = await r.json();
+            const { conflicts, ...u } = await r.json();
             const idx = this.events.findIndex(e => e.id === id);
             if (idx !== -1) this.events[idx] = u;
+            this.setConflicts(conflicts);
             this.renderEvents();
             this._markerCacheMonth = null;
             this.fetchCalendarMarkers();
@@ -84,7 +102,7 @@ export const EventsApiMixin = {
 
     async deleteEvent(id) {
         try {
-            const r = await fetch(`/api/events/${id}`, { method: 'DELETE' });
+            const r = await fetch(`/api/events/${id}?conflicts=1`, { method: 'DELETE' });
             if (!r.ok) {
                 const d = await r.json().catch(() => ({}));
                 const msg = (window.I18n && window.I18n.translateError) ? window.I18n.translateError(d.error) : d.error;
@@ -93,6 +111,7 @@ export const EventsApiMixin = {
             }
             const data = await r.json();
             this.events = this.events.filter(e => e.id !== id);
+            this.setConflicts(data.conflicts);
             this.renderEvents();
             this._markerCacheMonth = null;
             this.fetchCalendarMarkers();
@@ -120,13 +139,21 @@ export const EventsApiMixin = {
         showToast((window.I18n && window.I18n.t) ? window.I18n.t(key) : (targetColType === 'actual' ? 'Moved to Actual column' : 'Moved to Plan column'));
     },
 
+    async bulkEvents(ops) {
+        // ops: { create: [...], update: [{ id, ...fields }], delete: [ids] }, applied in one transaction
+        const r = await fetch('/api/events/bulk', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(ops),
+        });
+        const data = await r.json();
+        if (!r.ok) throw new Error(data.error || r.statusText);
+        return data;
+    },
+
     async batchUpdateEvents(items) {
         try {
-            await fetch('/api/events/batch', {
-                method: 'PUT',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(items),
-            });
+            await this.bulkEvents({ update: items });
             await this.fetchEvents();
         } catch (e) { console.error(e); }
     },
@@ -146,10 +173,10 @@ export const EventsApiMixin = {
         this._undoing = true;
         try {
             if (action.type === 'create') {
-                for (const id of action.eventIds) {
-                    await fetch(`/api/events/${id}`, { method: 'DELETE' });
-                    this.events = this.events.filter(e => e.id !== id);
-                }
+                try {
+                    await this.bulkEvents({ delete: action.eventIds });
+                } catch (e) { console.error(e); }
+                this.events = this.events.filter(e => !action.eventIds.includes(e.id));
                 this.renderEvents();
                 showToast(t('toast.undoCreate'));
             } else if (action.type === 'edit') {
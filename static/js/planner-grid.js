@@ -48,6 +48,13 @@ export const GridMixin = {
             el.dataset.eventId = evt.id;
             el.style.top = top + 'px';
             el.style.height = height + 'px';
+            // Overlapping events share the column width, one lane each (lanes come from the server).
+            const lane = this.eventLanes?.get(evt.id);
+            if (lane && lane.lanes > 1) {
+                el.classList.add('event-lane');
+                el.style.setProperty('--lane', lane.lane);
+                el.style.setProperty('--lanes', lane.lanes);
+            }
             el.style.background = this.hexToRgba(evt.color, evt.completed ? 0.3 : 0.85);
             el.style.color = this.getContrastColor(evt.color);
 
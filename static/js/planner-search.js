@@ -51,7 +51,7 @@ export const SearchMixin = {
         this._searchTimer = setTimeout(() => this._performSearch(q), 300);
     },
 
-    async _performSearch(q) {
+    async _performSearch(q, fuzzy = false) {
         const inp = document.getElementById('searchInput');
         try {
             const params = new URLSearchParams({
@@ -59,6 +59,7 @@ export const SearchMixin = {
                 case_sensitive: this._searchCase  ? '1' : '0',
                 whole_word:     this._searchWord  ? '1' : '0',
                 regex:          this._searchRegex ? '1' : '0',
+                fuzzy:          fuzzy             ? '1' : '0',
             });
             const [evtRes, noteRes] = await Promise.all([
                 fetch(`/api/events/search?${params}`),
@@ -73,7 +74,16 @@ export const SearchMixin = {
             inp?.classList.remove('regex-error');
             const events = (await evtRes.json()).map(e => ({ ...e, _type: 'event' }));
             const notes  = noteRes.ok ? (await noteRes.json()).map(n => ({ ...n, _type: 'note' })) : [];
-            const combined = [...events, ...notes].sort((a, b) => b.date.localeCompare(a.date));
+            const all = [...events, ...notes];
+            // Nothing found: retry once tolerating typos (plain searches only).
+            if (!all.length && !fuzzy && !this._searchRegex) return this._performSearch(q, true);
+            // Full-text results carry a BM25 rank (lower is better), fuzzy ones also their edit
+            // distance; regex and LIKE results are sorted by date.
+            const combined = all.every(i => typeof i.fuzzy === 'number')
+                ? all.sort((a, b) => a.fuzzy - b.fuzzy || a.rank - b.rank)
+                : all.every(i => typeof i.rank === 'number')
+                ? all.sort((a, b) => a.rank - b.rank)
+                : all.sort((a, b) => b.date.localeCompare(a.date));
             this._renderSearchDropdown(combined);
         } catch (e) { /* network error: silently ignore */ }
     },
@@ -91,17 +101,18 @@ export const SearchMixin = {
         } else {
             dropdown.innerHTML = results.map(item => {
                 if (item._type === 'note') {
-                    const snippet = item.content.replace(/[#*`>_~\[\]!]/g, '').replace(/\s+/g, ' ').trim().slice(0, 60);
+                    // item.snippet is server-escaped HTML with <mark> around the hits
+                    const snippet = item.snippet || escHtml(item.content.replace(/[#*`>_~\[\]!]/g, '').replace(/\s+/g, ' ').trim().slice(0, 60) || item.date);
                     return `<div class="search-result-item" data-type="note" data-date="${escHtml(item.date)}" data-note-id="${item.id}">
                         <span class="search-result-note-icon">&#128221;</span>
-                        <span class="search-result-title">${escHtml(snippet || item.date)}</span>
+                        <span class="search-result-title">${snippet}</span>
                         <span class="search-result-meta">${escHtml(item.date)}</span>
                     </div>`;
                 }
                 const safeColor = /^#[0-9a-fA-F]{6}$/.test(item.color) ? item.color : '#888888';
                 return `<div class="search-result-item" data-type="event" data-event-id="${item.id}" data-date="${escHtml(item.date)}">
                     <span class="search-result-dot" style="background:${safeColor}"></span>
-                    <span class="search-result-title">${escHtml(item.title)}</span>
+                    <span class="search-result-title">${item.title_highlight || escHtml(item.title)}</span>
                     <span class="search-result-meta">${escHtml(item.date)} ${escHtml(item.start_time)}-${escHtml(item.end_time)}</span>
                 </div>`;
             }).join('');
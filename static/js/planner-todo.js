@@ -1,3 +1,5 @@
+import { fmtDateISO, showToast } from './helpers.js';
+
 /* ================================================================
    TODO LIST MIXIN
    ================================================================ */
@@ -8,6 +10,7 @@ export const TodoMixin = {
         this._todoInputVisible = false;
 
         document.getElementById('todoAddBtn').addEventListener('click', () => this._showTodoInput());
+        document.getElementById('todoScheduleBtn').addEventListener('click', () => this._scheduleTodos());
         document.getElementById('todoInputConfirm').addEventListener('click', () => this._submitTodoInput());
         document.getElementById('todoInput').addEventListener('keydown', e => {
             if (e.key === 'Enter') { e.preventDefault(); this._submitTodoInput(); }
@@ -167,4 +170,43 @@ export const TodoMixin = {
             this._renderTodoList();
         } catch (e) { /* ignore */ }
     },
+
+    /** Pack the open to-dos into the free time of the shown day (from now on, if it is today). */
+    async _scheduleTodos() {
+        const pending = this.todos.filter(t => !t.done);
+        if (!pending.length) return;
+        const t = (key, params) => (window.I18n && window.I18n.t) ? window.I18n.t(key, params) : key;
+        const ds = this.selectedDateStr();
+        const body = {
+            start: ds, end: ds, weekdays: [0, 1, 2, 3, 4, 5, 6], apply: true,
+            items: pending.map(todo => ({ todo_id: todo.id })),
+        };
+        const now = new Date();
+        if (ds === fmtDateISO(now)) {
+            body.not_before = `${String(now.getHours()).padStart(2, '0')}:${String(now.getMinutes()).padStart(2, '0')}`;
+        }
+        try {
+            const res = await fetch('/api/schedule', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(body),
+            });
+            const d = await res.json().catch(() => ({}));
+            if (!res.ok) {
+                const msg = (window.I18n && window.I18n.translateError) ? window.I18n.translateError(d.error) : d.error;
+                showToast(msg || t('toast.createFailed'), { type: 'error' });
+                return;
+            }
+            let msg = t('todo.scheduled', { count: d.scheduled.length });
+            if (d.unscheduled.length) msg += ' · ' + t('todo.unscheduled', { count: d.unscheduled.length });
+            showToast(msg);
+            if (d.created.length) {
+                this._markerCacheMonth = null;
+                this.fetchCalendarMarkers();
+                await this.fetchEvents();
+            }
+        } catch (e) {
+            showToast(t('toast.networkError'), { type: 'error' });
+        }
+    },
 };
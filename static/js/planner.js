@@ -1,5 +1,5 @@
 import { COLORS, TOTAL_SLOTS } from './constants.js';
-import { fmtDateISO, showToast } from './helpers.js';
+import { fmtDateISO, showToast, attachSuggestions } from './helpers.js';
 import { CalendarMixin } from './planner-calendar.js';
 import { GridMixin } from './planner-grid.js';
 import { EventsApiMixin } from './planner-events-api.js';
@@ -102,6 +102,7 @@ export class PlannerApp {
         document.getElementById('cancelBtn').addEventListener('click', () => this.closeModal());
         document.getElementById('copyFromPlanBtn').addEventListener('click', () => this.startPlanCopyMode());
         document.getElementById('saveBtn').addEventListener('click', () => this.saveEvent());
+        attachSuggestions(document.getElementById('eventTitle'), 'event,template');
         document.getElementById('deleteBtn').addEventListener('click', async () => {
             if (!this.editingEvent) return;
             const ev = this.editingEvent;
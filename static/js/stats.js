@@ -116,47 +116,37 @@ export class StatisticsManager {
     async loadData() {
         const { start, end } = this.getDateRange();
         try {
-            const r = await fetch(`/api/analytics?start=${start}&end=${end}`);
+            const r = await fetch(`/api/analytics?start=${start}&end=${end}&detail=0`);
             if (!r.ok) return;
             const data = await r.json();
-            if (!data.events || !data.timer_records) return;
-            this.renderSummary(data);
-            this.renderCharts(data);
+            if (!data.summary) return;
+            this.renderSummary(data.summary);
+            this.renderCharts(data.summary);
         } catch (e) { console.error(e); }
     }
 
-    renderSummary(data) {
-        const events = data.events.filter(e => (e.col_type || 'plan') === 'actual');
-        const timer = data.timer_records;
-        document.getElementById('scEvents').textContent = events.length;
-        let totalMin = 0;
-        for (const e of events) {
-            const [sh, sm] = e.start_time.split(':').map(Number);
-            const [eh, em] = e.end_time.split(':').map(Number);
-            totalMin += (eh * 60 + em) - (sh * 60 + sm);
-        }
+    renderSummary(summary) {
+        document.getElementById('scEvents').textContent = summary.events;
+        const totalMin = summary.event_minutes;
         const ph = totalMin / 60;
         document.getElementById('scPlannedHours').textContent = ph >= 1 ? ph.toFixed(1) + 'h' : totalMin + 'm';
-        const focusSec = timer.reduce((s, r) => s + r.actual_seconds, 0);
-        const fm = Math.round(focusSec / 60);
+        const fm = Math.round(summary.focus_seconds / 60);
         document.getElementById('scFocusTime').textContent = fm >= 60 ? (fm / 60).toFixed(1) + 'h' : fm + 'm';
-        const completedTimer = timer.filter(r => r.completed).length;
-        document.getElementById('scTimerRate').textContent = timer.length > 0 ? Math.round(completedTimer / timer.length * 100) + '%' : '0%';
+        document.getElementById('scTimerRate').textContent = summary.timer_count > 0 ? Math.round(summary.timer_completed / summary.timer_count * 100) + '%' : '0%';
     }
 
-    renderCharts(data) {
+    renderCharts(summary) {
         if (typeof Chart === 'undefined') return;
         Object.values(this.charts).forEach(c => c.destroy());
         this.charts = {};
-        const events = data.events.filter(e => (e.col_type || 'plan') === 'actual');
-        const timer = data.timer_records;
+        const daily = summary.daily;
         const { start, end } = this.getDateRange();
-        const labels = this.period === 'all' ? this.getMonthLabels(events, timer) : this.getDayLabels(start, end);
+        const labels = this.period === 'all' ? this.getMonthLabels(daily) : this.getDayLabels(start, end);
         const groupFn = this.period === 'all' ? (d) => d.substring(0, 7) : (d) => d;
-        this.charts.schedule = this.chartScheduleTrend(labels, events, groupFn);
-        this.charts.category = this.chartCategory(events);
-        this.charts.focus = this.chartFocusTrend(labels, timer, groupFn);
-        this.charts.priority = this.chartPriority(events);
+        this.charts.schedule = this.chartScheduleTrend(labels, daily, groupFn);
+        this.charts.category = this.chartCategory(summary.category_minutes);
+        this.charts.focus = this.chartFocusTrend(labels, daily, groupFn);
+        this.charts.priority = this.chartPriority(summary.priority_counts);
     }
 
     getDayLabels(start, end) {
@@ -167,10 +157,9 @@ export class StatisticsManager {
         return labels;
     }
 
-    getMonthLabels(events, timer) {
+    getMonthLabels(daily) {
         const months = new Set();
-        events.forEach(e => months.add(e.date.substring(0, 7)));
-        timer.forEach(r => months.add(r.date.substring(0, 7)));
+        daily.forEach(d => months.add(d.date.substring(0, 7)));
         if (months.size === 0) months.add(fmtDateISO(new Date()).substring(0, 7));
         return [...months].sort();
     }
@@ -184,17 +173,10 @@ export class StatisticsManager {
         return key.substring(5);
     }
 
-    chartScheduleTrend(labels, events, groupFn) {
+    chartScheduleTrend(labels, daily, groupFn) {
         const hours = {};
         labels.forEach(l => hours[l] = 0);
-        events.forEach(e => {
-            const k = groupFn(e.date);
-            if (k in hours) {
-                const [sh, sm] = e.start_time.split(':').map(Number);
-                const [eh, em] = e.end_time.split(':').map(Number);
-                hours[k] += ((eh * 60 + em) - (sh * 60 + sm)) / 60;
-            }
-        });
+        daily.forEach(d => { const k = groupFn(d.date); if (k in hours) hours[k] += d.event_minutes / 60; });
         const durationLabel = this.t('stats.durationLabel');
         return new Chart(document.getElementById('chartSchedule'), {
             type: 'bar', data: {
@@ -210,13 +192,9 @@ export class StatisticsManager {
         });
     }
 
-    chartCategory(events) {
+    chartCategory(categoryMinutes) {
         const cats = {};
-        events.forEach(e => {
-            const [sh, sm] = e.start_time.split(':').map(Number);
-            const [eh, em] = e.end_time.split(':').map(Number);
-            cats[e.category] = (cats[e.category] || 0) + ((eh * 60 + em) - (sh * 60 + sm)) / 60;
-        });
+        Object.entries(categoryMinutes).forEach(([k, m]) => cats[k] = m / 60);
         const keys = Object.keys(cats);
         const ctx = document.getElementById('chartCategory');
         const noData = this.t('stats.noData');
@@ -231,10 +209,10 @@ export class StatisticsManager {
         });
     }
 
-    chartFocusTrend(labels, timer, groupFn) {
+    chartFocusTrend(labels, daily, groupFn) {
         const mins = {};
         labels.forEach(l => mins[l] = 0);
-        timer.forEach(r => { const k = groupFn(r.date); if (k in mins) mins[k] += Math.round(r.actual_seconds / 60); });
+        daily.forEach(d => { const k = groupFn(d.date); if (k in mins) mins[k] += d.focus_minutes; });
         const focusLabel = this.t('stats.focusLabel');
         return new Chart(document.getElementById('chartFocus'), {
             type: 'bar', data: {
@@ -248,9 +226,8 @@ export class StatisticsManager {
         });
     }
 
-    chartPriority(events) {
-        const counts = { 1: 0, 2: 0, 3: 0 };
-        events.forEach(e => counts[e.priority] = (counts[e.priority] || 0) + 1);
+    chartPriority(priorityCounts) {
+        const counts = { 1: 0, 2: 0, 3: 0, ...priorityCounts };
         const ctx = document.getElementById('chartPriority');
         const total = counts[1] + counts[2] + counts[3];
         const noData = this.t('stats.noData');
@@ -1,5 +1,5 @@
 import { RING_CIRCUMFERENCE } from './constants.js';
-import { fmtDateISO, escHtml, showToast } from './helpers.js';
+import { fmtDateISO, escHtml, showToast, attachSuggestions } from './helpers.js';
 
 export class TimerManager {
     constructor() {
@@ -114,6 +114,7 @@ export class TimerManager {
     }
 
     bindEvents() {
+        attachSuggestions(document.getElementById('timerTaskName'), 'timer,event');
         document.getElementById('timerMinus5').addEventListener('click', () => this.adjustTime(-5));
         document.getElementById('timerPlus5').addEventListener('click', () => this.adjustTime(5));
         document.querySelectorAll('.preset-btn').forEach(btn => {
@@ -1,4 +1,4 @@
-const CACHE_NAME = 'schedule-planner-v7';
+const CACHE_NAME = 'schedule-planner-v8';
 const STATIC_ASSETS = [
     '/',
     '/static/css/base.css',
@@ -23,6 +23,7 @@ const STATIC_ASSETS = [
     '/static/js/planner-notes.js',
     '/static/js/planner-search.js',
     '/static/js/planner-todo.js',
+    '/static/js/live.js',
     '/static/js/timer.js',
     '/static/js/stats.js',
 ];
@@ -13,6 +13,7 @@ import logging
 from typing import Optional
 
 from storage.base import Storage
+from storage.instrumented import InstrumentedStorage
 
 logger = logging.getLogger(__name__)
 
@@ -26,11 +27,13 @@ def get_storage() -> Storage:
         return _instance
 
     storage_type = os.environ.get("STORAGE_TYPE", "local").lower()
+    if storage_type != "oss":
+        storage_type = "local"
 
     if storage_type == "oss":
         from storage.oss import OSSStorage
 
-        _instance = OSSStorage(
+        backend = OSSStorage(
             access_key_id=os.environ.get("OSS_ACCESS_KEY_ID", ""),
             access_key_secret=os.environ.get("OSS_ACCESS_KEY_SECRET", ""),
             endpoint=os.environ.get("OSS_ENDPOINT", ""),
@@ -45,9 +48,10 @@ def get_storage() -> Storage:
             "UPLOAD_FOLDER",
             os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads"),
         )
-        _instance = LocalStorage(upload_folder)
+        backend = LocalStorage(upload_folder)
         logger.info("Using local storage backend: %s", upload_folder)
 
+    _instance = InstrumentedStorage(backend, storage_type)
     return _instance
 
 
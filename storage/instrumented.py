@@ -0,0 +1,44 @@
+import time
+from typing import Union, IO
+
+from storage.base import Storage
+from metrics import inc, observe
+
+
+class InstrumentedStorage(Storage):
+    """Wrap a backend and record the latency of every call in metrics."""
+
+    def __init__(self, backend: Storage, name: str):
+        self._backend = backend
+        self._name = name
+
+    def _timed(self, op, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        except Exception:
+            inc("planner_storage_errors_total", backend=self._name, op=op)
+            raise
+        finally:
+            observe(
+                "planner_storage_operation_duration_seconds",
+                time.perf_counter() - start, backend=self._name, op=op,
+            )
+
+    def save(self, data: Union[bytes, IO], relative_path: str) -> str:
+        return self._timed("save", self._backend.save, data, relative_path)
+
+    def delete(self, relative_path: str) -> bool:
+        return self._timed("delete", self._backend.delete, relative_path)
+
+    def exists(self, relative_path: str) -> bool:
+        return self._timed("exists", self._backend.exists, relative_path)
+
+    def url(self, relative_path: str) -> str:
+        return self._backend.url(relative_path)
+
+    def serve(self, relative_path: str):
+        return self._timed("serve", self._backend.serve, relative_path)
+
+    def __getattr__(self, name):
+        return getattr(self._backend, name)
@@ -0,0 +1,520 @@
+"""
+stream — live change notifications over Server-Sent Events.
+
+GET /api/stream stays open per browser tab and pushes a small "change"
+event ({"entity", "id", "op", "date"}) whenever an event, note, to-do or
+timer record of the user changes, from any device or worker process.  The
+page refetches what it shows through the regular endpoints.
+
+Connections are served by an asyncio loop on its own thread and port
+(STREAM_PORT, off by default), so an open stream costs a socket and a few
+objects, never one of the WSGI server's worker threads.  The port speaks
+plain HTTP; HTTPS pages need STREAM_URL pointing at a proxy in front of it.  One process per host binds the
+port; in the others start_stream_server() logs and returns.  That process
+still sees every write: the bridge between processes is the sync change
+log (see sync.py).  A single feed thread reads the log head of each
+database with listeners every STREAM_POLL_INTERVAL seconds, loads the new
+entries when it moved, and fans them out to each user's connections.
+
+Event ids are sync cursors ("<log id>.<seq>").  A browser reconnecting
+with Last-Event-ID is sent what it missed from the change log; when that
+is not possible (a foreign or pruned cursor, or too many changes) it gets
+a "reset" event and reloads instead.  A comment line every STREAM_HEARTBEAT
+seconds keeps proxies from closing idle streams.
+"""
+
+import asyncio
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit, parse_qs
+
+from itsdangerous import BadSignature
+from werkzeug.http import parse_cookie
+
+from config import (
+    DB_PATH, DB_SHARDING, STREAM_PORT, STREAM_HOST, STREAM_URL, STREAM_POLL_INTERVAL,
+    STREAM_HEARTBEAT, STREAM_MAX_CONNECTIONS, STREAM_MAX_PER_USER,
+)
+from database import connect, get_shards
+from sync import log_state, parse_cursor
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STREAM_PATH = "/api/stream"
+# Changes replayed on reconnect, or sent to one user by one poll, beyond
+# which the client is told to reset instead.
+_MAX_BURST = 200
+# Log rows read from one database per poll.
+_POLL_ROWS = 1000
+# Messages queued for a connection; a client that falls this far behind is dropped.
+_QUEUE_SIZE = 500
+_MAX_HEADER_BYTES = 16384
+_READ_TIMEOUT = 10
+_WRITE_TIMEOUT = 30
+_RETRY_MS = 3000
+_PING = b": ping\n\n"
+
+_STATUS = {
+    200: "OK", 204: "No Content", 401: "Unauthorized", 403: "Forbidden", 404: "Not Found",
+    405: "Method Not Allowed", 429: "Too Many Requests", 503: "Service Unavailable",
+}
+
+
+def _message(event, ident, data):
+    return f"id: {ident}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n".encode()
+
+
+def _db_path(user_id):
+    return get_shards().get_pool(user_id).path if DB_SHARDING else DB_PATH
+
+
+class Subscriber:
+    """One open stream: its user, resume position and outgoing messages."""
+
+    def __init__(self, user_id, last_event_id, loop):
+        self.user_id = user_id
+        self.last_event_id = last_event_id
+        self.loop = loop
+        self.queue = asyncio.Queue(_QUEUE_SIZE)
+        self.overflow = False
+        # Owned by the feed thread: the database listened to and the last seq sent.
+        self.path = None
+        self.seq = 0
+
+    def send(self, payload):
+        """Queue *payload* from the feed thread."""
+        try:
+            self.loop.call_soon_threadsafe(self._put, payload)
+        except RuntimeError:
+            pass  # loop already closed
+
+    def _put(self, payload):
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            self.overflow = True
+
+
+class _Log:
+    """The change log of one database and the streams listening to it."""
+
+    def __init__(self, path):
+        self.conn = connect(path)
+        self.log_id, _, self.seq = log_state(self.conn)
+        self.users = {}
+
+    def head(self):
+        row = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name='change_log'").fetchone()
+        return row[0] if row else 0
+
+
+class ChangeFeed:
+    """Feed thread: follows the change log of every database with listeners and fans out."""
+
+    def __init__(self, interval=STREAM_POLL_INTERVAL):
+        self.interval = max(0.1, interval)
+        self._requests = queue.SimpleQueue()
+        self._logs = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._counters = {"polls": 0, "changes": 0, "resets": 0}
+
+    def subscribe(self, sub):
+        self._requests.put((True, sub))
+
+    def unsubscribe(self, sub):
+        self._requests.put((False, sub))
+
+    def _reset(self, log, sub):
+        sub.seq = log.seq
+        sub.send(_message("reset", f"{log.log_id}.{log.seq}", {}))
+        self._counters["resets"] += 1
+        metrics.inc("planner_stream_events_total", type="reset")
+
+    def _send_changes(self, log, sub, rows):
+        rows = [r for r in rows if r["seq"] > sub.seq]
+        if len(rows) > _MAX_BURST:
+            self._reset(log, sub)
+            return
+        for r in rows:
+            sub.send(_message("change", f"{log.log_id}.{r['seq']}", {
+                "entity": r["entity"], "id": r["entity_id"], "op": r["op"], "date": r["date"],
+            }))
+            sub.seq = r["seq"]
+        if rows:
+            self._counters["changes"] += len(rows)
+            metrics.inc("planner_stream_events_total", len(rows), type="change")
+
+    def _attach(self, sub):
+        path = _db_path(sub.user_id)
+        log = self._logs.get(path)
+        if log is None:
+            log = self._logs[path] = _Log(path)
+        log.users.setdefault(sub.user_id, set()).add(sub)
+        sub.path = path
+
+        _, pruned, head = log_state(log.conn)
+        seq = parse_cursor(sub.last_event_id, log.log_id, pruned, head) if sub.last_event_id else None
+        if seq is None:
+            if sub.last_event_id:
+                self._reset(log, sub)
+            else:
+                sub.seq = log.seq
+                sub.send(_message("ready", f"{log.log_id}.{log.seq}", {}))
+            return
+        # Replay what the client missed up to where the feed stands; later
+        # entries come with the next poll.  A cursor ahead of the feed (from a
+        # stream served earlier by another process) just skips those entries.
+        sub.seq = seq
+        rows = log.conn.execute(
+            """SELECT seq, entity, entity_id, op, date FROM change_log
+               WHERE user_id=? AND seq > ? AND seq <= ? ORDER BY seq LIMIT ?""",
+            (sub.user_id, seq, log.seq, _MAX_BURST + 1),
+        ).fetchall()
+        self._send_changes(log, sub, rows)
+
+    def _detach(self, sub):
+        log = self._logs.get(sub.path)
+        if log is None:
+            return
+        subs = log.users.get(sub.user_id, set())
+        subs.discard(sub)
+        if not subs:
+            log.users.pop(sub.user_id, None)
+        if not log.users:
+            log.conn.close()
+            del self._logs[sub.path]
+
+    def _poll(self, log):
+        head = log.head()
+        if head == log.seq:
+            return
+        if head < log.seq:
+            # The database was restored under us: every listener starts over.
+            log.log_id, _, log.seq = log_state(log.conn)
+            for subs in log.users.values():
+                for sub in subs:
+                    self._reset(log, sub)
+            return
+        rows = log.conn.execute(
+            """SELECT seq, user_id, entity, entity_id, op, date FROM change_log
+               WHERE seq > ? ORDER BY seq LIMIT ?""",
+            (log.seq, _POLL_ROWS),
+        ).fetchall()
+        log.seq = rows[-1]["seq"] if len(rows) == _POLL_ROWS else max(head, rows[-1]["seq"] if rows else 0)
+        by_user = {}
+        for r in rows:
+            if r["user_id"] in log.users:
+                by_user.setdefault(r["user_id"], []).append(r)
+        for user_id, user_rows in by_user.items():
+            for sub in log.users[user_id]:
+                self._send_changes(log, sub, user_rows)
+
+    def _handle(self, item):
+        subscribe, sub = item
+        try:
+            if subscribe:
+                self._attach(sub)
+            else:
+                self._detach(sub)
+        except sqlite3.Error as e:
+            logger.warning("实时推送订阅处理失败 (uid=%s): %s", sub.user_id, e)
+
+    def run(self):
+        next_poll = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                item = self._requests.get(timeout=max(0.0, next_poll - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is not None:
+                self._handle(item)
+                if time.monotonic() < next_poll:
+                    continue
+            for path, log in list(self._logs.items()):
+                try:
+                    self._poll(log)
+                except sqlite3.Error as e:
+                    logger.warning("读取变更日志失败 (%s): %s", path, e)
+            self._counters["polls"] += 1
+            next_poll = time.monotonic() + self.interval
+        for log in self._logs.values():
+            log.conn.close()
+        self._logs = {}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="stream-feed", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._requests.put(None)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        return {
+            "databases": len(self._logs),
+            "users": sum(len(log.users) for log in list(self._logs.values())),
+            **self._counters,
+        }
+
+
+def _parse_head(head):
+    """(method, target, {lower-case header: value}) of a request head, or None."""
+    lines = head.decode("latin-1").split("\r\n")
+    parts = lines[0].split(" ")
+    if len(parts) != 3 or not parts[2].startswith("HTTP/1."):
+        return None
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return parts[0], parts[1], headers
+
+
+def _same_host(origin, headers):
+    """Whether *origin* names the host the request was sent to (any port)."""
+    try:
+        origin_host = urlsplit(origin).hostname
+    except ValueError:
+        return False
+    for name in ("x-forwarded-host", "host"):
+        value = (headers.get(name) or "").split(",")[0].strip()
+        if value and urlsplit("//" + value).hostname == origin_host:
+            return True
+    return False
+
+
+def _head(status, headers):
+    lines = [f"HTTP/1.1 {status} {_STATUS[status]}"] + [f"{k}: {v}" for k, v in headers]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+class StreamServer:
+    """Serves /api/stream from an asyncio loop on its own thread."""
+
+    def __init__(self, app, host=STREAM_HOST, port=STREAM_PORT):
+        self.host = host
+        self.port = port
+        self.feed = ChangeFeed()
+        self._serializer = app.session_interface.get_signing_serializer(app)
+        self._cookie_name = app.config["SESSION_COOKIE_NAME"]
+        self._max_age = int(app.permanent_session_lifetime.total_seconds())
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._per_user = {}
+        self._open = 0
+
+    def _user_id(self, headers):
+        value = parse_cookie(headers.get("cookie", "")).get(self._cookie_name)
+        if not value or self._serializer is None:
+            return None
+        try:
+            return self._serializer.loads(value, max_age=self._max_age).get("user_id")
+        except BadSignature:
+            return None
+
+    async def _reply(self, writer, status, error=None, extra=()):
+        body = json.dumps({"error": error}, ensure_ascii=False).encode() if error else b""
+        headers = [("Content-Length", len(body)), ("Connection", "close"), *extra]
+        if body:
+            headers.insert(0, ("Content-Type", "application/json; charset=utf-8"))
+        writer.write(_head(status, headers) + body)
+        try:
+            await asyncio.wait_for(writer.drain(), _WRITE_TIMEOUT)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        writer.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), _READ_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError, asyncio.CancelledError, ConnectionError):
+            writer.close()
+            return
+        request = _parse_head(head)
+        if request is None:
+            writer.close()
+            return
+        method, target, headers = request
+        target = urlsplit(target)
+        if target.path != STREAM_PATH:
+            return await self._reply(writer, 404, "资源不存在")
+        cors = ()
+        origin = headers.get("origin")
+        if origin:
+            if not _same_host(origin, headers):
+                logger.warning("实时推送: origin 不匹配 %s", origin)
+                return await self._reply(writer, 403, "非法请求来源")
+            cors = (("Access-Control-Allow-Origin", origin),
+                    ("Access-Control-Allow-Credentials", "true"), ("Vary", "Origin"))
+        if method == "OPTIONS":
+            return await self._reply(writer, 204, extra=cors + (
+                ("Access-Control-Allow-Methods", "GET"),
+                ("Access-Control-Allow-Headers", "Last-Event-ID, Cache-Control"),
+                ("Access-Control-Max-Age", "600"),
+            ))
+        if method != "GET":
+            return await self._reply(writer, 405, "请求方法不允许", cors)
+        user_id = self._user_id(headers)
+        if not user_id:
+            return await self._reply(writer, 401, "未登录", cors)
+        if self._open >= STREAM_MAX_CONNECTIONS:
+            return await self._reply(writer, 503, "实时推送连接数已满", cors)
+        if self._per_user.get(user_id, 0) >= STREAM_MAX_PER_USER:
+            return await self._reply(writer, 429, "实时推送连接过多", cors)
+
+        last_id = headers.get("last-event-id") or parse_qs(target.query).get("last_event_id", [None])[0]
+        writer.write(_head(200, [
+            ("Content-Type", "text/event-stream; charset=utf-8"),
+            ("Cache-Control", "no-cache"),
+            ("X-Accel-Buffering", "no"),
+            ("Connection", "close"),
+            *cors,
+        ]) + f"retry: {_RETRY_MS}\n\n".encode())
+        sub = Subscriber(user_id, last_id, asyncio.get_running_loop())
+        self._open += 1
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        metrics.gauge_add("planner_stream_connections", 1)
+        self.feed.subscribe(sub)
+        # The client sends nothing after its request: a finished read means it left.
+        gone = asyncio.ensure_future(reader.read(1))
+        try:
+            while True:
+                get = asyncio.ensure_future(sub.queue.get())
+                done, _ = await asyncio.wait({get, gone}, timeout=STREAM_HEARTBEAT,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if gone in done:
+                    get.cancel()
+                    break
+                if get in done:
+                    chunks = [get.result()]
+                    while not sub.queue.empty():
+                        chunks.append(sub.queue.get_nowait())
+                else:
+                    get.cancel()
+                    chunks = [_PING]
+                if sub.overflow:
+                    break
+                writer.write(b"".join(chunks))
+                await asyncio.wait_for(writer.drain(), _WRITE_TIMEOUT)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        except asyncio.CancelledError:
+            pass  # server shutting down
+        finally:
+            gone.cancel()
+            self.feed.unsubscribe(sub)
+            self._open -= 1
+            self._per_user[user_id] -= 1
+            if not self._per_user[user_id]:
+                del self._per_user[user_id]
+            metrics.gauge_add("planner_stream_connections", -1)
+            writer.close()
+
+    def _run(self):
+        loop = self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            self._server = loop.run_until_complete(asyncio.start_server(
+                self._handle, self.host, self.port, limit=_MAX_HEADER_BYTES,
+            ))
+        except OSError as e:
+            logger.info("实时推送端口 %s:%s 不可用 (%s)，由其他进程提供", self.host, self.port, e)
+            loop.close()
+            self._ready.set()
+            return
+        self.feed.start()
+        self._ready.set()
+        logger.info("实时推送服务已启动 (http://%s:%s%s)", self.host, self.port, STREAM_PATH)
+        try:
+            loop.run_forever()
+        finally:
+            self._server.close()
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+
+    def start(self):
+        """Bind and serve; False when the port is taken, e.g. by another worker."""
+        self._thread = threading.Thread(target=self._run, name="stream", daemon=True)
+        self._thread.start()
+        self._ready.wait(5)
+        return self._server is not None
+
+    def stop(self, timeout=5):
+        if self._server is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        self.feed.stop()
+
+    def stats(self):
+        return {
+            "port": self.port,
+            "connections": self._open,
+            "users": len(self._per_user),
+            "feed": self.feed.stats(),
+        }
+
+
+_server = None
+
+
+def start_stream_server(app):
+    """Serve live updates from this process if STREAM_PORT is enabled and free (idempotent)."""
+    global _server
+    if STREAM_PORT and _server is None:
+        server = StreamServer(app)
+        if server.start():
+            _server = server
+
+
+def stop_stream_server():
+    global _server
+    if _server is not None:
+        _server.stop()
+        _server = None
+
+
+def stream_stats():
+    return _server.stats() if _server is not None else None
+
+
+def stream_url(scheme, host):
+    """Where browsers open the stream for a page served from *host*; "" when disabled.
+
+    Without STREAM_URL only plain-HTTP pages get the direct port: the stream
+    server cannot answer https:// and the page would not load http:// from it.
+    """
+    if not STREAM_PORT:
+        return ""
+    if STREAM_URL:
+        return STREAM_URL
+    if scheme != "http":
+        return ""
+    hostname = urlsplit("//" + host).hostname or "localhost"
+    if ":" in hostname:
+        hostname = f"[{hostname}]"
+    return f"{scheme}://{hostname}:{STREAM_PORT}{STREAM_PATH}"
+
+
+def stream_origin(scheme, host):
+    """Origin of stream_url() for the page's CSP connect-src, or "" when it is the page's own."""
+    parts = urlsplit(stream_url(scheme, host))
+    return f"{parts.scheme}://{parts.netloc}" if parts.netloc else ""
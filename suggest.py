@@ -0,0 +1,210 @@
+"""
+suggest — title autocomplete from a per-user in-memory prefix index.
+
+The first request of a user builds a sorted array of the distinct event
+titles, timer task names and template names (three grouped queries, the
+event one answered from idx_events_title), each with how often and when it
+was last used.  A prefix lookup is a binary search plus a walk over the
+matching slice, ranked by use count decayed with a _HALF_LIFE_DAYS
+half-life, so a title used daily this month beats one used often last year.
+
+Write paths call record_use() for new rows, which updates a loaded index in
+place, and invalidate_suggestions() when rows are edited or removed; the
+index is then rebuilt on the next lookup.  Indexes of the
+SUGGEST_CACHE_USERS most recently active users are kept per web process and
+rebuilt after SUGGEST_TTL seconds, which also picks up writes made by other
+worker processes and rows moved to the archive.
+"""
+
+import time
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from datetime import date
+
+from config import SUGGEST_CACHE_USERS, SUGGEST_TTL
+from database import epoch_day, from_epoch_day
+
+KINDS = ("event", "timer", "template")
+# Names per kind loaded into an index, most recently used first.
+_MAX_PER_KIND = 5000
+_HALF_LIFE_DAYS = 30
+
+_SOURCES = {
+    "event": """SELECT title AS text, COUNT(*) AS uses, MAX(date) AS last_used, NULL AS ref
+                FROM events WHERE user_id=? GROUP BY title
+                ORDER BY last_used DESC LIMIT ?""",
+    "timer": """SELECT task_name AS text, COUNT(*) AS uses, MAX(date) AS last_used, NULL AS ref
+                FROM timer_records WHERE user_id=? GROUP BY task_name
+                ORDER BY last_used DESC LIMIT ?""",
+    "template": """SELECT name AS text, 1 AS uses, substr(created_at, 1, 10) AS last_used, id AS ref
+                   FROM event_templates WHERE user_id=?
+                   ORDER BY created_at DESC LIMIT ?""",
+}
+
+
+class _UserIndex:
+    """Sorted (folded text, kind, text) keys and their [uses, last day, ref] stats."""
+
+    def __init__(self):
+        self.keys = []
+        self.stats = {}
+        self.built = time.monotonic()
+
+    def add(self, kind, text, day, uses=1, ref=None):
+        stat = self.stats.get((kind, text))
+        if stat is None:
+            self.stats[(kind, text)] = [uses, day, ref]
+            insort(self.keys, (text.casefold(), kind, text))
+        else:
+            stat[0] += uses
+            stat[1] = max(stat[1], day)
+            if ref is not None:
+                stat[2] = ref
+
+    def lookup(self, prefix, kinds, limit, today):
+        folded = prefix.casefold()
+        merged = {}
+        for i in range(bisect_left(self.keys, (folded,)), len(self.keys)):
+            key, kind, text = self.keys[i]
+            if not key.startswith(folded):
+                break
+            if kind not in kinds:
+                continue
+            uses, day, ref = self.stats[(kind, text)]
+            score = uses * 0.5 ** (max(0, today - day) / _HALF_LIFE_DAYS)
+            item = merged.get(text)
+            if item is None:
+                merged[text] = item = {"text": text, "kinds": [], "uses": 0, "last": day, "score": 0.0}
+            item["kinds"].append(kind)
+            item["uses"] += uses
+            item["last"] = max(item["last"], day)
+            item["score"] += score
+            if ref is not None:
+                item["template_id"] = ref
+        return heapq.nlargest(limit, merged.values(), key=lambda item: (item["score"], item["last"]))
+
+
+class SuggestCache:
+    """LRU of per-user indexes shared by the threads of one web process."""
+
+    def __init__(self, capacity=SUGGEST_CACHE_USERS, ttl=SUGGEST_TTL):
+        self.capacity = max(1, capacity)
+        self.ttl = ttl
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        # user_id -> [builds running, changes seen]; a build that overlapped a change is not cached.
+        self._builds = {}
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _build(self, connect, user_id):
+        index = _UserIndex()
+        conn = connect()
+        for kind, sql in _SOURCES.items():
+            for row in conn.execute(sql, (user_id, _MAX_PER_KIND)):
+                if row["text"]:
+                    index.add(kind, row["text"], _day(row["last_used"]), row["uses"], row["ref"])
+        return index
+
+    def lookup(self, connect, user_id, prefix, kinds=KINDS, limit=10):
+        """Best completions of *prefix* for *user_id*; *connect* is only called to build the index."""
+        today = epoch_day(date.today())
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None and time.monotonic() - index.built < self.ttl:
+                self._indexes.move_to_end(user_id)
+                self._counters["hits"] += 1
+                return index.lookup(prefix, kinds, limit, today)
+            build = self._builds.setdefault(user_id, [0, 0])
+            build[0] += 1
+            changes = build[1]
+
+        try:
+            index = self._build(connect, user_id)
+        except Exception:
+            with self._lock:
+                self._end_build(user_id, build)
+            raise
+        with self._lock:
+            self._end_build(user_id, build)
+            self._counters["misses"] += 1
+            if changes == build[1]:
+                self._indexes[user_id] = index
+                self._indexes.move_to_end(user_id)
+                while len(self._indexes) > self.capacity:
+                    self._indexes.popitem(last=False)
+                    self._counters["evictions"] += 1
+            return index.lookup(prefix, kinds, limit, today)
+
+    def _end_build(self, user_id, build):
+        build[0] -= 1
+        if not build[0]:
+            del self._builds[user_id]
+
+    def _changed(self, user_id):
+        build = self._builds.get(user_id)
+        if build is not None:
+            build[1] += 1
+
+    def record(self, user_id, kind, names):
+        """Count new uses of (text, date string) pairs in a loaded index."""
+        with self._lock:
+            self._changed(user_id)
+            index = self._indexes.get(user_id)
+            if index is not None:
+                for text, day, *ref in names:
+                    if text:
+                        index.add(kind, text, _day(day), 1, ref[0] if ref else None)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._changed(user_id)
+            self._indexes.pop(user_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._indexes),
+                "capacity": self.capacity,
+                **self._counters,
+            }
+
+
+def _day(value):
+    try:
+        return epoch_day(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+_cache = SuggestCache()
+
+
+def suggest(connect, user_id, prefix, kinds=KINDS, limit=10):
+    """Completions of *prefix*: dicts with text, kinds, uses, last_used (and template_id)."""
+    found = _cache.lookup(connect, user_id, prefix, kinds, limit)
+    return [
+        {
+            "text": item["text"],
+            "kinds": item["kinds"],
+            "uses": item["uses"],
+            "last_used": from_epoch_day(item["last"]),
+            **({"template_id": item["template_id"]} if "template_id" in item else {}),
+        }
+        for item in found
+    ]
+
+
+def record_use(user_id, kind, names):
+    """Note new rows: *names* are (text, date) pairs, or (text, date, template id)."""
+    _cache.record(user_id, kind, names)
+
+
+def invalidate_suggestions(user_id):
+    """Drop *user_id*'s index after edits or deletes; the next lookup rebuilds it."""
+    _cache.invalidate(user_id)
+
+
+def suggest_stats():
+    return _cache.stats()
@@ -0,0 +1,169 @@
+"""
+sync — incremental sync from the per-user change log.
+
+Triggers (database.CHANGE_LOG_SOURCES) append a row to change_log for every
+insert, update and delete of events, notes, todos and timer records, so
+every write path is covered: the API routes, bulk and batch updates, trash
+restore, import, recurrence exceptions (logged as a change of the series
+parent) and manage.py jobs alike.  Moves to and from the archive are not
+changes and are not logged.
+
+changes_since() answers "what changed after this cursor" with one upsert or
+tombstone per entity, whatever number of writes it took, in pages of at
+most *limit* entities.  Its cost follows the number of changes, not the
+size of the user's data.
+
+A cursor is "<log id>.<seq>".  A client without a usable cursor (none yet,
+one from another shard or from before a restore, or one older than the
+pruned tombstones) is told to reset: reload through the regular endpoints
+and continue from the returned cursor, which is taken before that reload so
+nothing written meanwhile is lost.
+
+compact_change_log() runs as a maintenance job.  It drops entries that a
+later entry for the same entity supersedes, which never changes what any
+cursor sees, and tombstones older than SYNC_TOMBSTONE_DAYS, which makes
+cursors older than them reset.
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+from config import SYNC_TOMBSTONE_DAYS
+from database import get_db_direct, for_each_shard
+from archive import EVENT_COLUMNS, TIMER_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+_EVENT_COLS = ", ".join(EVENT_COLUMNS)
+_TIMER_COLS = ", ".join(TIMER_COLUMNS)
+_LOADERS = {
+    "event": f"""SELECT {_EVENT_COLS} FROM events WHERE user_id=? AND id IN ({{ids}})
+                 UNION ALL SELECT {_EVENT_COLS} FROM events_archive WHERE user_id=? AND id IN ({{ids}})""",
+    "note": "SELECT * FROM notes WHERE user_id=? AND id IN ({ids})",
+    "todo": "SELECT * FROM todos WHERE user_id=? AND id IN ({ids})",
+    "timer": f"""SELECT {_TIMER_COLS} FROM timer_records WHERE user_id=? AND id IN ({{ids}})
+                 UNION ALL SELECT {_TIMER_COLS} FROM timer_records_archive WHERE user_id=? AND id IN ({{ids}})""",
+}
+
+
+def log_state(conn):
+    """(log id, pruned seq, head seq) of the connection's database."""
+    row = conn.execute(
+        """SELECT log_id, pruned_seq,
+                  (SELECT seq FROM sqlite_sequence WHERE name='change_log') AS head
+           FROM change_log_state WHERE id=1"""
+    ).fetchone()
+    return row["log_id"], row["pruned_seq"], row["head"] or 0
+
+
+def parse_cursor(cursor, log_id, pruned, head):
+    """The seq encoded in *cursor*, or None when the client has to reset."""
+    prefix, _, seq = (cursor or "").partition(".")
+    if prefix != log_id or not seq.isdigit():
+        return None
+    seq = int(seq)
+    if seq < pruned or seq > head:
+        return None
+    return seq
+
+
+def _load(conn, user_id, entity, ids):
+    marks = ",".join("?" * len(ids))
+    sql = _LOADERS[entity].format(ids=marks)
+    params = (user_id, *ids) * sql.count("user_id=?")
+    return {row["id"]: dict(row) for row in conn.execute(sql, params)}
+
+
+def _exceptions(conn, user_id, parent_ids):
+    """{parent id: [{"date", "event_id"}, ...]} for recurring parents; event_id None is a cancellation."""
+    found = {}
+    if parent_ids:
+        for row in conn.execute(
+            f"""SELECT parent_id, date, event_id FROM event_exceptions
+                WHERE user_id=? AND parent_id IN ({','.join('?' * len(parent_ids))}) ORDER BY date""",
+            (user_id, *parent_ids),
+        ):
+            found.setdefault(row["parent_id"], []).append({"date": row["date"], "event_id": row["event_id"]})
+    return found
+
+
+def changes_since(conn, user_id, cursor, limit):
+    """Compacted changes of *user_id* after *cursor*.
+
+    Returns {"reset", "cursor", "more", "changes": [{"entity", "id", "op", "data"}]}
+    where op is "upsert" (data is the current row) or "delete" (no data).
+    """
+    log_id, pruned, head = log_state(conn)
+    seq = parse_cursor(cursor, log_id, pruned, head)
+    if seq is None:
+        return {"reset": True, "cursor": f"{log_id}.{head}", "more": False, "changes": []}
+
+    rows = conn.execute(
+        """SELECT entity, entity_id, op, MAX(seq) AS last FROM change_log
+           WHERE user_id=? AND seq > ? GROUP BY entity, entity_id
+           ORDER BY last LIMIT ?""",
+        (user_id, seq, limit + 1),
+    ).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+
+    wanted = {}
+    for row in rows:
+        if row["op"] == "upsert":
+            wanted.setdefault(row["entity"], []).append(row["entity_id"])
+    loaded = {entity: _load(conn, user_id, entity, ids) for entity, ids in wanted.items()}
+    events = loaded.get("event", {})
+    series = [i for i, e in events.items() if e["recur_rule"]]
+    exceptions = _exceptions(conn, user_id, series)
+    for parent_id in series:
+        events[parent_id]["exceptions"] = exceptions.get(parent_id, [])
+
+    changes = []
+    for row in rows:
+        data = loaded.get(row["entity"], {}).get(row["entity_id"])
+        change = {"entity": row["entity"], "id": row["entity_id"], "op": "upsert" if data else "delete"}
+        if data:
+            change["data"] = data
+        changes.append(change)
+    # With no more pages, move the cursor to the head so an idle user's
+    # cursor never falls behind pruned tombstones.
+    last = rows[-1]["last"] if more else max(head, rows[-1]["last"] if rows else 0)
+    return {"reset": False, "cursor": f"{log_id}.{last}", "more": more, "changes": changes}
+
+
+def _compact(conn, cutoff):
+    superseded = conn.execute(
+        """DELETE FROM change_log WHERE seq NOT IN (
+               SELECT MAX(seq) FROM change_log GROUP BY user_id, entity, entity_id)"""
+    ).rowcount
+    newest = conn.execute(
+        "SELECT MAX(seq) FROM change_log WHERE op='delete' AND changed_at < ?", (cutoff,)
+    ).fetchone()[0]
+    pruned = 0
+    if newest is not None:
+        pruned = conn.execute(
+            "DELETE FROM change_log WHERE op='delete' AND seq <= ?", (newest,)
+        ).rowcount
+        conn.execute(
+            "UPDATE change_log_state SET pruned_seq=MAX(pruned_seq, ?) WHERE id=1", (newest,)
+        )
+    return superseded + pruned
+
+
+def compact_change_log(days=SYNC_TOMBSTONE_DAYS):
+    """Drop superseded change-log entries and tombstones older than *days*."""
+    cutoff = (datetime.now() - timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
+    conn = get_db_direct()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        removed = _compact(conn, cutoff)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    removed += sum(for_each_shard(lambda c: _compact(c, cutoff)))
+    if removed:
+        logger.info("变更日志压缩完成，删除 %d 条记录", removed)
+    return removed
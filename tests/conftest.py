@@ -0,0 +1,74 @@
+import itertools
+import logging
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config reads the environment once, on first import.
+_TMP = tempfile.mkdtemp(prefix="planner-tests-")
+os.environ["QUERY_BUDGET_MODE"] = "raise"
+os.environ["STREAM_PORT"] = "0"
+os.environ["DB_SHARD_DIR"] = os.path.join(_TMP, "shards")
+os.environ["METRICS_DIR"] = os.path.join(_TMP, "metrics")
+
+_user_ids = itertools.count(1)
+
+
+@pytest.fixture(scope="session")
+def app():
+    import config
+    import database
+    config.DB_PATH = database.DB_PATH = os.path.join(_TMP, "planner.db")
+    database.BACKUP_DIR = os.path.join(_TMP, "backups")
+
+    import app as app_module
+    app_module.app.config["TESTING"] = True
+    if hasattr(app_module, "limiter"):
+        app_module.limiter.enabled = False
+    logging.disable(logging.WARNING)
+    yield app_module.app
+    logging.disable(logging.NOTSET)
+
+
+@pytest.fixture()
+def client(app):
+    """A test client logged in as a freshly registered user."""
+    client = app.test_client()
+    client.environ_base["HTTP_ORIGIN"] = "http://localhost"
+    n = next(_user_ids)
+    resp = client.post("/api/auth/register", json={
+        "email": f"user{n}@example.com", "username": f"user{n}", "password": "abcd1234",
+    })
+    assert resp.status_code == 201, resp.get_json()
+    return client
+
+
+@pytest.fixture()
+def add_event(client):
+    """Create an event through the API and return it."""
+    def add(title="会议", date="2026-10-12", start_time="09:00", end_time="10:00", **fields):
+        resp = client.post("/api/events", json={
+            "title": title, "date": date, "start_time": start_time, "end_time": end_time, **fields,
+        })
+        assert resp.status_code == 201, resp.get_json()
+        body = resp.get_json()
+        return body.get("event", body)
+    return add
+
+
+@pytest.fixture()
+def db(app):
+    """A connection to the test database (sharding is off in tests)."""
+    import database
+    conn = database.get_db_direct()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture()
+def user_id(client):
+    return client.get("/api/user/profile").get_json()["user"]["id"]
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+GENERATED = {"day_num", "start_min", "end_min"}
+
+
+def test_bulk_delete_returns_public_rows(client, add_event):
+    event = add_event()
+    resp = client.post("/api/events/bulk", json={"delete": [event["id"]]})
+    assert resp.status_code == 200
+    deleted = resp.get_json()["deleted"]
+    assert [e["id"] for e in deleted] == [event["id"]]
+    assert not GENERATED & set(deleted[0])
+
+
+def _day(client):
+    return sorted((e["title"], e["start_time"])
+                  for e in client.get("/api/events?start=2026-10-12&end=2026-10-12").get_json())
+
+
+def test_bulk_validates_everything_before_writing(client, add_event):
+    keep = add_event(title="保留")
+    resp = client.post("/api/events/bulk", json={
+        "create": [{"title": "新", "date": "2026-10-12", "start_time": "11:00", "end_time": "12:00"}],
+        "update": [{"id": keep["id"], "title": "改"}, {"id": keep["id"] + 1000, "title": "x"}],
+        "delete": [keep["id"]],
+    })
+    assert resp.status_code == 400  # the same event updated and deleted
+    resp = client.post("/api/events/bulk", json={
+        "create": [
+            {"title": "新", "date": "2026-10-12", "start_time": "11:00", "end_time": "12:00"},
+            {"title": "坏", "date": "2026-10-12", "start_time": "14:00", "end_time": "13:00"},
+        ],
+        "update": [{"id": keep["id"], "title": "改"}],
+    })
+    assert resp.status_code == 400
+    assert resp.get_json()["error"].startswith("create[1]")
+    assert _day(client) == [("保留", "09:00")]
+
+
+def test_bulk_rolls_back_when_a_write_fails(client, add_event, monkeypatch):
+    import routes.events
+
+    keep = add_event(title="保留")
+    gone = add_event(title="删除", start_time="15:00", end_time="16:00")
+
+    def fail(conn, user_id, ids):
+        raise sqlite3.IntegrityError("boom")
+    monkeypatch.setattr(routes.events, "delete_events", fail)
+    with pytest.raises(sqlite3.IntegrityError):
+        client.post("/api/events/bulk", json={
+            "create": [{"title": "新", "date": "2026-10-12", "start_time": "11:00", "end_time": "12:00"}],
+            "update": [{"id": keep["id"], "start_time": "08:00", "end_time": "09:00"}],
+            "delete": [gone["id"]],
+        })
+    assert _day(client) == [("保留", "09:00"), ("删除", "15:00")]
+
+
+def test_bulk_applies_all_operations(client, add_event):
+    keep = add_event(title="保留")
+    gone = add_event(title="删除", start_time="15:00", end_time="16:00")
+    resp = client.post("/api/events/bulk", json={
+        "create": [{"title": "新", "date": "2026-10-12", "start_time": "11:00", "end_time": "12:00"}],
+        "update": [{"id": keep["id"], "start_time": "08:00", "end_time": "09:00"}],
+        "delete": [gone["id"]],
+    })
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert [len(body[k]) for k in ("created", "updated", "deleted")] == [1, 1, 1]
+    assert _day(client) == [("保留", "08:00"), ("新", "11:00")]
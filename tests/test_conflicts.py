@@ -0,0 +1,44 @@
+from intervals import overlap_groups
+
+
+def _ev(i, start, end):
+    return {"id": i, "title": str(i), "date": "2026-10-12", "start_time": start, "end_time": end}
+
+
+def test_overlap_groups_assign_lowest_free_lane():
+    groups = overlap_groups([
+        _ev(1, "09:00", "10:00"), _ev(2, "09:30", "11:00"), _ev(3, "10:00", "10:30"),
+        _ev(4, "11:00", "12:00"),  # touches the group's end: not an overlap
+    ])
+    assert len(groups) == 1
+    group = groups[0]
+    assert (group["start_time"], group["end_time"], group["lanes"]) == ("09:00", "11:00", 2)
+    assert {e["id"]: e["lane"] for e in group["events"]} == {1: 0, 2: 1, 3: 0}
+
+
+def test_conflicts_endpoint_follows_writes(client, add_event):
+    add_event(title="A", start_time="09:00", end_time="10:00")
+    add_event(title="B", start_time="12:00", end_time="13:00", col_type="actual")
+    url = "/api/events/conflicts?start=2026-10-12&end=2026-10-12"
+    assert client.get(url).get_json() == []
+
+    resp = client.post("/api/events?conflicts=1", json={
+        "title": "C", "date": "2026-10-12", "start_time": "09:30", "end_time": "10:30",
+    })
+    assert [e["title"] for g in resp.get_json()["conflicts"] for e in g["events"]] == ["A", "C"]
+    assert [g["lanes"] for g in client.get(url).get_json()] == [2]
+
+
+def test_series_occurrence_writes_report_conflicts_within_budget(client, add_event):
+    series = add_event(title="晨跑", start_time="07:00", end_time="08:00", recur_rule="daily")
+    add_event(title="早餐", start_time="07:30", end_time="08:00")
+    resp = client.put(f"/api/events/{series['id']}/series?conflicts=1", json={
+        "scope": "this", "title": "晨跑", "date": "2026-10-12", "start_time": "07:15", "end_time": "08:00",
+    })
+    assert resp.status_code == 200
+    assert len(resp.get_json()["conflicts"]) == 1
+
+    other = add_event(title="夜跑", start_time="20:00", end_time="21:00", recur_rule="daily")
+    resp = client.delete(f"/api/events/{other['id']}/series?scope=this&conflicts=1")
+    assert resp.status_code == 200
+    assert len(resp.get_json()["conflicts"]) == 1
@@ -0,0 +1,45 @@
+EVENTS = "/api/events?start=2026-10-12&end=2026-10-12"
+NOTES = "/api/notes?date=2026-10-12"
+
+
+def _revalidate(client, url, etag):
+    return client.get(url, headers={"If-None-Match": etag})
+
+
+def test_etag_304_until_a_write(client, add_event):
+    add_event()
+    first = client.get(EVENTS)
+    etag = first.headers["ETag"]
+    assert first.status_code == 200
+    assert "no-cache" in first.headers["Cache-Control"]
+
+    cached = _revalidate(client, EVENTS, etag)
+    assert cached.status_code == 304
+    assert cached.data == b""
+
+    add_event(title="新", start_time="11:00", end_time="12:00")
+    fresh = _revalidate(client, EVENTS, etag)
+    assert fresh.status_code == 200
+    assert fresh.headers["ETag"] != etag
+    assert len(fresh.get_json()) == 2
+
+
+def test_etag_tracks_only_the_data_it_shows(client, add_event):
+    add_event()
+    events_tag = client.get(EVENTS).headers["ETag"]
+    notes_tag = client.get(NOTES).headers["ETag"]
+    assert client.get("/api/events?start=2026-10-13&end=2026-10-13").headers["ETag"] != events_tag
+
+    assert client.post("/api/notes", json={"date": "2026-10-12", "content": "笔记"}).status_code == 201
+    assert _revalidate(client, EVENTS, events_tag).status_code == 304
+    assert _revalidate(client, NOTES, notes_tag).status_code == 200
+
+
+def test_etags_differ_between_users(app, client):
+    other = app.test_client()
+    other.environ_base["HTTP_ORIGIN"] = "http://localhost"
+    assert other.post("/api/auth/register", json={
+        "email": "etag-other@example.com", "username": "etag", "password": "abcd1234",
+    }).status_code == 201
+    etag = client.get(EVENTS).headers["ETag"]
+    assert _revalidate(other, EVENTS, etag).status_code == 200
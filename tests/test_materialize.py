@@ -0,0 +1,54 @@
+from recurrence import plan_instances, store_instances
+
+SERIES = {"title": "晨跑", "date": "2026-10-12", "start_time": "07:00", "end_time": "07:30",
+          "recur_rule": "daily"}
+
+
+def _children(db, parent_id):
+    return [r[0] for r in db.execute(
+        "SELECT date FROM events WHERE recur_parent_id=? ORDER BY date", (parent_id,))]
+
+
+def _materialize(db, user_id, start, end):
+    rows, horizons = plan_instances(db, user_id, start, end)
+    created = store_instances(db, rows, horizons)
+    db.commit()
+    return created
+
+
+def test_materializes_once_up_to_the_horizon(add_event, user_id, db):
+    parent = add_event(**SERIES)
+    assert _materialize(db, user_id, "2026-10-12", "2026-10-15") == 3
+    assert _children(db, parent["id"]) == ["2026-10-13", "2026-10-14", "2026-10-15"]
+    # A covered range is answered by the horizon without planning anything.
+    assert plan_instances(db, user_id, "2026-10-12", "2026-10-15") == ([], [])
+    assert _materialize(db, user_id, "2026-10-12", "2026-10-17") == 2
+
+
+def test_unique_index_absorbs_concurrent_runs(add_event, user_id, db):
+    parent = add_event(**SERIES)
+    first = plan_instances(db, user_id, "2026-10-12", "2026-10-14")
+    second = plan_instances(db, user_id, "2026-10-12", "2026-10-14")  # planned before either stored
+    assert store_instances(db, *first) == 2
+    assert store_instances(db, *second) == 0
+    db.commit()
+    assert _children(db, parent["id"]) == ["2026-10-13", "2026-10-14"]
+
+
+def test_exceptions_are_not_refilled(client, add_event, user_id, db):
+    parent = add_event(**SERIES)
+    assert client.delete(f"/api/events/r{parent['id']}-20261013").status_code == 200
+    _materialize(db, user_id, "2026-10-12", "2026-10-14")
+    assert _children(db, parent["id"]) == ["2026-10-14"]
+
+
+def test_range_beyond_a_gap_keeps_the_horizon(add_event, user_id, db):
+    parent = add_event(**SERIES)
+    _materialize(db, user_id, "2026-10-12", "2026-10-13")
+    _materialize(db, user_id, "2026-10-20", "2026-10-21")
+    through = db.execute("SELECT through FROM recurrence_horizons WHERE parent_id=?",
+                         (parent["id"],)).fetchone()[0]
+    assert through == "2026-10-13"
+    # The gap is filled (and the horizon extended) by the next contiguous range.
+    _materialize(db, user_id, "2026-10-12", "2026-10-21")
+    assert len(_children(db, parent["id"])) == 9
@@ -0,0 +1,2 @@
+def test_metrics_endpoint_is_off_by_default(app):
+    assert app.test_client().get("/metrics").status_code == 404
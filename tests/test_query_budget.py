@@ -0,0 +1,47 @@
+import pytest
+
+from db_trace import QueryBudgetExceeded, expect_queries
+
+ANALYTICS = "/api/analytics?start=2026-10-01&end=2026-10-31"
+
+
+def _add_data(client):
+    for start, end in (("09:00", "10:00"), ("14:00", "15:30")):
+        resp = client.post("/api/events", json={
+            "title": "会议", "date": "2026-10-12", "start_time": start, "end_time": end, "col_type": "actual",
+        })
+        assert resp.status_code == 201
+    resp = client.post("/api/timer/records", json={
+        "task_name": "专注", "date": "2026-10-12", "duration_minutes": 25,
+        "actual_seconds": 1500, "completed": True,
+    })
+    assert resp.status_code == 201
+
+
+@pytest.mark.parametrize("detail, budget", [("1", 9), ("0", 6)])
+def test_analytics_within_budget(client, detail, budget):
+    _add_data(client)
+    with expect_queries(budget) as log:
+        resp = client.get(f"{ANALYTICS}&detail={detail}")
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert body["summary"]["events"] == 2
+    assert body["summary"]["event_minutes"] == 150
+    if detail == "1":
+        assert len(body["events"]) == 2
+        assert "day_num" not in body["events"][0]
+    assert log.count == budget
+
+
+def test_expect_queries_fails_over_budget(client):
+    with pytest.raises(QueryBudgetExceeded):
+        with expect_queries(3):
+            client.get(ANALYTICS)
+
+
+def test_view_over_budget_raises(app, client, monkeypatch):
+    view = app.view_functions["stats.get_analytics"]
+    monkeypatch.setattr(view, "query_budget", 2)
+    with pytest.raises(QueryBudgetExceeded):
+        client.get(ANALYTICS)
+
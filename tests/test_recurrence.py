@@ -0,0 +1,52 @@
+SERIES = {"title": "晨跑", "date": "2026-10-12", "start_time": "07:00", "end_time": "07:30",
+          "recur_rule": "daily"}
+# What the editor sends for one occurrence: the whole event, without a rule.
+OCCURRENCE = {k: v for k, v in SERIES.items() if k != "recur_rule"}
+
+
+def _day(client, date):
+    resp = client.get(f"/api/events?start={date}&end={date}")
+    assert resp.status_code == 200
+    return resp.get_json()
+
+
+def _exceptions(db, parent_id):
+    return {r["date"]: r["event_id"] for r in db.execute(
+        "SELECT date, event_id FROM event_exceptions WHERE parent_id=?", (parent_id,))}
+
+
+def test_occurrences_are_expanded_not_stored(client, add_event, db):
+    parent = add_event(**SERIES)
+    [occurrence] = _day(client, "2026-10-14")
+    assert occurrence["id"] == f"r{parent['id']}-20261014"
+    assert occurrence["virtual"] is True
+    assert occurrence["start_time"] == "07:00"
+    stored = db.execute("SELECT COUNT(*) FROM events WHERE recur_parent_id=?", (parent["id"],))
+    assert stored.fetchone()[0] == 0
+
+
+def test_editing_one_occurrence_stores_an_exception(client, add_event, db):
+    parent = add_event(**SERIES)
+    ref = f"r{parent['id']}-20261014"
+    resp = client.put(f"/api/events/{ref}", json={**OCCURRENCE, "date": "2026-10-14", "title": "夜跑",
+                                                  "start_time": "20:00", "end_time": "20:30"})
+    assert resp.status_code == 200
+
+    [edited] = _day(client, "2026-10-14")
+    assert isinstance(edited["id"], int)
+    assert (edited["title"], edited["start_time"]) == ("夜跑", "20:00")
+    assert _exceptions(db, parent["id"]) == {"2026-10-14": edited["id"]}
+    # Neighbouring days still come from the series.
+    assert [e["title"] for e in _day(client, "2026-10-15")] == ["晨跑"]
+
+
+def test_deleting_one_occurrence_cancels_that_date(client, add_event, db):
+    parent = add_event(**SERIES)
+    resp = client.delete(f"/api/events/r{parent['id']}-20261014")
+    assert resp.status_code == 200
+    assert _day(client, "2026-10-14") == []
+    assert _exceptions(db, parent["id"]) == {"2026-10-14": None}
+    assert len(_day(client, "2026-10-13")) == 1
+    trash = client.get("/api/events/trash").get_json()
+    assert [t["date"] for t in trash] == ["2026-10-14"]
+
@@ -0,0 +1,38 @@
+import re
+import subprocess
+import sys
+
+from regex_sandbox import RegexPool
+import regex_worker
+
+ROWS = [{"title": "晨跑"}, {"title": "weekly review"}, {"title": "review notes"}]
+
+
+def test_search_matches_in_worker():
+    pool = RegexPool(size=1)
+    try:
+        matched, error = pool.search(1, re.compile(r"^rev"), ROWS, ["title"], 10)
+        assert error is None
+        assert [r["title"] for r in matched] == ["review notes"]
+        assert pool.stats()["started"] == 1
+    finally:
+        pool.close()
+
+
+def test_catastrophic_pattern_is_killed():
+    pool = RegexPool(size=1)
+    try:
+        rows = [{"title": "a" * 40 + "!"}]
+        matched, error = pool.search(1, re.compile(r"^(a+)+$"), rows, ["title"], 10, timeout=0.5)
+        assert matched is None and error
+        assert pool.stats()["killed"] == 1
+    finally:
+        pool.close()
+
+
+def test_worker_does_not_import_the_application():
+    code = ("import sys; sys.argv = ['x']; import runpy; "
+            f"runpy.run_path({regex_worker.__file__!r}); "
+            "print(sorted(m for m in ('config', 'metrics', 'flask') if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "[]"
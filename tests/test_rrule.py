@@ -0,0 +1,60 @@
+from datetime import date
+
+import pytest
+
+from rrule import compile_rule, parse_rule, split_rule
+
+
+def _between(rule, dtstart, start, end):
+    return [d.isoformat() for d in compile_rule(rule, dtstart).between(
+        date.fromisoformat(start), date.fromisoformat(end))]
+
+
+def test_monthly_keyword_clamps_to_month_end():
+    assert _between("monthly", "2024-01-31", "2024-01-01", "2024-06-30") == [
+        "2024-02-29", "2024-03-31", "2024-04-30", "2024-05-31", "2024-06-30",
+    ]
+
+
+def test_bymonthday_without_skip_leaves_out_short_months():
+    assert _between("FREQ=MONTHLY;BYMONTHDAY=31", "2024-01-31", "2024-01-01", "2024-08-31") == [
+        "2024-03-31", "2024-05-31", "2024-07-31", "2024-08-31",
+    ]
+
+
+def test_negative_bymonthday_counts_from_month_end():
+    assert _between("FREQ=MONTHLY;BYMONTHDAY=-1", "2023-12-31", "2024-01-01", "2024-04-30") == [
+        "2024-01-31", "2024-02-29", "2024-03-31", "2024-04-30",
+    ]
+
+
+def test_last_friday_with_count_includes_dtstart():
+    # dtstart is the first of the 3 occurrences.
+    assert _between("RRULE:FREQ=MONTHLY;BYDAY=-1FR;COUNT=3", "2024-05-31", "2024-01-01", "2024-12-31") == [
+        "2024-06-28", "2024-07-26",
+    ]
+
+
+def test_weekly_interval_byday_until_and_exdate():
+    rule = "FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,WE;UNTIL=20240131\nEXDATE:20240117"
+    assert _between(rule, "2024-01-01", "2024-01-01", "2024-12-31") == [
+        "2024-01-03", "2024-01-15", "2024-01-29", "2024-01-31",
+    ]
+
+
+def test_range_far_from_dtstart():
+    assert _between("FREQ=DAILY;INTERVAL=3", "2000-01-01", "2100-01-01", "2100-01-07") == [
+        "2100-01-01", "2100-01-04", "2100-01-07",  # 36525 days on: a multiple of 3
+    ]
+
+
+def test_split_rule_divides_count():
+    head, tail = split_rule("FREQ=DAILY;COUNT=10", "2024-01-01", date(2024, 1, 4))
+    assert _between(head, "2024-01-01", "2024-01-01", "2024-12-31") == ["2024-01-02", "2024-01-03"]
+    assert len(_between(tail, "2024-01-04", "2024-01-01", "2024-12-31")) == 6  # 7 with dtstart
+
+
+@pytest.mark.parametrize("rule", ["FREQ=HOURLY", "FREQ=DAILY;COUNT=0", "FREQ=WEEKLY;BYDAY=XX", "bogus"])
+def test_invalid_rules_are_rejected(rule):
+    with pytest.raises(ValueError):
+        parse_rule(rule)
@@ -0,0 +1,26 @@
+import pytest
+
+GENERATED = {"day_num", "start_min", "end_min"}
+
+
+@pytest.fixture()
+def events(client):
+    for title in ("周会", "weekly review"):
+        resp = client.post("/api/events", json={
+            "title": title, "date": "2026-10-12", "start_time": "09:00", "end_time": "10:00",
+        })
+        assert resp.status_code == 201
+    return client
+
+
+@pytest.mark.parametrize("q, title", [
+    ("we", "weekly review"),      # shorter than a trigram: LIKE fallback
+    ("周会", "周会"),
+    ("weekly", "weekly review"),  # full-text index
+])
+def test_search_hides_generated_columns(events, q, title):
+    resp = events.get(f"/api/events/search?q={q}")
+    assert resp.status_code == 200
+    results = resp.get_json()
+    assert [r["title"] for r in results] == [title]
+    assert not GENERATED & set(results[0])
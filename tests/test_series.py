@@ -0,0 +1,64 @@
+SERIES = {"title": "晨跑", "date": "2026-10-12", "start_time": "07:00", "end_time": "07:30",
+          "recur_rule": "daily"}
+OCCURRENCE = {k: v for k, v in SERIES.items() if k != "recur_rule"}
+
+
+def _titles(client, start, end):
+    resp = client.get(f"/api/events?start={start}&end={end}")
+    assert resp.status_code == 200
+    return [(e["date"], e["title"], e["start_time"]) for e in resp.get_json()]
+
+
+def test_following_split_starts_a_new_series(client, add_event, db):
+    parent = add_event(**SERIES)
+    resp = client.put(f"/api/events/r{parent['id']}-20261015/series",
+                      json={"scope": "following", "title": "长跑"})
+    assert resp.status_code == 200
+    tail = resp.get_json()["event"]
+    assert tail["id"] != parent["id"]
+    assert (tail["date"], tail["recur_rule"]) == ("2026-10-15", "daily")
+
+    head_rule = db.execute("SELECT recur_rule FROM events WHERE id=?", (parent["id"],)).fetchone()[0]
+    assert "UNTIL=20261014" in head_rule
+    assert [t[1] for t in _titles(client, "2026-10-12", "2026-10-17")] == ["晨跑"] * 3 + ["长跑"] * 3
+
+
+def test_following_split_carries_later_edits(client, add_event, db):
+    parent = add_event(**SERIES)
+    ref = f"r{parent['id']}-20261017"
+    assert client.put(f"/api/events/{ref}", json={
+        **OCCURRENCE, "date": "2026-10-17", "start_time": "06:00", "end_time": "06:30",
+    }).status_code == 200
+
+    resp = client.put(f"/api/events/r{parent['id']}-20261015/series",
+                      json={"scope": "following", "title": "长跑"})
+    tail_id = resp.get_json()["event"]["id"]
+    # The edited occurrence keeps its own time, takes the new title and follows the new series.
+    assert _titles(client, "2026-10-17", "2026-10-17") == [("2026-10-17", "长跑", "06:00")]
+    parents = {r[0] for r in db.execute(
+        "SELECT parent_id FROM event_exceptions WHERE date='2026-10-17' AND parent_id IN (?, ?)",
+        (parent["id"], tail_id))}
+    assert parents == {tail_id}
+
+
+def test_following_split_divides_count(client, add_event):
+    add_event(**{**SERIES, "recur_rule": "FREQ=DAILY;COUNT=5"})
+    first = client.get("/api/events?start=2026-10-12&end=2026-10-12").get_json()[0]
+    resp = client.put(f"/api/events/r{first['id']}-20261014/series",
+                      json={"scope": "following", "title": "长跑"})
+    assert resp.status_code == 200
+    assert [t[1] for t in _titles(client, "2026-10-12", "2026-10-31")] == ["晨跑"] * 2 + ["长跑"] * 3
+
+
+def test_delete_following_ends_the_series(client, add_event):
+    parent = add_event(**SERIES)
+    resp = client.delete(f"/api/events/r{parent['id']}-20261014/series?scope=following")
+    assert resp.status_code == 200
+    assert [t[0] for t in _titles(client, "2026-10-12", "2026-10-20")] == ["2026-10-12", "2026-10-13"]
+
+
+def test_delete_this_on_the_first_occurrence_keeps_the_rest(client, add_event):
+    parent = add_event(**SERIES)
+    resp = client.delete(f"/api/events/{parent['id']}/series?scope=this")
+    assert resp.status_code == 200
+    assert [t[0] for t in _titles(client, "2026-10-12", "2026-10-14")] == ["2026-10-13", "2026-10-14"]
@@ -0,0 +1,72 @@
+"""Delta sync: cursor advance, tombstones and resets."""
+
+import sync
+
+
+def _sync(client, cursor=None, **params):
+    if cursor is not None:
+        params["cursor"] = cursor
+    res = client.get("/api/sync", query_string=params)
+    assert res.status_code == 200
+    return res.get_json()
+
+
+def test_no_cursor_resets(client):
+    body = _sync(client)
+    assert body["reset"] is True
+    assert body["changes"] == []
+    assert "." in body["cursor"]
+
+
+def test_cursor_advances_with_upserts(client, add_event):
+    start = _sync(client)["cursor"]
+    event = add_event(title="同步")
+
+    body = _sync(client, start)
+    assert body["reset"] is False
+    assert body["cursor"] != start
+    assert [(c["entity"], c["id"], c["op"]) for c in body["changes"]] == [("event", event["id"], "upsert")]
+    data = body["changes"][0]["data"]
+    assert data["title"] == "同步"
+    assert not {"day_num", "start_min", "end_min"} & data.keys()
+
+    assert _sync(client, body["cursor"])["changes"] == []
+
+
+def test_delete_becomes_tombstone(client, add_event):
+    event = add_event()
+    start = _sync(client)["cursor"]
+    client.put(f"/api/events/{event['id']}", json={**event, "title": "改过"})
+    assert client.delete(f"/api/events/{event['id']}").status_code == 200
+
+    changes = _sync(client, start)["changes"]
+    assert changes == [{"entity": "event", "id": event["id"], "op": "delete"}]
+
+
+def test_paging(client, add_event):
+    start = _sync(client)["cursor"]
+    ids = [add_event(title=f"e{i}")["id"] for i in range(3)]
+
+    first = _sync(client, start, limit=2)
+    assert first["more"] is True
+    second = _sync(client, first["cursor"], limit=2)
+    assert second["more"] is False
+    assert [c["id"] for c in first["changes"] + second["changes"]] == ids
+
+
+def test_bad_cursor_resets(client):
+    cursor = _sync(client)["cursor"]
+    log_id, _, head = cursor.partition(".")
+    for bad in ("garbage", f"other.{head}", f"{log_id}.{int(head) + 1000}"):
+        assert _sync(client, bad)["reset"] is True
+
+
+def test_pruned_tombstones_reset_old_cursors(app, client, add_event):
+    event = add_event()
+    start = _sync(client)["cursor"]
+    client.delete(f"/api/events/{event['id']}")
+
+    with app.app_context():
+        sync.compact_change_log(days=-1)
+
+    assert _sync(client, start)["reset"] is True